@@ -0,0 +1,144 @@
+# access.py
+
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from functools import wraps
+from itertools import chain
+from flask import flash, g, redirect, session, url_for
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+from models import db, User, Kantin
+
+# Identitas user yang login: dibaca sekali per request dari cache, lalu dipakai semua
+# pemeriksaan akses di request itu. Kantin hanya memuat kolom yang tidak berubah
+# oleh pesanan (id, nama, lokasi); kolom yang sering berubah seperti last_order_at
+# dibaca langsung oleh route yang membutuhkannya.
+Identity = namedtuple('Identity', 'user_id username role kantin')
+KantinRef = namedtuple('KantinRef', 'id name location')
+
+
+def _load_identity(user_id):
+    # User dan kantin yang dikelolanya dalam satu query
+    row = db.session.execute(
+        select(User.id, User.username, User.role, Kantin.id.label('kantin_id'),
+               Kantin.name.label('kantin_name'), Kantin.location.label('kantin_location'))
+        .outerjoin(Kantin, Kantin.user_id == User.id)
+        .where(User.id == user_id).order_by(Kantin.id).limit(1)
+    ).first()
+    if row is None:
+        return None
+    kantin = KantinRef(row.kantin_id, row.kantin_name, row.kantin_location) if row.kantin_id is not None else None
+    return Identity(row.id, row.username, row.role, kantin)
+
+
+class AccessCache:
+    """Cache identitas (role + kantin yang dikelola) per user_id di memori proses.
+
+    Perubahan User/Kantin lewat ORM membatalkan entri user terkait setelah commit
+    (lihat listener di bawah). Perubahan lewat UPDATE Core atau dari worker lain
+    baru terlihat setelah ACCESS_CACHE_TTL detik, kecuali invalidate() dipanggil.
+    """
+
+    def __init__(self, app=None):
+        self.ttl = 60
+        self.max_entries = 10000
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # user_id -> (identity atau None, waktu dimuat), urutan LRU
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config.get('ACCESS_CACHE_TTL', self.ttl)
+        self.max_entries = app.config.get('ACCESS_CACHE_MAX_ENTRIES', self.max_entries)
+        app.extensions['access_cache'] = self
+
+    def get(self, user_id):
+        """Identity untuk user_id, atau None jika user sudah tidak ada."""
+        now = time.monotonic()
+        with self._lock:
+            cached = self._entries.get(user_id)
+            if cached is not None and now - cached[1] < self.ttl:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return cached[0]
+            self.misses += 1
+        identity = _load_identity(user_id)
+        with self._lock:
+            self._entries[user_id] = (identity, now)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return identity
+
+    def invalidate(self, user_ids=None):
+        """Buang entri user_ids (iterable), atau semua entri jika None."""
+        with self._lock:
+            if user_ids is None:
+                self._entries.clear()
+                return
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+access_cache = AccessCache()
+
+
+@event.listens_for(Session, 'before_flush')
+def _track_identity_changes(session, flush_context, instances):
+    changed = session.info.setdefault('access_user_ids', set())
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, User) and obj.id is not None:
+            changed.add(obj.id)
+        elif isinstance(obj, Kantin):
+            # Pemilik lama dan baru sama-sama harus dimuat ulang
+            history = inspect(obj).attrs.user_id.history
+            changed.update(user_id for user_id in chain(history.added, history.unchanged, history.deleted)
+                           if user_id is not None)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_changed_identities(session):
+    changed = session.info.pop('access_user_ids', None)
+    if changed:
+        access_cache.invalidate(changed)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_identity_changes(session):
+    session.info.pop('access_user_ids', None)
+
+
+def current_identity():
+    """Identity user yang login di request ini, atau None. Dimuat paling banyak sekali per request."""
+    if 'identity' not in g:
+        user_id = session.get('user_id')
+        g.identity = access_cache.get(user_id) if user_id is not None else None
+    return g.identity
+
+
+def role_required(*roles, kantin=False, message='Anda tidak memiliki akses ke halaman ini.'):
+    """Dekorator route: hanya user login dengan salah satu `roles` (kosong = semua user login).
+
+    Identitas tersedia sebagai g.identity. Dengan kantin=True user juga harus terkait
+    dengan kantin, yang tersedia sebagai g.identity.kantin.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            identity = current_identity()
+            if identity is None or (roles and identity.role not in roles):
+                flash(message, 'danger')
+                return redirect(url_for('main.login'))
+            if kantin and identity.kantin is None:
+                flash('Anda belum terkait dengan kantin mana pun. Harap hubungi admin.', 'warning')
+                return redirect(url_for('main.dashboard'))
+            return view(*args, **kwargs)
+        return wrapped
+    return decorator
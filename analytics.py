@@ -0,0 +1,256 @@
+# analytics.py
+
+import threading
+import time
+from datetime import datetime
+import numpy as np
+from sqlalchemy import BigInteger, Integer, cast, extract, select
+from models import db, Kantin, Menu, Order, OrderItem, OrderArchive, OrderItemArchive, Rating
+from catalog import catalog_cache
+
+WEEKDAYS = ['Sen', 'Sel', 'Rab', 'Kam', 'Jum', 'Sab', 'Min']
+
+
+def _epoch(column):
+    # Detik sejak epoch dihitung di database, jauh lebih cepat daripada membuat objek datetime per baris
+    if db.engine.dialect.name == 'sqlite':
+        return cast(db.func.strftime('%s', column), Integer)
+    return cast(extract('epoch', column), BigInteger)
+
+
+def _fetch_matrix(stmt, width):
+    """Jalankan stmt langsung di cursor DBAPI dan kembalikan matriks float64 (baris x kolom).
+
+    Baris Row SQLAlchemy jauh lebih lambat diubah ke array daripada tuple mentah,
+    jadi untuk pemuatan massal ini lapisan hasil ORM/Core dilewati.
+    """
+    sql = str(stmt.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}))
+    cursor = db.session.connection().connection.cursor()
+    try:
+        cursor.execute(sql)
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    if not rows:
+        return np.empty((0, width), dtype=np.float64)
+    return np.array(rows, dtype=np.float64)
+
+
+def _load_items(order_model, item_model, after_order_id=0):
+    """Array item pesanan dengan id pesanan > after_order_id, satu elemen per item."""
+    orders = _fetch_matrix(
+        select(order_model.id, _epoch(order_model.order_date))
+        .where(order_model.id > after_order_id).order_by(order_model.id), 2)
+    items = _fetch_matrix(
+        select(item_model.order_id, item_model.menu_id, item_model.quantity, item_model.price)
+        .where(item_model.order_id > after_order_id), 4)
+    order_ids = orders[:, 0].astype(np.int64)
+    item_order_ids = items[:, 0].astype(np.int64)
+    # Waktu pesanan dipasangkan ke item lewat pencarian biner, tanpa JOIN di database
+    position = np.clip(np.searchsorted(order_ids, item_order_ids), 0, max(len(order_ids) - 1, 0))
+    known = order_ids[position] == item_order_ids if len(order_ids) else np.zeros(len(items), dtype=bool)
+    items = items[known]
+    return {
+        'order_id': item_order_ids[known],
+        'ts': orders[position[known], 1].astype(np.int64),
+        'menu_id': items[:, 1].astype(np.int32),
+        'quantity': items[:, 2].astype(np.int32),
+        'revenue': items[:, 2] * items[:, 3],
+    }
+
+
+def _load_menu_kantins():
+    """Array kantin_id yang diindeks dengan menu_id; -1 untuk menu yang sudah dihapus."""
+    menus = _fetch_matrix(select(Menu.id, Menu.kantin_id), 2).astype(np.int64)
+    kantin_of_menu = np.full(int(menus[:, 0].max()) + 1 if len(menus) else 1, -1, dtype=np.int32)
+    kantin_of_menu[menus[:, 0]] = menus[:, 1]
+    return kantin_of_menu
+
+
+def _kantin_ids(kantin_of_menu, menu_ids):
+    inside = menu_ids < len(kantin_of_menu)
+    return np.where(inside, kantin_of_menu[np.where(inside, menu_ids, 0)], -1).astype(np.int32)
+
+
+def _load_ratings(kantin_of_menu):
+    ratings = _fetch_matrix(select(_epoch(Rating.rating_date), Rating.menu_id, Rating.score), 3)
+    return {
+        'ts': ratings[:, 0].astype(np.int64),
+        'kantin_id': _kantin_ids(kantin_of_menu, ratings[:, 1].astype(np.int64)),
+        'score': ratings[:, 2].astype(np.int32),
+    }
+
+
+def _concat(*parts):
+    return {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+
+
+def top_menus(items, limit=10):
+    if not len(items['menu_id']):
+        return []
+    quantity = np.bincount(items['menu_id'], weights=items['quantity'])
+    revenue = np.bincount(items['menu_id'], weights=items['revenue'])
+    top = np.argsort(-quantity, kind='stable')[:limit]
+    top = top[quantity[top] > 0]
+    return [{'menu_id': int(menu_id), 'quantity': int(quantity[menu_id]), 'revenue': float(revenue[menu_id])}
+            for menu_id in top]
+
+
+def demand_heatmap(items, utc_offset_hours):
+    """Porsi terjual per (hari, jam) waktu lokal; matriks 7 x 24, Senin = baris 0."""
+    local = items['ts'] + int(utc_offset_hours * 3600)
+    hour = (local // 3600) % 24
+    weekday = (local // 86400 + 3) % 7   # 1970-01-01 adalah hari Kamis
+    cells = np.bincount(weekday * 24 + hour, weights=items['quantity'], minlength=7 * 24)
+    return cells.reshape(7, 24).astype(np.int64)
+
+
+def basket_sizes(items):
+    """Rata-rata porsi dan nilai per keranjang (pesanan x kantin) untuk setiap kantin."""
+    items = {name: values[items['kantin_id'] >= 0] for name, values in items.items()}
+    if not len(items['order_id']):
+        return []
+    # Satu keranjang = item dari satu pesanan untuk satu kantin; kunci digabung jadi satu int64
+    kantin_id = items['kantin_id'].astype(np.int64)
+    keys = items['order_id'] * (int(kantin_id.max()) + 1) + kantin_id
+    basket_keys, basket_index = np.unique(keys, return_inverse=True)
+    basket_quantity = np.bincount(basket_index, weights=items['quantity'])
+    basket_revenue = np.bincount(basket_index, weights=items['revenue'])
+    basket_kantin = basket_keys % (int(kantin_id.max()) + 1)
+
+    kantin_ids, kantin_index = np.unique(basket_kantin, return_inverse=True)
+    count = np.bincount(kantin_index)
+    quantity = np.bincount(kantin_index, weights=basket_quantity)
+    revenue = np.bincount(kantin_index, weights=basket_revenue)
+    return [{'kantin_id': int(kantin_id), 'orders': int(count[i]),
+             'avg_items': float(quantity[i] / count[i]), 'avg_revenue': float(revenue[i] / count[i])}
+            for i, kantin_id in enumerate(kantin_ids)]
+
+
+def rating_trend(ratings, now_ts, weeks=12):
+    """Jumlah dan rata-rata skor rating per minggu untuk `weeks` minggu terakhir (terlama lebih dulu)."""
+    week = (now_ts - ratings['ts']) // (7 * 86400)
+    mask = (week >= 0) & (week < weeks)
+    week = week[mask]
+    count = np.bincount(week, minlength=weeks)
+    total = np.bincount(week, weights=ratings['score'][mask], minlength=weeks)
+    trend = []
+    for weeks_ago in range(weeks - 1, -1, -1):
+        start = datetime.utcfromtimestamp(now_ts - (weeks_ago + 1) * 7 * 86400)
+        trend.append({'week_start': start.date().isoformat(), 'ratings': int(count[weeks_ago]),
+                      'avg_score': float(total[weeks_ago] / count[weeks_ago]) if count[weeks_ago] else None})
+    return trend
+
+
+class SalesAnalytics:
+    """Analitik penjualan berbasis array NumPy.
+
+    Kolom OrderItem/Order (tabel aktif dan arsip) dimuat sekali ke array, lalu
+    ditambah secara inkremental dari id pesanan terakhir yang sudah diproses.
+    Agregat dihitung dengan group-by tervektorisasi (bincount/unique) dan
+    di-cache per kantin sampai data berikutnya masuk. Setiap worker memegang
+    array-nya sendiri.
+    """
+
+    def __init__(self, app=None):
+        self.refresh_interval = 30
+        self.utc_offset_hours = 7
+        self._lock = threading.RLock()
+        self._items = None
+        self._ratings = None
+        self._last_order_id = 0
+        self._refreshed_at = 0.0
+        self._results = {}
+        self.last_refresh_seconds = 0.0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.refresh_interval = app.config.get('ANALYTICS_REFRESH_INTERVAL', self.refresh_interval)
+        self.utc_offset_hours = app.config.get('ANALYTICS_UTC_OFFSET_HOURS', self.utc_offset_hours)
+        app.extensions['analytics'] = self
+
+    def refresh(self, force=False):
+        """Muat pesanan baru sejak refresh terakhir. Return jumlah item baru."""
+        with self._lock:
+            if not force and self._items is not None and time.monotonic() - self._refreshed_at < self.refresh_interval:
+                return 0
+            started = time.perf_counter()
+            if self._items is None:
+                # Pemuatan awal mencakup arsip; pesanan baru selalu masuk ke tabel aktif
+                items = _concat(_load_items(OrderArchive, OrderItemArchive), _load_items(Order, OrderItem))
+                added = len(items['order_id'])
+            else:
+                new_items = _load_items(Order, OrderItem, self._last_order_id)
+                added = len(new_items['order_id'])
+                old_items = {name: values for name, values in self._items.items() if name != 'kantin_id'}
+                items = _concat(old_items, new_items) if added else old_items
+            if len(items['order_id']):
+                self._last_order_id = max(self._last_order_id, int(items['order_id'].max()))
+            # Pemetaan menu -> kantin dibaca ulang (kecil) lalu dipasang ke semua item sekaligus
+            kantin_of_menu = _load_menu_kantins()
+            items['kantin_id'] = _kantin_ids(kantin_of_menu, items['menu_id'])
+            self._items = items
+            # Rating bisa diubah di tempat (satu rating per user per menu), jadi dimuat ulang utuh
+            self._ratings = _load_ratings(kantin_of_menu)
+            self._results = {}
+            self._refreshed_at = time.monotonic()
+            self.last_refresh_seconds = time.perf_counter() - started
+            return added
+
+    def reset(self):
+        with self._lock:
+            self._items = None
+            self._ratings = None
+            self._last_order_id = 0
+            self._results = {}
+
+    def summary(self, kantin_id=None):
+        """Semua agregat untuk satu kantin (atau semua jika None), siap diserialisasi ke JSON."""
+        self.refresh()
+        with self._lock:
+            cached = self._results.get(kantin_id)
+            if cached is not None:
+                return cached
+            items, ratings = self._items, self._ratings
+            if kantin_id is not None:
+                items = {name: values[items['kantin_id'] == kantin_id] for name, values in items.items()}
+                ratings = {name: values[ratings['kantin_id'] == kantin_id] for name, values in ratings.items()}
+
+            top = top_menus(items)
+            names = {menu['id']: menu['name'] for menu in catalog_cache.get_many([row['menu_id'] for row in top])}
+            for row in top:
+                row['name'] = names.get(row['menu_id'], f"Menu #{row['menu_id']}")
+
+            baskets = basket_sizes(items)
+            kantin_names = dict(db.session.execute(
+                select(Kantin.id, Kantin.name).where(Kantin.id.in_([row['kantin_id'] for row in baskets]))
+            ).all())
+            for row in baskets:
+                row['kantin_name'] = kantin_names.get(row['kantin_id'], f"Kantin #{row['kantin_id']}")
+
+            heatmap = demand_heatmap(items, self.utc_offset_hours)
+            result = {
+                'generated_at': datetime.utcnow().isoformat(timespec='seconds'),
+                'kantin_id': kantin_id,
+                'last_order_id': self._last_order_id,
+                'orders': int(len(np.unique(items['order_id']))),
+                'items_sold': int(items['quantity'].sum()),
+                'revenue': float(items['revenue'].sum()),
+                'top_menus': top,
+                'heatmap': {'weekdays': WEEKDAYS, 'hours': list(range(24)), 'quantity': heatmap.tolist(),
+                            'max': int(heatmap.max()) if heatmap.size else 0},
+                'basket_size': baskets,
+                'rating_trend': rating_trend(ratings, int(time.time())),
+            }
+            self._results[kantin_id] = result
+            return result
+
+    def stats(self):
+        with self._lock:
+            return {'items': len(self._items['order_id']) if self._items is not None else 0,
+                    'last_order_id': self._last_order_id,
+                    'last_refresh_seconds': self.last_refresh_seconds}
+
+
+analytics = SalesAnalytics()
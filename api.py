@@ -0,0 +1,252 @@
+# api.py
+
+import hashlib
+import json
+from flask import Blueprint, Response, current_app, jsonify, request, session
+from sqlalchemy import bindparam, select, update
+from models import db, Menu
+from orders import InsufficientStockError
+from catalog import catalog_cache
+from cart_store import cart_store
+from reservations import reservations
+from analytics import analytics
+from access import current_identity
+import kitchen
+from database import run_with_retry
+
+# API JSON untuk operasi massal. Memakai sesi login yang sama dengan halaman web;
+# satu request dan satu transaksi untuk banyak menu sekaligus.
+bp = Blueprint('api', __name__, url_prefix='/api')
+
+MAX_BATCH_ITEMS = 500
+
+CATALOG_FIELDS = ('id', 'name', 'description', 'price', 'stock', 'available', 'image_url',
+                  'kantin_id', 'kantin_name', 'rating_count', 'rating_avg')
+
+_catalog_body = None    # (revision cache katalog, body JSON, etag)
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400, **extra):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.extra = extra
+
+
+@bp.errorhandler(ApiError)
+def handle_api_error(error):
+    return jsonify(error=error.message, **error.extra), error.status
+
+
+def _require_role(*roles):
+    identity = current_identity()
+    if identity is None:
+        raise ApiError('Anda harus login.', 401)
+    if roles and identity.role not in roles:
+        raise ApiError('Anda tidak memiliki akses.', 403)
+    return identity
+
+
+def _own_kantin_id(identity):
+    if identity.kantin is None:
+        raise ApiError('Anda belum terkait dengan kantin mana pun.', 403)
+    return identity.kantin.id
+
+
+def _batch_items():
+    payload = request.get_json(silent=True)
+    items = payload.get('items') if isinstance(payload, dict) else None
+    if not isinstance(items, list) or not items:
+        raise ApiError('Body harus JSON dengan daftar "items".')
+    if len(items) > MAX_BATCH_ITEMS:
+        raise ApiError(f'Maksimal {MAX_BATCH_ITEMS} item per request.')
+    for item in items:
+        if not isinstance(item, dict) or not _is_int(item.get('menu_id')):
+            raise ApiError('Setiap item harus punya menu_id berupa angka.')
+    return items
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+@bp.route('/menus')
+def catalog():
+    """Seluruh katalog menu. Mendukung If-None-Match; etag dihitung dari isi katalog
+    sehingga sama di semua worker, dan body hanya diserialisasi ulang saat cache berubah."""
+    global _catalog_body
+    # Revisi dibaca sebelum all_menus(): invalidasi yang terjadi di antaranya membuat
+    # body ini bertanda revisi lama, jadi diserialisasi ulang pada request berikutnya
+    revision = catalog_cache.revision
+    menus = catalog_cache.all_menus()
+    cached = _catalog_body
+    if cached is None or cached[0] != revision:
+        body = json.dumps({'menus': [{field: menu[field] for field in CATALOG_FIELDS} for menu in menus]})
+        cached = _catalog_body = (revision, body, hashlib.sha1(body.encode()).hexdigest())
+
+    response = Response(cached[1], mimetype='application/json')
+    response.set_etag(cached[2])
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+def _apply_stock_changes(stock_sets, stock_deltas, menu_ids):
+    menu_table = Menu.__table__
+    if stock_sets:
+        db.session.execute(
+            update(menu_table).where(menu_table.c.id == bindparam('b_id')).values(stock=bindparam('b_stock')),
+            stock_sets
+        )
+    if stock_deltas:
+        # Pengurangan dijaga di WHERE agar stok tidak pernah negatif
+        new_stock = db.func.coalesce(menu_table.c.stock, 0) + bindparam('b_delta')
+        result = db.session.execute(
+            update(menu_table).where(menu_table.c.id == bindparam('b_id'), new_stock >= 0).values(stock=new_stock),
+            stock_deltas
+        )
+        if result.rowcount != len(stock_deltas):
+            db.session.rollback()
+            rows = db.session.execute(
+                select(Menu.id, Menu.name, Menu.stock).where(Menu.id.in_([d['b_id'] for d in stock_deltas]))
+            ).all()
+            deltas = {d['b_id']: d['b_delta'] for d in stock_deltas}
+            raise InsufficientStockError([
+                {'menu_id': menu_id, 'name': name, 'requested': -deltas[menu_id], 'available': stock or 0}
+                for menu_id, name, stock in rows if (stock or 0) + deltas[menu_id] < 0
+            ])
+    stocks = dict(db.session.execute(select(Menu.id, Menu.stock).where(Menu.id.in_(menu_ids))).all())
+    db.session.commit()
+    return stocks
+
+
+@bp.route('/stock', methods=['POST'])
+def bulk_stock():
+    """Ubah stok banyak menu dalam satu transaksi.
+
+    Body: {"items": [{"menu_id": 1, "stock": 20}, {"menu_id": 2, "delta": -3}, ...]}
+    "stock" menetapkan nilai baru, "delta" menambah/mengurangi. Semua berhasil atau tidak sama sekali.
+    """
+    identity = _require_role('admin', 'kantin')
+    items = _batch_items()
+
+    stock_sets, stock_deltas, menu_ids = [], [], []
+    for item in items:
+        menu_id = item['menu_id']
+        if menu_id in menu_ids:
+            raise ApiError(f'menu_id {menu_id} muncul lebih dari sekali.')
+        menu_ids.append(menu_id)
+        if _is_int(item.get('stock')) and 'delta' not in item:
+            if item['stock'] < 0:
+                raise ApiError('Stok tidak boleh kurang dari 0.', menu_id=menu_id)
+            stock_sets.append({'b_id': menu_id, 'b_stock': item['stock']})
+        elif _is_int(item.get('delta')) and 'stock' not in item:
+            stock_deltas.append({'b_id': menu_id, 'b_delta': item['delta']})
+        else:
+            raise ApiError('Setiap item harus punya salah satu dari "stock" atau "delta" berupa angka.', menu_id=menu_id)
+
+    # Validasi kantin pemilik sama seperti manage_stock: kantin hanya boleh mengubah menunya sendiri
+    owners = dict(db.session.execute(select(Menu.id, Menu.kantin_id).where(Menu.id.in_(menu_ids))).all())
+    missing = [menu_id for menu_id in menu_ids if menu_id not in owners]
+    if missing:
+        raise ApiError('Menu tidak ditemukan.', 404, menu_ids=missing)
+    if identity.role == 'kantin':
+        kantin_id = _own_kantin_id(identity)
+        forbidden = [menu_id for menu_id in menu_ids if owners[menu_id] != kantin_id]
+        if forbidden:
+            raise ApiError('Anda tidak punya izin mengubah stok menu ini.', 403, menu_ids=forbidden)
+
+    try:
+        stocks = run_with_retry(lambda: _apply_stock_changes(stock_sets, stock_deltas, menu_ids),
+                                attempts=current_app.config['DB_LOCK_RETRIES'])
+    except InsufficientStockError as e:
+        raise ApiError('Stok tidak mencukupi untuk pengurangan.', 409, lines=e.lines)
+
+    catalog_cache.patch_stock(stocks, absolute=True)
+    return jsonify(menus=[{'id': menu_id, 'stock': stocks[menu_id]} for menu_id in menu_ids])
+
+
+@bp.route('/cart', methods=['POST'])
+def bulk_add_to_cart():
+    """Tambah banyak menu ke keranjang sekaligus.
+
+    Body: {"items": [{"menu_id": 1, "quantity": 2}, ...]}. Aturan sama dengan add_to_cart,
+    termasuk reservasi stok; jika satu menu gagal ditahan tidak ada yang ditambahkan.
+    """
+    _require_role()
+    quantities = {}
+    for item in _batch_items():
+        quantity = item.get('quantity', 1)
+        if not _is_int(quantity) or quantity <= 0:
+            raise ApiError('Kuantitas harus lebih dari 0.', menu_id=item['menu_id'])
+        quantities[item['menu_id']] = quantities.get(item['menu_id'], 0) + quantity
+
+    menus = {menu['id']: menu for menu in catalog_cache.get_many(list(quantities))}
+    missing = [menu_id for menu_id in quantities if menu_id not in menus]
+    if missing:
+        raise ApiError('Menu tidak ditemukan.', 404, menu_ids=missing)
+    short = reservations.reserve(session['user_id'], quantities)
+    if short:
+        raise ApiError('Stok tidak mencukupi.', 409, lines=short)
+
+    in_cart = cart_store.add_many(session['user_id'], quantities)
+    return jsonify(items=[{'menu_id': menu_id, 'quantity': in_cart[menu_id]} for menu_id in quantities])
+
+
+@bp.route('/analytics')
+def sales_analytics():
+    """Agregat penjualan: menu terlaris, heatmap jam x hari, ukuran keranjang, tren rating.
+
+    Admin melihat semua kantin (atau satu lewat ?kantin_id=), kantin hanya miliknya sendiri.
+    """
+    identity = _require_role('admin', 'kantin')
+    if identity.role == 'admin':
+        kantin_id = request.args.get('kantin_id', type=int)
+    else:
+        kantin_id = _own_kantin_id(identity)
+    return jsonify(analytics.summary(kantin_id))
+
+
+def _kitchen_kantin_id():
+    return _own_kantin_id(_require_role('kantin'))
+
+
+@bp.route('/kitchen/queue')
+def kitchen_queue():
+    """Tiket aktif antrian dapur kantin dalam urutan pengerjaan, plus perkiraan waktu tunggu."""
+    kantin_id = _kitchen_kantin_id()
+    tickets = kitchen.queue(kantin_id)
+    return jsonify(wait_seconds=round(kitchen.wait_seconds(kantin_id)), tickets=[{
+        'id': ticket.id, 'order_id': ticket.order_id, 'menu_id': ticket.menu_id, 'quantity': ticket.quantity,
+        'status': ticket.status, 'priority': ticket.priority,
+        'queued_at': ticket.queued_at.isoformat(),
+        'started_at': ticket.started_at.isoformat() if ticket.started_at else None,
+        'ready_at': ticket.ready_at.isoformat() if ticket.ready_at else None,
+    } for ticket in tickets])
+
+
+@bp.route('/kitchen/advance', methods=['POST'])
+def kitchen_advance():
+    """Majukan banyak tiket sekaligus.
+
+    Body: {"action": "start" | "ready" | "pickup" | "prioritize", "ticket_ids": [1, 2]}
+    atau {"action": "start", "count": 3} untuk tiket berikutnya di antrian.
+    """
+    kantin_id = _kitchen_kantin_id()
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        raise ApiError('Body harus JSON.')
+    ticket_ids = payload.get('ticket_ids')
+    count = payload.get('count')
+    if ticket_ids is not None and (not isinstance(ticket_ids, list) or not all(_is_int(i) for i in ticket_ids)):
+        raise ApiError('ticket_ids harus daftar angka.')
+    if ticket_ids and len(ticket_ids) > MAX_BATCH_ITEMS:
+        raise ApiError(f'Maksimal {MAX_BATCH_ITEMS} tiket per request.')
+    if count is not None and (not _is_int(count) or not 0 < count <= MAX_BATCH_ITEMS):
+        raise ApiError(f'count harus angka 1-{MAX_BATCH_ITEMS}.')
+    try:
+        advanced = run_with_retry(lambda: kitchen.advance(kantin_id, payload.get('action'), ticket_ids, count),
+                                  attempts=current_app.config['DB_LOCK_RETRIES'])
+    except kitchen.KitchenError as e:
+        raise ApiError(str(e))
+    return jsonify(ticket_ids=advanced)
@@ -1,22 +1,105 @@
  # app.py
 
+import hashlib
 import os
-from flask import Flask, render_template, request, redirect, url_for, flash, session, abort
+import time
+import click
+from flask import Blueprint, Flask, Response, current_app, g, make_response, render_template, request, redirect, url_for, flash, session, abort
 from config import Config
-from models import db, User, Kantin, Menu, Order, OrderItem, Rating
+from models import db, User, Kantin, Menu, Order, OrderItem, Rating, KantinDailySales
+from orders import place_order, InsufficientStockError
+from access import access_cache, current_identity, role_required
+from passwords import HashingBusy, login_throttle, passwords
+from reservations import reservations
+from analytics import analytics
+from popularity import popularity
+import api
+import archive
+import exports
+import image_pipeline
+import kitchen
+import menu_import
+import migrations
+import rollup
+import search
+from catalog import catalog_cache
+from cart_store import cart_store
+from database import init_engine, lock_stats, run_with_retry
+from events import order_events
+from fragments import fragment_cache, init_bytecode_cache
+from jobs import jobs
+from metrics import metrics
+from pagination import encode_cursor, keyset_page_across, parse_date_range
 from datetime import datetime, timedelta
+from sqlalchemy import select, update
+
+bp = Blueprint('main', __name__, cli_group=None)
+
+
+def create_app(config=Config):
+    """Buat instance aplikasi. Dipakai oleh `flask run`, wsgi.py (gunicorn) dan benchmark."""
+    app = Flask(__name__)
+    app.config.from_object(config)
+    db.init_app(app)
+    init_engine(app)
+    catalog_cache.init_app(app)
+    order_events.init_app(app)
+    cart_store.init_app(app)
+    reservations.init_app(app)
+    jobs.init_app(app)
+    analytics.init_app(app)
+    passwords.init_app(app)
+    access_cache.init_app(app)
+    fragment_cache.init_app(app)
+    popularity.init_app(app)
+    init_bytecode_cache(app)
+    login_throttle.init_app(app)
+    image_pipeline.image_pipeline.init_app(app)
+    metrics.init_app(app)
+    metrics.add_gauges('catalog_cache', catalog_cache.stats)
+    metrics.add_gauges('db_lock', lock_stats.snapshot)
+    metrics.add_gauges('order_events', lambda: {'subscribers': order_events.subscriber_count()})
+    metrics.add_gauges('reservations', reservations.stats)
+    metrics.add_gauges('jobs', jobs.stats)
+    metrics.add_gauges('analytics', analytics.stats)
+    metrics.add_gauges('password_hash', passwords.stats)
+    metrics.add_gauges('access_cache', access_cache.stats)
+    metrics.add_gauges('fragment_cache', fragment_cache.stats)
+    metrics.add_gauges('popularity', popularity.stats)
+    metrics.add_gauges('login_throttle', login_throttle.stats)
+    app.register_blueprint(bp)
+    app.register_blueprint(api.bp)
+    app.register_blueprint(exports.bp)
+    app.register_blueprint(image_pipeline.bp)
+    return app
+
+
+def warm_up(app):
+    """Persiapan satu worker setelah fork: koneksi baru, cache katalog terisi, template terkompilasi."""
+    with app.app_context():
+        # Koneksi pool yang dibuka master sebelum fork tidak boleh dipakai bersama antar proses
+        db.engine.dispose(close=False)
+        catalog_cache.all_menus()
+        # Array analitik dimuat sekarang agar dashboard pertama tidak menanggung pemuatan awal
+        analytics.refresh()
+        # Peringkat populer dimuat dari snapshot di disk (atau riwayat pesanan terbaru)
+        popularity.refresh()
+        # Job berkala (pembersihan keranjang, tiket dapur kedaluwarsa) diantrekan sekali untuk semua worker
+        jobs.schedule_periodic()
+    reservations.ensure_sweeper()
+    # Job yang tertinggal sebelum restart langsung diproses
+    jobs.ensure_workers()
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
 
-app = Flask(__name__)
-app.config.from_object(Config)
-db.init_app(app)
 
 # Fungsi untuk membuat tabel database dan mengisi data dummy
-def create_tables():
+def create_tables(app):
     with app.app_context():
         # Dapatkan nama file database dari konfigurasi
         db_file_name = app.config['SQLALCHEMY_DATABASE_URI'].replace('sqlite:///', '')
-        # Bangun path lengkap ke file database
-        db_path = os.path.join(app.root_path, db_file_name)
+        # Bangun path lengkap ke file database (Flask-SQLAlchemy menaruh path relatif di folder instance)
+        db_path = os.path.join(app.instance_path, db_file_name)
 
         # Cek apakah file database sudah ada
         if not os.path.exists(db_path):
@@ -61,13 +144,27 @@ def create_tables():
                 print("Database sudah ada dan berisi data. Tidak membuat data dummy baru.")
         else:
             print(f"Database {db_file_name} sudah ditemukan. Tidak membuat ulang.")
+            db.create_all() # Hanya membuat tabel baru yang belum ada
+
+        # Terapkan migrasi skema (kolom dan indeks baru) ke database yang sudah ada
+        applied = migrations.upgrade()
+        if applied:
+            print(f"Migrasi skema diterapkan: {', '.join(str(version) for version in applied)}")
+
+        # Database lama yang baru mendapat tabel rollup perlu diisi dari riwayat pesanan
+        if Order.query.first() and not KantinDailySales.query.first():
+            print(f"Rollup penjualan harian dibangun dengan {rollup.rebuild_rollup()} baris.")
 
+        # Indeks pencarian menu (FTS5) dibuat terpisah dari create_all
+        if search.create_index():
+            print(f"Indeks pencarian menu dibuat untuk {search.rebuild_index()} menu.")
 
-@app.route('/')
+
+@bp.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/register', methods=['GET', 'POST'])
+@bp.route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
         username = request.form['username']
@@ -75,333 +172,438 @@ def register():
         password = request.form['password']
         role = request.form.get('role', 'customer') 
 
+        retry_after = login_throttle.hit(ip=request.remote_addr)
+        if retry_after:
+            flash(f'Terlalu banyak percobaan. Coba lagi dalam {retry_after} detik.', 'danger')
+            return render_template('register.html'), 429, {'Retry-After': str(retry_after)}
+
         existing_user = User.query.filter_by(username=username).first()
         if existing_user:
             flash('Username sudah ada. Coba yang lain.', 'danger')
-            return redirect(url_for('register'))
+            return redirect(url_for('main.register'))
 
         existing_email = User.query.filter_by(email=email).first()
         if existing_email:
             flash('Email sudah terdaftar. Coba yang lain.', 'danger')
-            return redirect(url_for('register'))
+            return redirect(url_for('main.register'))
 
         new_user = User(username=username, email=email, role=role)
-        new_user.set_password(password)
+        try:
+            new_user.set_password(password)
+        except HashingBusy:
+            flash('Server sedang sibuk. Silakan coba beberapa saat lagi.', 'warning')
+            return render_template('register.html'), 503, {'Retry-After': '5'}
         db.session.add(new_user)
         db.session.commit()
         flash('Registrasi berhasil! Silakan login.', 'success')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
     return render_template('register.html')
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
 
+        # Percobaan beruntun ditolak sebelum ada hash yang dihitung
+        retry_after = login_throttle.hit(username, request.remote_addr)
+        if retry_after:
+            flash(f'Terlalu banyak percobaan login. Coba lagi dalam {retry_after} detik.', 'danger')
+            return render_template('login.html'), 429, {'Retry-After': str(retry_after)}
+
         user = User.query.filter_by(username=username).first()
 
-        if user and user.check_password(password):
+        try:
+            valid = user is not None and user.check_password(password)
+        except HashingBusy:
+            flash('Server sedang sibuk. Silakan coba login beberapa saat lagi.', 'warning')
+            return render_template('login.html'), 503, {'Retry-After': '5'}
+
+        if valid:
+            login_throttle.reset(username)
+            upgrade_password_hash(user, password)
             session['user_id'] = user.id
             session['username'] = user.username
             session['role'] = user.role
             flash(f'Selamat datang, {user.username}!', 'success')
             if user.role == 'admin' or user.role == 'kantin':
-                return redirect(url_for('dashboard'))
-            return redirect(url_for('menu_list'))
+                return redirect(url_for('main.dashboard'))
+            return redirect(url_for('main.menu_list'))
         else:
             flash('Username atau password salah.', 'danger')
     return render_template('login.html')
 
-@app.route('/logout')
+def upgrade_password_hash(user, password):
+    # Hash lama (parameter di bawah PASSWORD_HASH_METHOD) diganti diam-diam saat login berhasil.
+    # UPDATE bersyarat: jika password diganti bersamaan, hash yang baru tidak ditimpa.
+    old_hash = user.password_hash
+    try:
+        new_hash = passwords.upgrade(old_hash, password)
+        if new_hash is None:
+            return
+        db.session.execute(
+            update(User).where(User.id == user.id, User.password_hash == old_hash)
+            .values(password_hash=new_hash)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+    except HashingBusy:
+        pass    # dicoba lagi pada login berikutnya
+    except Exception as error:
+        db.session.rollback()
+        current_app.logger.warning('Gagal memperbarui hash password user %s: %s', user.id, error)
+
+@bp.route('/logout')
 def logout():
     session.pop('user_id', None)
     session.pop('username', None)
     session.pop('role', None)
     flash('Anda telah logout.', 'info')
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
 
-@app.route('/menu')
+@bp.route('/menu')
 def menu_list():
     query = request.args.get('q') # Ambil query pencarian
-    
+    sort = request.args.get('sort') if request.args.get('sort') in MENU_SORTS else None
+
     if query:
-        # Lakukan pencarian berdasarkan nama atau deskripsi
-        menus = Menu.query.filter(
-            (Menu.name.ilike(f'%{query}%')) | 
-            (Menu.description.ilike(f'%{query}%'))
-        ).all()
-        flash(f"Menampilkan hasil pencarian untuk '{query}'.", 'info')
+        # Cari lewat indeks full-text, hasil diurutkan berdasarkan relevansi
+        menus = catalog_cache.get_many(search.search_menu_ids(query))
+        if sort == 'popular':
+            menus = popularity.ranked(menus)
+    elif sort == 'popular':
+        # Daftar sudah terurut di indeks popularitas, tidak ada pengurutan per request
+        menus = popularity.ranked()
     else:
-        menus = Menu.query.all()
-    
-    return render_template('menu.html', menus=menus)
+        menus = catalog_cache.all_menus()
+
+    # Versi kartu = versi isi menu + hash varian gambarnya
+    versions = [_menu_card_version(menu) for menu in menus]
+
+    # ETag mencakup semua yang tampil di halaman: template, kata kunci, user di header
+    # dan versi setiap kartu. Halaman yang membawa flash dari request sebelumnya selalu
+    # dirender penuh. 304 hanya diputuskan dari ETag; Last-Modified per worker sebagai info.
+    etag = None
+    if not session.get('_flashes'):
+        sha = hashlib.sha1(fragment_cache.template_digest(MENU_PAGE_TEMPLATES).encode())
+        sha.update(repr((query, sort, session.get('user_id'), session.get('username'))).encode())
+        sha.update(''.join(versions).encode())
+        etag = sha.hexdigest()
+        if request.if_none_match.contains(etag):
+            return _menu_page_headers(current_app.response_class(status=304), etag)
+
+    if query:
+        flash(f"Menampilkan hasil pencarian untuk '{query}'.", 'info')
+    cards = [fragment_cache.render('menu_card.html', menu['id'], version, menu=menu)
+             for menu, version in zip(menus, versions)]
+    response = make_response(render_template('menu.html', cards=cards, sort=sort))
+    return _menu_page_headers(response, etag) if etag else response
+
+MENU_SORTS = ('popular',)
+
+MENU_PAGE_TEMPLATES = ('menu.html', 'menu_card.html', 'picture.html', 'base.html')
+
+def _menu_card_version(menu):
+    image = image_pipeline.image_pipeline.manifest(menu['image_url']) if menu['image_url'] else None
+    return menu['version'] + (image['hash'] if image else '')
+
+def _menu_page_headers(response, etag):
+    response.set_etag(etag)
+    response.last_modified = int(catalog_cache.changed_at)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+def resolve_cart(user_id):
+    # Keranjang server-side hanya berisi menu_id -> quantity; nama, harga dan gambar
+    # diambil dari cache katalog dengan satu pemanggilan untuk seluruh isi keranjang.
+    quantities = cart_store.get(user_id) if user_id else {}
+    cart_items = {}
+    for menu in catalog_cache.get_many(sorted(quantities)):
+        cart_items[menu['id']] = {
+            'name': menu['name'],
+            'price': menu['price'],
+            'quantity': quantities[menu['id']],
+            'image_url': menu['image_url'],
+        }
+    return cart_items
 
-@app.route('/add_to_cart/<int:menu_id>', methods=['POST'])
+@bp.route('/add_to_cart/<int:menu_id>', methods=['POST'])
 def add_to_cart(menu_id):
     if 'user_id' not in session:
         flash('Anda harus login untuk menambahkan item ke keranjang.', 'warning')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
 
-    menu = Menu.query.get_or_404(menu_id)
+    menus = catalog_cache.get_many([menu_id])
+    if not menus:
+        abort(404)
+    menu = menus[0]
     quantity = int(request.form.get('quantity', 1))
 
     if quantity <= 0:
         flash('Kuantitas harus lebih dari 0.', 'danger')
-        return redirect(url_for('menu_list'))
-
-    if menu.stock < quantity:
-        flash(f'Stok {menu.name} tidak mencukupi. Tersedia {menu.stock} item.', 'danger')
-        return redirect(url_for('menu_list'))
+        return redirect(url_for('main.menu_list'))
 
-    if 'cart' not in session:
-        session['cart'] = {}
+    if menu['available'] < quantity:
+        flash(f"Stok {menu['name']} tidak mencukupi. Tersedia {menu['available']} item.", 'danger')
+        return redirect(url_for('main.menu_list'))
 
-    cart = session['cart']
-    menu_id_str = str(menu_id)
+    # Tahan stok selama item ada di keranjang
+    failed = reservations.reserve(session['user_id'], {menu_id: quantity})
+    if failed:
+        flash(f"Stok {menu['name']} tidak mencukupi. Tersedia {failed[0]['available']} item.", 'danger')
+        return redirect(url_for('main.menu_list'))
 
-    if menu_id_str in cart:
-        cart[menu_id_str]['quantity'] += quantity
-    else:
-        cart[menu_id_str] = {
-            'name': menu.name,
-            'price': menu.price,
-            'quantity': quantity,
-            'image_url': menu.image_url # Simpan path gambar di keranjang
-        }
-    session['cart'] = cart # Update session
-    flash(f'{quantity}x {menu.name} ditambahkan ke keranjang!', 'success')
-    return redirect(url_for('menu_list'))
+    cart_store.add(session['user_id'], menu_id, quantity)
+    flash(f"{quantity}x {menu['name']} ditambahkan ke keranjang!", 'success')
+    return redirect(url_for('main.menu_list'))
 
-@app.route('/cart')
+@bp.route('/cart')
 def cart():
-    if 'cart' not in session or not session['cart']:
+    cart_items = resolve_cart(session.get('user_id'))
+    if not cart_items:
         flash('Keranjang Anda kosong.', 'info')
         return render_template('cart.html', cart_items={}, total_price=0)
 
-    cart_items = session['cart']
     total_price = sum(item['price'] * item['quantity'] for item in cart_items.values())
     return render_template('cart.html', cart_items=cart_items, total_price=total_price)
 
-@app.route('/update_cart/<int:menu_id>', methods=['POST'])
+@bp.route('/update_cart/<int:menu_id>', methods=['POST'])
 def update_cart(menu_id):
     if 'user_id' not in session:
         flash('Anda harus login untuk mengelola keranjang.', 'warning')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
 
     quantity = int(request.form.get('quantity', 0))
-    menu_id_str = str(menu_id)
-    cart = session.get('cart', {})
+    user_id = session['user_id']
+
+    if menu_id not in cart_store.get(user_id):
+        flash('Item tidak ditemukan di keranjang.', 'danger')
+        return redirect(url_for('main.cart'))
 
     if quantity <= 0:
-        if menu_id_str in cart:
-            del cart[menu_id_str]
-            flash('Item dihapus dari keranjang.', 'info')
+        reservations.set_quantity(user_id, menu_id, 0)
+        cart_store.set(user_id, menu_id, 0)
+        flash('Item dihapus dari keranjang.', 'info')
     else:
-        menu = Menu.query.get_or_404(menu_id)
-        if menu.stock < quantity:
-            flash(f'Stok {menu.name} tidak mencukupi. Tersedia {menu.stock} item.', 'danger')
-            return redirect(url_for('cart'))
-        if menu_id_str in cart:
-            cart[menu_id_str]['quantity'] = quantity
-            flash('Kuantitas item diperbarui.', 'success')
-        else:
-            flash('Item tidak ditemukan di keranjang.', 'danger') 
-
-    session['cart'] = cart
-    return redirect(url_for('cart'))
-
-@app.route('/checkout', methods=['GET', 'POST'])
+        menus = catalog_cache.get_many([menu_id])
+        if not menus:
+            abort(404)
+        failed = reservations.set_quantity(user_id, menu_id, quantity)
+        if failed:
+            flash(f"Stok {menus[0]['name']} tidak mencukupi. Tersedia {failed[0]['available']} item.", 'danger')
+            return redirect(url_for('main.cart'))
+        cart_store.set(user_id, menu_id, quantity)
+        flash('Kuantitas item diperbarui.', 'success')
+
+    return redirect(url_for('main.cart'))
+
+@bp.route('/checkout', methods=['GET', 'POST'])
 def checkout():
     if 'user_id' not in session:
         flash('Anda harus login untuk checkout.', 'warning')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
 
     user_id = session['user_id']
-    cart_items = session.get('cart', {})
+    cart_items = resolve_cart(user_id)
 
     if not cart_items:
         flash('Keranjang Anda kosong. Tidak bisa checkout.', 'danger')
-        return redirect(url_for('menu_list'))
+        return redirect(url_for('main.menu_list'))
 
     total_price = sum(item['price'] * item['quantity'] for item in cart_items.values())
 
     if request.method == 'POST':
         try:
-            new_order = Order(user_id=user_id, total_price=total_price, status='completed')
-            db.session.add(new_order)
-            db.session.commit() 
-
-            kantin_ids_involved = set() # Set untuk melacak kantin yang terlibat dalam pesanan ini
-
-            for menu_id_str, item_data in cart_items.items():
-                menu_id = int(menu_id_str)
-                menu = Menu.query.get(menu_id)
-                if menu:
-                    order_item = OrderItem(
-                        order_id=new_order.id,
-                        menu_id=menu_id,
-                        quantity=item_data['quantity'],
-                        price=item_data['price']
-                    )
-                    menu.stock -= item_data['quantity']
-                    db.session.add(order_item)
-                    kantin_ids_involved.add(menu.kantin_id) # Tambahkan ID kantin ke set
-
-            db.session.commit()
-
-            # Perbarui last_order_at untuk kantin yang terlibat
-            for k_id in kantin_ids_involved:
-                kantin = Kantin.query.get(k_id)
-                if kantin:
-                    kantin.last_order_at = datetime.utcnow() # Set waktu pesanan terakhir ke sekarang
-                    db.session.add(kantin)
-            db.session.commit()
-
-
-            session.pop('cart', None) 
-            flash('Pembayaran berhasil dan pesanan Anda telah ditempatkan! Silakan ambil makanan Anda.', 'success')
-            return redirect(url_for('index'))
-
+            quantities = {menu_id: item['quantity'] for menu_id, item in cart_items.items()}
+            order, after_commit = run_with_retry(lambda: place_order(user_id, quantities),
+                                                 attempts=current_app.config['DB_LOCK_RETRIES'])
+            # Di luar run_with_retry: pesanan sudah di-commit dan tidak boleh dibuat ulang
+            after_commit()
+            cart_store.clear(user_id)
+            flash('Pembayaran berhasil dan pesanan Anda telah ditempatkan! '
+                  f'Perkiraan siap diambil sekitar {kitchen.minutes_until(order.estimated_ready_at)} menit lagi.', 'success')
+            return redirect(url_for('main.index'))
+
+        except InsufficientStockError as e:
+            for line in e.lines:
+                flash(f"Stok {line['name']} tidak mencukupi. Diminta {line['requested']}, tersedia {line['available']} item.", 'danger')
+            return redirect(url_for('main.cart'))
         except Exception as e:
             db.session.rollback() 
             flash(f'Terjadi kesalahan saat checkout: {str(e)}', 'danger')
-            return redirect(url_for('cart'))
+            return redirect(url_for('main.cart'))
 
-    return render_template('checkout.html', cart_items=cart_items, total_price=total_price)
+    # Perkiraan dari beban antrian dapur kantin terkait, tanpa memindai pesanan
+    ready_at = kitchen.estimate_ready_at({menu_id: item['quantity'] for menu_id, item in cart_items.items()})
+    return render_template('checkout.html', cart_items=cart_items, total_price=total_price,
+                           wait_minutes=kitchen.minutes_until(ready_at))
 
-@app.route('/dashboard')
+@bp.route('/dashboard')
+@role_required('admin', 'kantin', message='Anda tidak memiliki akses ke dashboard ini.')
 def dashboard():
-    if 'user_id' not in session or (session['role'] != 'admin' and session['role'] != 'kantin'):
-        flash('Anda tidak memiliki akses ke dashboard ini.', 'danger')
-        return redirect(url_for('login'))
-
-    user_id = session['user_id']
-    current_user = User.query.get(user_id)
-
-    if session['role'] == 'admin':
-        all_orders = Order.query.order_by(Order.order_date.desc()).all()
-        all_kantin = Kantin.query.all()
-        total_revenue = db.session.query(db.func.sum(Order.total_price)).scalar() or 0
-        return render_template('dashboard.html', orders=all_orders, kantin_list=all_kantin, total_revenue=total_revenue, role='admin')
-
-    elif session['role'] == 'kantin':
-        # MENGUBAH INI: Mencari kantin yang dikelola oleh user yang sedang login
-        kantin = Kantin.query.filter_by(user_id=user_id).first() 
-        
+    if g.identity.role == 'admin':
+        # Filter tanggal dan status, dipakai oleh agregat maupun daftar pesanan
+        date_from, date_to = parse_date_range(request.args)
+        status = request.args.get('status') or None
+
+        # Total mencakup pesanan yang sudah diarsipkan lewat tabel ringkasan arsip
+        total_orders, total_revenue = archive.order_totals(date_from, date_to, status)
+
+        # Tabel arsip hanya dibaca jika halaman melewati pesanan di tabel aktif
+        orders, has_more = keyset_page_across(archive.order_sources(date_from, date_to, status),
+                                              request.args.get('before'), current_app.config['ORDERS_PER_PAGE'])
+        next_cursor = encode_cursor(orders[-1].order_date, orders[-1].id) if has_more else None
+
+        kantin_count = db.session.query(db.func.count(Kantin.id)).scalar()
+        return render_template('dashboard.html', orders=orders, kantin_count=kantin_count,
+                               total_orders=total_orders, total_revenue=total_revenue,
+                               next_cursor=next_cursor, insights=analytics.summary(), role='admin')
+
+    elif g.identity.role == 'kantin':
+        kantin = g.identity.kantin
         if not kantin:
             flash('Anda belum terkait dengan kantin mana pun. Harap hubungi admin.', 'warning')
-            return redirect(url_for('index'))
+            return redirect(url_for('main.index'))
+
+        menu_count = db.session.query(db.func.count(Menu.id)).filter(Menu.kantin_id == kantin.id).scalar()
 
-        kantin_menus = Menu.query.filter_by(kantin_id=kantin.id).all()
-        
-        # Ambil semua order items yang terkait dengan kantin ini
-        kantin_order_items_raw = db.session.query(OrderItem, Order).join(Order).join(Menu).filter(Menu.kantin_id == kantin.id).order_by(Order.order_date.desc()).all()
-        
-        kantin_order_items = kantin_order_items_raw
+        # Total pendapatan dan item terjual diambil dari rollup harian
+        kantin_revenue, total_items_sold = rollup.kantin_totals(kantin.id)
 
-        kantin_revenue = 0
-        total_items_sold = 0 
-        for item, order in kantin_order_items:
-            kantin_revenue += item.quantity * item.price
-            total_items_sold += item.quantity
+        # Hanya satu halaman item pesanan terbaru yang dimuat, lanjut ke arsip bila perlu
+        kantin_order_items, has_more = keyset_page_across(archive.kantin_item_sources(kantin.id),
+                                                          request.args.get('before'),
+                                                          current_app.config['ORDERS_PER_PAGE'])
+        next_cursor = None
+        if has_more:
+            last_item, last_order = kantin_order_items[-1]
+            next_cursor = encode_cursor(last_order.order_date, last_item.id)
 
         # Logika Notifikasi Pesanan Baru
         threshold_time = datetime.utcnow() - timedelta(minutes=5)
-        new_orders = db.session.query(Order).join(OrderItem).join(Menu).filter(
-            Menu.kantin_id == kantin.id,
-            Order.order_date > threshold_time,
-            Order.status == 'completed' 
-        ).distinct().count() 
-
-        new_orders_count = new_orders
-
-        return render_template('dashboard.html', kantin=kantin, menus=kantin_menus,
+        new_orders_count = 0
+        # Cek last_order_at dulu (satu kolom), lewati query jika tidak ada pesanan baru
+        last_order_at = db.session.execute(select(Kantin.last_order_at).where(Kantin.id == kantin.id)).scalar()
+        if last_order_at and last_order_at > threshold_time:
+            new_orders_count = db.session.query(Order).join(OrderItem).filter(
+                OrderItem.kantin_id == kantin.id,
+                OrderItem.order_date > threshold_time,
+                Order.status != 'cancelled'
+            ).distinct().count()
+
+        return render_template('dashboard.html', kantin=kantin, menu_count=menu_count,
                                kantin_order_items=kantin_order_items, kantin_revenue=kantin_revenue,
                                total_items_sold=total_items_sold, role='kantin',
-                               new_orders_count=new_orders_count) 
+                               new_orders_count=new_orders_count, next_cursor=next_cursor,
+                               insights=analytics.summary(kantin.id))
 
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
 
 
-@app.route('/admin/stock', methods=['GET', 'POST'])
-def manage_stock():
-    if 'user_id' not in session or session['role'] not in ['admin', 'kantin']:
-        flash('Anda tidak memiliki akses ke halaman ini.', 'danger')
-        return redirect(url_for('login'))
+@bp.route('/kantin/events')
+def kantin_events():
+    identity = current_identity()
+    if identity is None or identity.role != 'kantin':
+        abort(403)
+
+    kantin = identity.kantin
+    if not kantin:
+        abort(404)
+
+    # Stream notifikasi pesanan baru (Server-Sent Events) untuk kantin ini
+    return Response(order_events.stream(kantin.id), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@bp.route('/kantin/kitchen')
+@role_required('kantin', kantin=True)
+def kitchen_queue():
+    kantin = g.identity.kantin
 
+    tickets = kitchen.queue(kantin.id)
+    return render_template('kantin/kitchen.html', kantin=kantin, tickets=tickets,
+                           wait_minutes=round(kitchen.wait_seconds(kantin.id) / 60))
+
+
+@bp.route('/kantin/kitchen/advance', methods=['POST'])
+@role_required('kantin', kantin=True)
+def advance_kitchen_tickets():
+    kantin = g.identity.kantin
+
+    ticket_ids = request.form.getlist('ticket_id', type=int)
+    count = request.form.get('count', type=int)
+    try:
+        advanced = run_with_retry(lambda: kitchen.advance(kantin.id, request.form.get('action'), ticket_ids, count),
+                                  attempts=current_app.config['DB_LOCK_RETRIES'])
+    except kitchen.KitchenError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('main.kitchen_queue'))
+    flash(f'{len(advanced)} tiket diperbarui.' if advanced else 'Tidak ada tiket yang bisa diperbarui.',
+          'success' if advanced else 'warning')
+    return redirect(url_for('main.kitchen_queue'))
+
+
+@bp.route('/admin/stock', methods=['GET', 'POST'])
+@role_required('admin', 'kantin')
+def manage_stock():
     kantin_menus = []
     current_kantin = None
-    if session['role'] == 'admin':
+    if g.identity.role == 'admin':
         kantin_menus = Menu.query.all()
-    elif session['role'] == 'kantin':
-        # MENGUBAH INI: Mendapatkan kantin yang dikelola oleh user yang sedang login
-        current_kantin = Kantin.query.filter_by(user_id=session['user_id']).first() 
+    elif g.identity.role == 'kantin':
+        current_kantin = g.identity.kantin
         if current_kantin:
             kantin_menus = Menu.query.filter_by(kantin_id=current_kantin.id).all()
         else:
             flash('Anda belum terkait dengan kantin mana pun.', 'warning')
-            return redirect(url_for('dashboard'))
+            return redirect(url_for('main.dashboard'))
 
     if request.method == 'POST':
         menu_id = request.form.get('menu_id')
         new_stock = request.form.get('stock')
         if not menu_id or new_stock is None: 
             flash('Menu ID dan Stok baru harus diisi.', 'danger')
-            return redirect(url_for('manage_stock'))
+            return redirect(url_for('main.manage_stock'))
 
         try:
             menu = Menu.query.get_or_404(menu_id)
             new_stock = int(new_stock)
             if new_stock < 0:
                 flash('Stok tidak boleh kurang dari 0.', 'danger')
-                return redirect(url_for('manage_stock'))
+                return redirect(url_for('main.manage_stock'))
 
             # Validasi kantin pemilik
-            if session['role'] == 'kantin' and menu.kantin_id != current_kantin.id: 
+            if g.identity.role == 'kantin' and menu.kantin_id != current_kantin.id: 
                  flash('Anda tidak punya izin mengubah stok menu ini.', 'danger')
-                 return redirect(url_for('manage_stock'))
+                 return redirect(url_for('main.manage_stock'))
 
             menu.stock = new_stock
             db.session.commit()
+            catalog_cache.patch_stock({menu.id: new_stock}, absolute=True)
             flash(f'Stok {menu.name} berhasil diperbarui menjadi {new_stock}.', 'success')
         except ValueError:
             flash('Stok harus berupa angka.', 'danger')
         except Exception as e:
             db.session.rollback() 
             flash(f'Terjadi kesalahan: {str(e)}', 'danger')
-        return redirect(url_for('manage_stock'))
+        return redirect(url_for('main.manage_stock'))
 
     return render_template('admin/stock.html', menus=kantin_menus)
 
 
 # --- Rute Baru untuk Manajemen Menu Kantin ---
-@app.route('/kantin/menus')
+@bp.route('/kantin/menus')
+@role_required('kantin', kantin=True)
 def manage_kantin_menus():
-    if 'user_id' not in session or session['role'] != 'kantin':
-        flash('Anda tidak memiliki akses ke halaman ini.', 'danger')
-        return redirect(url_for('login'))
-
-    # MENGUBAH INI: Mendapatkan kantin yang dikelola oleh user yang sedang login
-    kantin = Kantin.query.filter_by(user_id=session['user_id']).first() 
-    if not kantin:
-        flash('Anda belum terkait dengan kantin mana pun. Harap hubungi admin.', 'warning')
-        return redirect(url_for('dashboard'))
-    
+    kantin = g.identity.kantin
     menus = Menu.query.filter_by(kantin_id=kantin.id).all()
     return render_template('kantin/manage_menus.html', menus=menus)
 
-@app.route('/kantin/menus/add', methods=['GET', 'POST'])
+@bp.route('/kantin/menus/add', methods=['GET', 'POST'])
+@role_required('kantin', kantin=True, message='Anda tidak memiliki akses untuk menambah menu.')
 def add_menu():
-    if 'user_id' not in session or session['role'] != 'kantin':
-        flash('Anda tidak memiliki akses untuk menambah menu.', 'danger')
-        return redirect(url_for('login'))
-
-    # MENGUBAH INI: Mendapatkan kantin yang dikelola oleh user yang sedang login
-    kantin = Kantin.query.filter_by(user_id=session['user_id']).first() 
-    if not kantin:
-        flash('Anda belum terkait dengan kantin mana pun. Harap hubungi admin.', 'warning')
-        return redirect(url_for('dashboard'))
+    kantin = g.identity.kantin
 
     if request.method == 'POST':
         name = request.form['name']
@@ -425,35 +627,67 @@ def add_menu():
                 image_url=image_url
             )
             db.session.add(new_menu)
+            db.session.flush()
+            search.index_menu(new_menu, kantin_name=kantin.name)
+            # Thumbnail dan WebP dibuat di latar belakang
+            jobs.enqueue('process_image', {'image_url': image_url})
             db.session.commit()
+            catalog_cache.invalidate(new_menu.id)
+            jobs.kick()
             flash(f'Menu "{name}" berhasil ditambahkan!', 'success')
-            return redirect(url_for('manage_kantin_menus'))
+            return redirect(url_for('main.manage_kantin_menus'))
         except Exception as e:
             db.session.rollback()
             flash(f'Terjadi kesalahan saat menambahkan menu: {str(e)}', 'danger')
 
     return render_template('kantin/menu_form.html')
 
-@app.route('/kantin/menus/edit/<int:menu_id>', methods=['GET', 'POST'])
-def edit_menu(menu_id):
-    if 'user_id' not in session or session['role'] != 'kantin':
-        flash('Anda tidak memiliki akses untuk mengedit menu.', 'danger')
-        return redirect(url_for('login'))
+@bp.route('/kantin/menus/import', methods=['POST'])
+@role_required('kantin', kantin=True, message='Anda tidak memiliki akses untuk menambah menu.')
+def import_menus():
+    kantin = g.identity.kantin
+
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        flash('Pilih file CSV yang akan diimpor.', 'danger')
+        return redirect(url_for('main.manage_kantin_menus'))
+
+    try:
+        menu_ids = menu_import.import_menus(kantin, upload.stream)
+        db.session.commit()
+    except menu_import.MenuImportError as e:
+        for line, message in e.errors:
+            flash(f'Baris {line}: {message}', 'danger')
+        flash('Impor dibatalkan, tidak ada menu yang ditambahkan.', 'danger')
+        return redirect(url_for('main.manage_kantin_menus'))
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Terjadi kesalahan saat mengimpor menu: {str(e)}', 'danger')
+        return redirect(url_for('main.manage_kantin_menus'))
+
+    for menu_id in menu_ids:
+        catalog_cache.invalidate(menu_id)
+    jobs.kick()
+    flash(f'{len(menu_ids)} menu berhasil diimpor!', 'success')
+    return redirect(url_for('main.manage_kantin_menus'))
 
+@bp.route('/kantin/menus/edit/<int:menu_id>', methods=['GET', 'POST'])
+@role_required('kantin', message='Anda tidak memiliki akses untuk mengedit menu.')
+def edit_menu(menu_id):
     menu = Menu.query.get_or_404(menu_id)
-    # MENGUBAH INI: Mendapatkan kantin yang dikelola oleh user yang sedang login
-    kantin = Kantin.query.filter_by(user_id=session['user_id']).first() 
-    
+    kantin = g.identity.kantin
+
     # Pastikan user kantin hanya bisa mengedit menunya sendiri
     if not kantin or menu.kantin_id != kantin.id:
         flash('Anda tidak memiliki izin untuk mengedit menu ini.', 'danger')
-        return redirect(url_for('manage_kantin_menus'))
+        return redirect(url_for('main.manage_kantin_menus'))
 
     if request.method == 'POST':
         menu.name = request.form['name']
         menu.description = request.form['description']
         menu.price = float(request.form['price'])
         menu.stock = int(request.form['stock'])
+        previous_image_url = menu.image_url
         menu.image_url = request.form.get('image_url', menu.image_url)
 
         # Validasi sederhana
@@ -462,71 +696,197 @@ def edit_menu(menu_id):
             return render_template('kantin/menu_form.html', menu=menu)
 
         try:
+            search.index_menu(menu, kantin_name=kantin.name)
+            if menu.image_url != previous_image_url:
+                jobs.enqueue('process_image', {'image_url': menu.image_url})
             db.session.commit()
+            catalog_cache.invalidate(menu.id)
+            jobs.kick()
             flash(f'Menu "{menu.name}" berhasil diperbarui!', 'success')
-            return redirect(url_for('manage_kantin_menus'))
+            return redirect(url_for('main.manage_kantin_menus'))
         except Exception as e:
             db.session.rollback()
             flash(f'Terjadi kesalahan saat memperbarui menu: {str(e)}', 'danger')
 
     return render_template('kantin/menu_form.html', menu=menu)
 
-@app.route('/kantin/menus/delete/<int:menu_id>', methods=['POST'])
+@bp.route('/kantin/menus/delete/<int:menu_id>', methods=['POST'])
+@role_required('kantin', message='Anda tidak memiliki akses untuk menghapus menu.')
 def delete_menu(menu_id):
-    if 'user_id' not in session or session['role'] != 'kantin':
-        flash('Anda tidak memiliki akses untuk menghapus menu.', 'danger')
-        return redirect(url_for('login'))
-
     menu = Menu.query.get_or_404(menu_id)
-    # MENGUBAH INI: Mendapatkan kantin yang dikelola oleh user yang sedang login
-    kantin = Kantin.query.filter_by(user_id=session['user_id']).first() 
+    kantin = g.identity.kantin
 
     # Pastikan user kantin hanya bisa menghapus menunya sendiri
     if not kantin or menu.kantin_id != kantin.id:
         flash('Anda tidak memiliki izin untuk menghapus menu ini.', 'danger')
-        return redirect(url_for('manage_kantin_menus'))
+        return redirect(url_for('main.manage_kantin_menus'))
     
     try:
+        search.remove_menu(menu.id)
+        reservations.remove_menu(menu.id)
         db.session.delete(menu)
         db.session.commit()
+        catalog_cache.invalidate(menu_id)
         flash(f'Menu "{menu.name}" berhasil dihapus.', 'success')
     except Exception as e:
         db.session.rollback()
         flash(f'Terjadi kesalahan saat menghapus menu: {str(e)}', 'danger')
     
-    return redirect(url_for('manage_kantin_menus'))
+    return redirect(url_for('main.manage_kantin_menus'))
 
 
-@app.route('/rate_menu/<int:menu_id>', methods=['POST'])
+@bp.route('/rate_menu/<int:menu_id>', methods=['POST'])
 def rate_menu(menu_id):
     if 'user_id' not in session:
         flash('Anda harus login untuk memberikan rating.', 'warning')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
 
     score = request.form.get('score')
     comment = request.form.get('comment', '')
 
     if not score or not (1 <= int(score) <= 5):
         flash('Rating harus antara 1 sampai 5.', 'danger')
-        return redirect(url_for('menu_list')) 
+        return redirect(url_for('main.menu_list')) 
 
     user_id = session['user_id']
 
+    score = int(score)
+
     existing_rating = Rating.query.filter_by(user_id=user_id, menu_id=menu_id).first()
     if existing_rating:
-        existing_rating.score = int(score)
+        # Rating lama diganti: kurangi skor lama dari agregat, jumlah ulasan tetap
+        score_delta, count_delta = score - existing_rating.score, 0
+        existing_rating.score = score
         existing_rating.comment = comment
         existing_rating.rating_date = datetime.utcnow()
-        flash('Rating Anda berhasil diperbarui!', 'success')
+        message = 'Rating Anda berhasil diperbarui!'
     else:
-        new_rating = Rating(user_id=user_id, menu_id=menu_id, score=int(score), comment=comment)
+        score_delta, count_delta = score, 1
+        new_rating = Rating(user_id=user_id, menu_id=menu_id, score=score, comment=comment)
         db.session.add(new_rating)
-        flash('Terima kasih atas rating Anda!', 'success')
+        message = 'Terima kasih atas rating Anda!'
+
+    # Perbarui agregat rating di Menu secara atomik dalam transaksi yang sama
+    result = db.session.execute(
+        update(Menu)
+        .where(Menu.id == menu_id)
+        .values(rating_sum=Menu.rating_sum + score_delta, rating_count=Menu.rating_count + count_delta)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        db.session.rollback()
+        abort(404)
 
     db.session.commit()
-    return redirect(url_for('menu_list')) 
+    catalog_cache.invalidate(menu_id)
+    flash(message, 'success')
+    return redirect(url_for('main.menu_list')) 
+
+
+@bp.cli.command('backfill-ratings')
+def backfill_ratings():
+    """Hitung ulang rating_count dan rating_sum setiap Menu dari tabel Rating."""
+    migrations.upgrade()
+    with db.engine.begin() as conn:
+        count = migrations.recompute_rating_aggregates(conn)
+    click.echo(f'Agregat rating diperbarui untuk {count} menu.')
+
+
+@bp.cli.command('db-upgrade')
+def db_upgrade():
+    """Terapkan migrasi skema yang belum dijalankan."""
+    db.create_all()
+    applied = migrations.upgrade()
+    if applied:
+        click.echo(f"Migrasi diterapkan: {', '.join(str(version) for version in applied)}")
+    else:
+        click.echo('Skema sudah versi terbaru.')
+
+
+@bp.cli.command('check-query-plans')
+def check_query_plans():
+    """Pastikan hot query memakai indeks (EXPLAIN QUERY PLAN), gagal jika ada full scan
+    atau query ber-LIMIT yang diurutkan dengan B-tree sementara."""
+    if db.engine.dialect.name != 'sqlite':
+        click.echo('Pemeriksaan rencana query hanya tersedia untuk SQLite.')
+        return
+    failed = []
+    for name, (plan, problem) in migrations.explain_hot_queries().items():
+        click.echo(f"{problem or 'OK':<4} {name}")
+        for line in plan:
+            click.echo(f'       {line}')
+        if problem:
+            failed.append(f'{name} ({problem})')
+    if failed:
+        raise click.ClickException(f"Query tanpa indeks yang sesuai: {', '.join(failed)}")
+
+
+@bp.cli.command('rebuild-sales-rollup')
+def rebuild_sales_rollup():
+    """Bangun ulang rollup penjualan harian kantin dari seluruh riwayat pesanan."""
+    click.echo(f'Rollup penjualan harian dibangun ulang dengan {rollup.rebuild_rollup()} baris.')
+
+
+@bp.cli.command('archive-orders')
+@click.option('--days', type=int, default=None, help='Arsipkan pesanan lebih tua dari N hari (default ARCHIVE_AFTER_DAYS).')
+@click.option('--background', is_flag=True, help='Serahkan ke antrian job web worker alih-alih menjalankan di sini.')
+def archive_orders_command(days, background):
+    """Pindahkan pesanan lama ke tabel arsip per batch, dengan jeda antar batch."""
+    cutoff = archive.archive_cutoff(days)
+    if background:
+        jobs.enqueue('archive_orders', {'cutoff': cutoff.isoformat()})
+        db.session.commit()
+        click.echo(f'Job arsip pesanan sebelum {cutoff:%Y-%m-%d} dimasukkan ke antrian.')
+        return
+
+    batch_size = current_app.config['ARCHIVE_BATCH_SIZE']
+    total = 0
+    while True:
+        # Satu transaksi pendek per batch; aman dihentikan kapan saja dan dijalankan ulang
+        moved = run_with_retry(lambda: _archive_one_batch(cutoff, batch_size),
+                               attempts=current_app.config['DB_LOCK_RETRIES'])
+        total += moved
+        if moved < batch_size:
+            break
+        time.sleep(current_app.config['ARCHIVE_BATCH_PAUSE'])
+    click.echo(f'{total} pesanan sebelum {cutoff:%Y-%m-%d} dipindahkan ke arsip.')
+
+
+def _archive_one_batch(cutoff, batch_size):
+    moved = archive.archive_batch(cutoff, batch_size)
+    db.session.commit()
+    return moved
+
+
+@bp.cli.command('process-images')
+@click.option('--folder', default='images', show_default=True, help='Subfolder static yang diproses.')
+@click.option('--force', is_flag=True, help='Buat ulang varian walaupun gambar tidak berubah.')
+def process_images_command(folder, force):
+    """Buat thumbnail dan WebP untuk gambar yang sudah ada, lalu laporkan penghematan."""
+    results = image_pipeline.image_pipeline.process_all(folder, force=force)
+    total_original = total_served = 0
+    for image_url, entry, created in results:
+        # Yang dikirim ke browser modern: WebP terbesar, atau file asli jika tidak ada yang lebih kecil
+        webp = [variant['bytes'] for variant in entry['variants'] if variant['format'] == 'webp']
+        served = webp[-1] if webp else entry['bytes']
+        total_original += entry['bytes']
+        total_served += served
+        click.echo(f"{'dibuat ' if created else 'tetap  '} {image_url}: {entry['bytes']:,} -> {served:,} byte, "
+                   f"{len(entry['variants'])} varian")
+    click.echo(f'{len(results)} gambar, {total_original:,} -> {total_served:,} byte '
+               f'(hemat {total_original - total_served:,} byte pada lebar penuh).')
+
+
+@bp.cli.command('rebuild-search-index')
+def rebuild_search_index():
+    """Bangun ulang indeks pencarian menu (FTS5) dari tabel menu."""
+    if not search.is_supported():
+        click.echo('Indeks full-text hanya tersedia untuk SQLite, pencarian memakai ILIKE.')
+        return
+    click.echo(f'Indeks pencarian dibangun ulang untuk {search.rebuild_index()} menu.')
 
 # Blok utama untuk menjalankan aplikasi Flask
 if __name__ == '__main__':
-    create_tables() 
+    app = create_app()
+    create_tables(app)
     app.run(debug=True)
@@ -0,0 +1,146 @@
+# archive.py
+
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import contains_eager, joinedload
+from database import upsert
+from models import db, Menu, Order, OrderItem, OrderArchive, OrderItemArchive, OrderArchiveSummary, KitchenTicket
+from jobs import jobs
+import kitchen
+
+# Arsip pesanan lama. Pesanan yang lebih tua dari ARCHIVE_AFTER_DAYS dipindahkan per
+# batch dari order/order_item ke order_archive/order_item_archive, sehingga tabel
+# yang dipakai checkout dan dashboard tetap kecil. Sebelum dipindah, jumlah dan
+# nilainya ditambahkan ke order_archive_summary. Rollup penjualan kantin tidak
+# berubah karena sudah mencakup seluruh riwayat.
+
+
+def archived_until():
+    """order_date terbaru di arsip, atau None jika arsip kosong (satu lookup indeks)."""
+    return db.session.execute(select(db.func.max(OrderArchive.order_date))).scalar()
+
+
+def reaches_archive(date_from):
+    # Arsip hanya perlu dibaca jika rentang tanggal menjangkau pesanan yang sudah diarsipkan
+    until = archived_until()
+    return until is not None and (date_from is None or date_from <= until)
+
+
+def _filters(order_model, date_from, date_to, status):
+    filters = []
+    if date_from:
+        filters.append(order_model.order_date >= date_from)
+    if date_to:
+        filters.append(order_model.order_date < date_to)
+    if status:
+        filters.append(order_model.status == status)
+    return filters
+
+
+def order_totals(date_from, date_to, status):
+    """(jumlah pesanan, total pendapatan) dari tabel aktif ditambah ringkasan arsip."""
+    count, revenue = db.session.query(
+        db.func.count(Order.id), db.func.coalesce(db.func.sum(Order.total_price), 0)
+    ).filter(*_filters(Order, date_from, date_to, status)).one()
+
+    summary_filters = []
+    if date_from:
+        summary_filters.append(OrderArchiveSummary.day >= date_from.date())
+    if date_to:
+        summary_filters.append(OrderArchiveSummary.day < date_to.date())
+    if status:
+        summary_filters.append(OrderArchiveSummary.status == status)
+    archived_count, archived_revenue = db.session.query(
+        db.func.coalesce(db.func.sum(OrderArchiveSummary.order_count), 0),
+        db.func.coalesce(db.func.sum(OrderArchiveSummary.revenue), 0)
+    ).filter(*summary_filters).one()
+    return count + archived_count, revenue + archived_revenue
+
+
+def order_sources(date_from, date_to, status):
+    """Sumber keyset_page_across untuk daftar pesanan admin: tabel aktif, lalu arsip bila perlu."""
+    sources = [(Order.query.options(joinedload(Order.customer)).filter(*_filters(Order, date_from, date_to, status)),
+                Order.order_date, Order.id)]
+    if reaches_archive(date_from):
+        sources.append((OrderArchive.query.options(joinedload(OrderArchive.customer))
+                        .filter(*_filters(OrderArchive, date_from, date_to, status)),
+                        OrderArchive.order_date, OrderArchive.id))
+    return sources
+
+
+def kantin_item_sources(kantin_id):
+    """Sumber keyset_page_across untuk daftar item pesanan satu kantin."""
+    # Tabel aktif dibaca lewat ix_order_item_kantin_recent, satu halaman tanpa sort
+    sources = [(db.session.query(OrderItem, Order).join(Order).join(Menu)
+                .options(contains_eager(OrderItem.menu)).filter(OrderItem.kantin_id == kantin_id),
+                OrderItem.order_date, OrderItem.id)]
+    if reaches_archive(None):
+        sources.append((db.session.query(OrderItemArchive, OrderArchive).join(OrderArchive).join(Menu)
+                        .options(contains_eager(OrderItemArchive.menu)).filter(Menu.kantin_id == kantin_id),
+                        OrderArchive.order_date, OrderItemArchive.id))
+    return sources
+
+
+def archive_batch(cutoff, batch_size):
+    """Pindahkan satu batch pesanan dengan order_date < cutoff ke arsip, tanpa commit.
+
+    Return jumlah pesanan yang dipindahkan. Setiap batch berdiri sendiri, jadi proses
+    yang terhenti cukup dijalankan lagi untuk melanjutkan.
+    """
+    order_ids = db.session.execute(
+        select(Order.id).where(Order.order_date < cutoff).order_by(Order.order_date, Order.id).limit(batch_size)
+    ).scalars().all()
+    if not order_ids:
+        return 0
+
+    summary = db.session.execute(
+        select(db.func.date(Order.order_date), db.func.coalesce(Order.status, 'pending'),
+               db.func.count(Order.id), db.func.sum(Order.total_price))
+        .where(Order.id.in_(order_ids))
+        .group_by(db.func.date(Order.order_date), db.func.coalesce(Order.status, 'pending'))
+    ).all()
+    stmt = upsert(OrderArchiveSummary)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['day', 'status'],
+        set_={'order_count': OrderArchiveSummary.order_count + stmt.excluded.order_count,
+              'revenue': OrderArchiveSummary.revenue + stmt.excluded.revenue}
+    )
+    db.session.execute(stmt, [
+        {'day': datetime.strptime(str(day), '%Y-%m-%d').date(), 'status': status, 'order_count': count, 'revenue': revenue}
+        for day, status, count, revenue in summary
+    ])
+
+    db.session.execute(insert(OrderArchive).from_select(
+        ['id', 'user_id', 'order_date', 'total_price', 'status'],
+        select(Order.id, Order.user_id, Order.order_date, Order.total_price, Order.status)
+        .where(Order.id.in_(order_ids))
+    ))
+    db.session.execute(insert(OrderItemArchive).from_select(
+        ['id', 'order_id', 'menu_id', 'quantity', 'price'],
+        select(OrderItem.id, OrderItem.order_id, OrderItem.menu_id, OrderItem.quantity, OrderItem.price)
+        .where(OrderItem.order_id.in_(order_ids))
+    ))
+    # Tiket dapur hanya relevan untuk pesanan yang masih berjalan; tiket yang belum siap
+    # melepas bebannya dari antrian kantin
+    kitchen.delete_tickets(KitchenTicket.order_id.in_(order_ids))
+    db.session.execute(delete(OrderItem).where(OrderItem.order_id.in_(order_ids)))
+    db.session.execute(delete(Order).where(Order.id.in_(order_ids)))
+    return len(order_ids)
+
+
+def archive_cutoff(days=None):
+    days = current_app.config['ARCHIVE_AFTER_DAYS'] if days is None else days
+    # Dibulatkan ke awal hari agar satu hari tidak terbelah antara tabel aktif dan arsip
+    return (datetime.utcnow() - timedelta(days=days)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+@jobs.task('archive_orders')
+def archive_orders(payload):
+    """Satu batch per job; jika masih ada sisa, job berikutnya di-enqueue dengan jeda
+    dalam transaksi yang sama sehingga pengarsipan bisa dilanjutkan setelah restart
+    dan tidak menahan kunci tulis lama-lama di antara checkout."""
+    cutoff = datetime.fromisoformat(payload['cutoff'])
+    batch_size = payload.get('batch_size') or current_app.config['ARCHIVE_BATCH_SIZE']
+    if archive_batch(cutoff, batch_size) == batch_size:
+        jobs.enqueue('archive_orders', payload, delay=current_app.config['ARCHIVE_BATCH_PAUSE'])
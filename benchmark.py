@@ -0,0 +1,504 @@
+# benchmark.py
+#
+# Benchmark beban jam makan siang (lunch rush).
+#
+#   python benchmark.py seed --database /tmp/bench.db
+#   python benchmark.py run --database /tmp/bench.db --threads 32 --duration 60
+#   python benchmark.py run --database /tmp/bench.db --base-url http://127.0.0.1:8000
+#   python benchmark.py seed --database /tmp/year.db --days 365 && python benchmark.py analytics --database /tmp/year.db
+#   python benchmark.py login --database /tmp/bench.db --threads 32 --duration 20
+#
+# Tanpa --base-url, beban dijalankan di dalam proses memakai Flask test client.
+# Dengan --base-url, beban dikirim lewat HTTP ke server yang memakai database yang
+# sama. Setelah beban selesai, invarian data diperiksa langsung di database dan
+# hasilnya disimpan sebagai JSON agar bisa dibandingkan antar commit.
+
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime, timedelta
+
+BENCH_PASSWORD = 'bench123'
+
+SEARCH_TERMS = ['nasi', 'ayam', 'mie', 'goreng', 'es', 'soto', 'bakso', 'sate', 'teh', 'pedas']
+DISHES = ['Nasi Goreng', 'Mie Ayam', 'Ayam Geprek', 'Soto Ayam', 'Bakso Urat', 'Sate Ayam',
+          'Nasi Uduk', 'Gado Gado', 'Es Teh', 'Es Jeruk', 'Kopi Susu', 'Nasi Rames']
+VARIANTS = ['Spesial', 'Pedas', 'Jumbo', 'Komplit', 'Original', 'Keju', 'Telur', 'Sapi']
+
+
+def _load_app(database):
+    # Konfigurasi dibaca dari environment saat config.py diimpor
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.abspath(database)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as app_module
+    return app_module
+
+
+def seed(args):
+    app_module = _load_app(args.database)
+    app = app_module.create_app()
+    from sqlalchemy import insert
+    from werkzeug.security import generate_password_hash
+    from models import db, User, Kantin, Menu, Order, OrderItem, Rating
+    import migrations
+    import rollup
+    import search
+
+    rng = random.Random(args.seed)
+    app_module.create_tables(app)
+    with app.app_context():
+        if User.query.filter(User.username.like('bench_%')).first():
+            print('Database sudah berisi data benchmark, seed dilewati.')
+            return
+
+        started = time.perf_counter()
+        # Satu hash untuk semua user benchmark, hashing per user terlalu lambat untuk seed
+        password_hash = generate_password_hash(BENCH_PASSWORD)
+
+        first_user_id = (db.session.query(db.func.max(User.id)).scalar() or 0) + 1
+        users = [{'id': first_user_id + i, 'username': f'bench_user{i}', 'email': f'bench_user{i}@bench.local',
+                  'password_hash': password_hash, 'role': 'customer'} for i in range(args.users)]
+        staff = [{'id': first_user_id + args.users + i, 'username': f'bench_kantin{i}',
+                  'email': f'bench_kantin{i}@bench.local', 'password_hash': password_hash, 'role': 'kantin'}
+                 for i in range(args.kantins)]
+        db.session.execute(insert(User), users + staff)
+
+        first_kantin_id = (db.session.query(db.func.max(Kantin.id)).scalar() or 0) + 1
+        kantins = [{'id': first_kantin_id + i, 'name': f'Kantin Bench {i}', 'location': f'Blok {i % 10}',
+                    'user_id': staff[i]['id'], 'last_order_at': datetime.utcnow()} for i in range(args.kantins)]
+        db.session.execute(insert(Kantin), kantins)
+
+        first_menu_id = (db.session.query(db.func.max(Menu.id)).scalar() or 0) + 1
+        menus = []
+        for kantin in kantins:
+            for _ in range(args.menus_per_kantin):
+                dish = f'{rng.choice(DISHES)} {rng.choice(VARIANTS)}'
+                menus.append({'id': first_menu_id + len(menus), 'name': dish,
+                              'description': f'{dish} dari {kantin["name"]}, porsi pas untuk makan siang.',
+                              'price': rng.randrange(5, 40) * 1000, 'stock': rng.randrange(50, 500),
+                              'kantin_id': kantin['id'], 'image_url': 'images/nasi_goreng.jpg'})
+        db.session.execute(insert(Menu), menus)
+
+        # Riwayat pesanan beberapa bulan, terpusat di sekitar jam makan siang
+        first_order_id = (db.session.query(db.func.max(Order.id)).scalar() or 0) + 1
+        now = datetime.utcnow()
+        orders, items = [], []
+        for day in range(args.days, 0, -1):
+            day_start = (now - timedelta(days=day)).replace(hour=0, minute=0, second=0, microsecond=0)
+            for _ in range(args.orders_per_day):
+                minute = int(min(max(rng.gauss(12 * 60, 90), 7 * 60), 20 * 60))
+                order_id = first_order_id + len(orders)
+                order_date = day_start + timedelta(minutes=minute, seconds=rng.randrange(60))
+                total = 0
+                for menu in rng.sample(menus, rng.randint(1, 4)):
+                    quantity = rng.randint(1, 3)
+                    total += menu['price'] * quantity
+                    items.append({'order_id': order_id, 'menu_id': menu['id'], 'quantity': quantity,
+                                  'price': menu['price'], 'kantin_id': menu['kantin_id'], 'order_date': order_date})
+                orders.append({'id': order_id, 'user_id': rng.choice(users)['id'], 'total_price': total,
+                               'status': 'completed', 'order_date': order_date})
+        for start in range(0, len(orders), 5000):
+            db.session.execute(insert(Order), orders[start:start + 5000])
+        for start in range(0, len(items), 5000):
+            db.session.execute(insert(OrderItem), items[start:start + 5000])
+
+        ratings = {}
+        for _ in range(args.ratings):
+            user_id = rng.choice(users)['id']
+            menu_id = rng.choice(menus)['id']
+            ratings[(user_id, menu_id)] = {'user_id': user_id, 'menu_id': menu_id, 'score': rng.randint(1, 5),
+                                           'comment': '', 'rating_date': now - timedelta(days=rng.randrange(args.days))}
+        db.session.execute(insert(Rating), list(ratings.values()))
+        db.session.commit()
+
+        with db.engine.begin() as conn:
+            migrations.recompute_rating_aggregates(conn)
+        rollup.rebuild_rollup()
+        search.rebuild_index()
+
+        print(f'Seed selesai dalam {time.perf_counter() - started:.1f} detik: {len(users)} user, '
+              f'{len(kantins)} kantin, {len(menus)} menu, {len(orders)} pesanan, {len(items)} item, '
+              f'{len(ratings)} rating.')
+
+
+class InProcessClient:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None):
+        response = self.client.open(path, method=method, data=data)
+        # Baca seluruh body agar waktu render ikut terukur
+        response.get_data()
+        return response.status_code
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class HttpClient:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect()
+        )
+
+    def request(self, method, path, data=None):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        req = urllib.request.Request(self.base_url + path, data=body, method=method)
+        try:
+            with self.opener.open(req, timeout=30) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as error:
+            error.read()
+            return error.code
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}   # route -> [detik]
+        self.errors = {}    # route -> jumlah respons 5xx / exception
+
+    def record(self, route, elapsed, ok):
+        with self._lock:
+            self.samples.setdefault(route, []).append(elapsed)
+            if not ok:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+
+def _timed(recorder, client, route, method, path, data=None):
+    started = time.perf_counter()
+    try:
+        status = client.request(method, path, data)
+        ok = status < 500
+    except Exception:
+        ok = False
+    recorder.record(route, time.perf_counter() - started, ok)
+
+
+def _customer(client, recorder, rng, menu_ids, deadline):
+    while time.perf_counter() < deadline:
+        roll = rng.random()
+        if roll < 0.45:
+            _timed(recorder, client, 'GET /menu', 'GET', '/menu')
+        elif roll < 0.55:
+            _timed(recorder, client, 'GET /menu?sort=popular', 'GET', '/menu?sort=popular')
+        elif roll < 0.70:
+            _timed(recorder, client, 'GET /menu?q', 'GET', '/menu?q=' + rng.choice(SEARCH_TERMS))
+        elif roll < 0.90:
+            menu_id = rng.choice(menu_ids)
+            _timed(recorder, client, 'POST /add_to_cart', 'POST', f'/add_to_cart/{menu_id}', {'quantity': rng.randint(1, 2)})
+        elif roll < 0.95:
+            _timed(recorder, client, 'GET /cart', 'GET', '/cart')
+        else:
+            _timed(recorder, client, 'POST /checkout', 'POST', '/checkout', {})
+
+
+def _staff(client, recorder, rng, deadline):
+    while time.perf_counter() < deadline:
+        roll = rng.random()
+        if roll < 0.5:
+            _timed(recorder, client, 'GET /dashboard (kantin)', 'GET', '/dashboard')
+        elif roll < 0.7:
+            _timed(recorder, client, 'GET /kantin/kitchen', 'GET', '/kantin/kitchen')
+        else:
+            # Staf dapur memajukan beberapa tiket berikutnya sekaligus
+            action = rng.choice(['start', 'ready', 'pickup'])
+            _timed(recorder, client, 'POST /kantin/kitchen/advance', 'POST', '/kantin/kitchen/advance',
+                   {'action': action, 'count': rng.randint(1, 5)})
+        time.sleep(rng.uniform(0.05, 0.2))
+
+
+def _percentile(sorted_samples, pct):
+    if not sorted_samples:
+        return None
+    index = max(0, min(len(sorted_samples) - 1, int(round(pct / 100.0 * len(sorted_samples) + 0.5)) - 1))
+    return sorted_samples[index]
+
+
+def check_invariants(db):
+    from sqlalchemy import text
+    negative_stock = db.session.execute(text('SELECT count(*) FROM menu WHERE stock < 0')).scalar()
+    mismatched_totals = db.session.execute(text(
+        'SELECT count(*) FROM "order" o LEFT JOIN '
+        '(SELECT order_id, sum(quantity * price) AS items_total FROM order_item GROUP BY order_id) i '
+        'ON i.order_id = o.id '
+        'WHERE abs(o.total_price - coalesce(i.items_total, 0)) > 0.005'
+    )).scalar()
+    # Menu.reserved harus sama dengan total reservasi aktif menu itu
+    mismatched_reserved = db.session.execute(text(
+        'SELECT count(*) FROM menu m LEFT JOIN '
+        '(SELECT menu_id, sum(quantity) AS held FROM stock_reservation GROUP BY menu_id) r '
+        'ON r.menu_id = m.id WHERE m.reserved != coalesce(r.held, 0)'
+    )).scalar()
+    # Kantin.queue_seconds harus sama dengan total perkiraan tiket dapur yang belum siap
+    mismatched_queue = db.session.execute(text(
+        'SELECT count(*) FROM kantin k LEFT JOIN '
+        "(SELECT kantin_id, sum(estimated_seconds) AS work FROM kitchen_ticket "
+        "WHERE status IN ('queued', 'preparing') GROUP BY kantin_id) t "
+        'ON t.kantin_id = k.id WHERE abs(k.queue_seconds - coalesce(t.work, 0)) > 0.01'
+    )).scalar()
+    return {'negative_stock_menus': negative_stock, 'orders_with_mismatched_total': mismatched_totals,
+            'menus_with_mismatched_reserved': mismatched_reserved,
+            'kantins_with_mismatched_queue': mismatched_queue,
+            'ok': negative_stock == 0 and mismatched_totals == 0 and mismatched_reserved == 0 and mismatched_queue == 0}
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    app_module = _load_app(args.database)
+    app = app_module.create_app()
+    from models import db, Menu, User
+
+    if not args.base_url:
+        # Database hasil seed versi lama perlu tabel dan migrasi terbaru
+        app_module.create_tables(app)
+    with app.app_context():
+        menu_ids = [row[0] for row in db.session.query(Menu.id).filter(Menu.stock > 0).all()]
+        customers = [row[0] for row in db.session.query(User.username).filter(User.username.like('bench_user%')).all()]
+        staff = [row[0] for row in db.session.query(User.username).filter(User.username.like('bench_kantin%')).all()]
+        orders_before = db.session.execute(db.text('SELECT count(*) FROM "order"')).scalar()
+    if not customers or not staff:
+        sys.exit('Database belum berisi data benchmark, jalankan `python benchmark.py seed` dulu.')
+
+    def make_client():
+        return HttpClient(args.base_url) if args.base_url else InProcessClient(app)
+
+    recorder = Recorder()
+    rng = random.Random(args.seed)
+    staff_threads = max(1, int(args.threads * args.staff_ratio))
+    workers = []
+    for i in range(args.threads):
+        client = make_client()
+        worker_rng = random.Random(rng.random())
+        if i < staff_threads:
+            client.request('POST', '/login', {'username': staff[i % len(staff)], 'password': BENCH_PASSWORD})
+            workers.append((_staff, (client, recorder, worker_rng)))
+        else:
+            client.request('POST', '/login', {'username': customers[i % len(customers)], 'password': BENCH_PASSWORD})
+            workers.append((_customer, (client, recorder, worker_rng, menu_ids)))
+
+    started = time.perf_counter()
+    deadline = started + args.duration
+    threads = [threading.Thread(target=target, args=target_args + (deadline,)) for target, target_args in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    routes = {}
+    for route, samples in sorted(recorder.samples.items()):
+        samples.sort()
+        routes[route] = {
+            'requests': len(samples),
+            'errors': recorder.errors.get(route, 0),
+            'throughput_rps': round(len(samples) / elapsed, 2),
+            'p50_ms': round(_percentile(samples, 50) * 1000, 2),
+            'p95_ms': round(_percentile(samples, 95) * 1000, 2),
+            'p99_ms': round(_percentile(samples, 99) * 1000, 2),
+        }
+
+    with app.app_context():
+        invariants = check_invariants(db)
+        orders_after = db.session.execute(db.text('SELECT count(*) FROM "order"')).scalar()
+
+    result = {
+        'commit': _git_commit(),
+        'timestamp': datetime.utcnow().isoformat(),
+        'mode': 'http' if args.base_url else 'in-process',
+        'threads': args.threads,
+        'duration_s': round(elapsed, 2),
+        'orders_created': orders_after - orders_before,
+        'routes': routes,
+        'invariants': invariants,
+    }
+
+    print(f"{'route':<28}{'req':>8}{'err':>6}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for route, stats in routes.items():
+        print(f"{route:<28}{stats['requests']:>8}{stats['errors']:>6}{stats['throughput_rps']:>9}"
+              f"{stats['p50_ms']:>9}{stats['p95_ms']:>9}{stats['p99_ms']:>9}")
+    print(f"Pesanan baru: {result['orders_created']}, invarian: {invariants}")
+
+    output = args.output or os.path.join('bench_results', f"{result['commit'] or 'nocommit'}-{int(time.time())}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(result, f, indent=2)
+    print(f'Hasil disimpan di {output}')
+    if not invariants['ok']:
+        sys.exit(1)
+
+
+def analytics_bench(args):
+    app_module = _load_app(args.database)
+    app = app_module.create_app()
+    from models import db, Kantin
+    from analytics import analytics
+
+    app_module.create_tables(app)
+    with app.app_context():
+        kantin_ids = [row[0] for row in db.session.query(Kantin.id).order_by(Kantin.id).all()]
+        timings = {}
+
+        def timed(name, fn):
+            best = None
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                fn()
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            timings[name] = round(best * 1000, 2)
+
+        def full_load():
+            analytics.reset()
+            analytics.refresh(force=True)
+
+        def compute_all():
+            analytics._results = {}
+            analytics.summary()
+
+        def compute_per_kantin():
+            analytics._results = {}
+            for kantin_id in kantin_ids:
+                analytics.summary(kantin_id)
+
+        timed('load_ms', full_load)
+        timed('summary_all_ms', compute_all)
+        timed('summary_per_kantin_ms', compute_per_kantin)
+        timed('incremental_refresh_ms', lambda: analytics.refresh(force=True))
+        stats = analytics.stats()
+
+    total = timings['load_ms'] + timings['summary_all_ms']
+    print(f"{stats['items']} item pesanan, {len(kantin_ids)} kantin")
+    for name, value in timings.items():
+        print(f'{name:<26}{value:>10} ms')
+    print(f'Pemuatan awal + agregat semua kantin: {total:.1f} ms (anggaran {args.budget_ms:.0f} ms)')
+    if total > args.budget_ms:
+        sys.exit(1)
+
+
+def _login_storm(client, recorder, rng, customers, deadline):
+    while time.perf_counter() < deadline:
+        username = rng.choice(customers)
+        # Sebagian kecil salah ketik password, tetap harus di-hash
+        password = BENCH_PASSWORD if rng.random() < 0.9 else BENCH_PASSWORD + 'x'
+        _timed(recorder, client, 'POST /login', 'POST', '/login', {'username': username, 'password': password})
+
+
+def _browse(client, recorder, rng, deadline):
+    while time.perf_counter() < deadline:
+        _timed(recorder, client, 'GET /menu', 'GET', '/menu')
+
+
+def login_bench(args):
+    # Semua request in-process datang dari satu alamat; batas per IP dinaikkan agar yang
+    # terukur adalah antrian hashing, bukan throttle
+    if not args.base_url:
+        os.environ.setdefault('LOGIN_MAX_ATTEMPTS_PER_IP', str(10 ** 9))
+    app_module = _load_app(args.database)
+    app = app_module.create_app()
+    from models import db, User
+    from passwords import passwords
+
+    if not args.base_url:
+        app_module.create_tables(app)
+    with app.app_context():
+        customers = [row[0] for row in db.session.query(User.username).filter(User.username.like('bench_user%')).all()]
+    if not customers:
+        sys.exit('Database belum berisi data benchmark, jalankan `python benchmark.py seed` dulu.')
+
+    def make_client():
+        return HttpClient(args.base_url) if args.base_url else InProcessClient(app)
+
+    recorder = Recorder()
+    rng = random.Random(args.seed)
+    deadline = time.perf_counter() + args.duration
+    threads = [threading.Thread(target=_login_storm, args=(make_client(), recorder, random.Random(rng.random()),
+                                                           customers, deadline)) for _ in range(args.threads)]
+    threads += [threading.Thread(target=_browse, args=(make_client(), recorder, random.Random(rng.random()), deadline))
+                for _ in range(args.browse_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    print(f"{'route':<28}{'req':>8}{'err':>6}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for route, samples in sorted(recorder.samples.items()):
+        samples.sort()
+        print(f"{route:<28}{len(samples):>8}{recorder.errors.get(route, 0):>6}"
+              f"{_percentile(samples, 50) * 1000:>9.1f}{_percentile(samples, 95) * 1000:>9.1f}"
+              f"{_percentile(samples, 99) * 1000:>9.1f}")
+    if not args.base_url:
+        print(f'Hashing password: {passwords.stats()}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark beban jam makan siang FoodCourt.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    seed_parser = subparsers.add_parser('seed', help='Isi database dengan data realistis')
+    seed_parser.add_argument('--database', default='bench.db')
+    seed_parser.add_argument('--kantins', type=int, default=30)
+    seed_parser.add_argument('--menus-per-kantin', type=int, default=100)
+    seed_parser.add_argument('--users', type=int, default=500)
+    seed_parser.add_argument('--days', type=int, default=90)
+    seed_parser.add_argument('--orders-per-day', type=int, default=300)
+    seed_parser.add_argument('--ratings', type=int, default=20000)
+    seed_parser.add_argument('--seed', type=int, default=42)
+
+    run_parser = subparsers.add_parser('run', help='Jalankan beban campuran dan periksa invarian')
+    run_parser.add_argument('--database', default='bench.db')
+    run_parser.add_argument('--base-url', help='Kirim beban lewat HTTP ke server ini')
+    run_parser.add_argument('--threads', type=int, default=16)
+    run_parser.add_argument('--staff-ratio', type=float, default=0.1,
+                            help='Porsi thread yang berperan sebagai staf kantin')
+    run_parser.add_argument('--duration', type=float, default=30)
+    run_parser.add_argument('--output', help='Path file JSON hasil')
+    run_parser.add_argument('--seed', type=int, default=42)
+
+    analytics_parser = subparsers.add_parser('analytics', help='Ukur waktu pemuatan dan agregat analitik penjualan')
+    analytics_parser.add_argument('--database', default='bench.db')
+    analytics_parser.add_argument('--repeat', type=int, default=3, help='Ambil waktu terbaik dari N percobaan')
+    analytics_parser.add_argument('--budget-ms', type=float, default=1000)
+
+    login_parser = subparsers.add_parser('login', help='Badai login bersamaan sambil mengukur /menu')
+    login_parser.add_argument('--database', default='bench.db')
+    login_parser.add_argument('--base-url', help='Kirim beban lewat HTTP ke server ini')
+    login_parser.add_argument('--threads', type=int, default=32, help='Thread yang terus-menerus login')
+    login_parser.add_argument('--browse-threads', type=int, default=4, help='Thread yang membuka /menu')
+    login_parser.add_argument('--duration', type=float, default=20)
+    login_parser.add_argument('--seed', type=int, default=42)
+
+    args = parser.parse_args()
+    if args.command == 'seed':
+        seed(args)
+    elif args.command == 'analytics':
+        analytics_bench(args)
+    elif args.command == 'login':
+        login_bench(args)
+    else:
+        run(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+# cart_store.py
+
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import case, delete
+from database import upsert
+from jobs import jobs
+from models import db, CartItem
+
+
+class MemoryCartStore:
+    """Keranjang di memori proses, kedaluwarsa setelah `ttl` detik tanpa perubahan."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._carts = {}        # user_id -> (items {menu_id: quantity}, expires_at)
+        self._next_sweep = 0.0
+
+    def _sweep(self, now):
+        # Buang keranjang kedaluwarsa paling sering sekali per menit, bukan di setiap akses
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + 60
+        for user_id in [u for u, (_, expires_at) in self._carts.items() if expires_at <= now]:
+            del self._carts[user_id]
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            self._sweep(now)
+            cart = self._carts.get(user_id)
+            if cart is None or cart[1] <= now:
+                return {}
+            return dict(cart[0])
+
+    def add(self, user_id, menu_id, quantity):
+        now = time.monotonic()
+        with self._lock:
+            cart = self._carts.get(user_id)
+            items = cart[0] if cart is not None and cart[1] > now else {}
+            items[menu_id] = items.get(menu_id, 0) + quantity
+            self._carts[user_id] = (items, now + self.ttl)
+            return items[menu_id]
+
+    def add_many(self, user_id, quantities):
+        now = time.monotonic()
+        with self._lock:
+            cart = self._carts.get(user_id)
+            items = cart[0] if cart is not None and cart[1] > now else {}
+            for menu_id, quantity in quantities.items():
+                items[menu_id] = items.get(menu_id, 0) + quantity
+            self._carts[user_id] = (items, now + self.ttl)
+            return {menu_id: items[menu_id] for menu_id in quantities}
+
+    def set(self, user_id, menu_id, quantity):
+        now = time.monotonic()
+        with self._lock:
+            cart = self._carts.get(user_id)
+            items = cart[0] if cart is not None and cart[1] > now else {}
+            if quantity > 0:
+                items[menu_id] = quantity
+            else:
+                items.pop(menu_id, None)
+            self._carts[user_id] = (items, now + self.ttl)
+
+    def clear(self, user_id):
+        with self._lock:
+            self._carts.pop(user_id, None)
+
+    def purge_expired(self):
+        with self._lock:
+            before = len(self._carts)
+            self._next_sweep = 0.0
+            self._sweep(time.monotonic())
+            return before - len(self._carts)
+
+
+class DatabaseCartStore:
+    """Keranjang di tabel cart_item, bertahan walau aplikasi di-restart dan dibagi antar worker."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+
+    def _cutoff(self):
+        return datetime.utcnow() - timedelta(seconds=self.ttl)
+
+    def _accumulate(self, stmt):
+        # Baris kedaluwarsa (tersembunyi dari get()) diganti, bukan ditambah, agar keranjang
+        # lama tidak muncul lagi dengan jumlah yang tidak lagi ditahan reservasi
+        return {'quantity': case((CartItem.updated_at <= self._cutoff(), stmt.excluded.quantity),
+                                 else_=CartItem.quantity + stmt.excluded.quantity),
+                'updated_at': stmt.excluded.updated_at}
+
+    def get(self, user_id):
+        rows = db.session.query(CartItem.menu_id, CartItem.quantity).filter(
+            CartItem.user_id == user_id, CartItem.updated_at > self._cutoff()
+        ).all()
+        return dict(rows)
+
+    def add(self, user_id, menu_id, quantity):
+        stmt = upsert(CartItem).values(
+            user_id=user_id, menu_id=menu_id, quantity=quantity, updated_at=datetime.utcnow()
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['user_id', 'menu_id'], set_=self._accumulate(stmt)
+        ).returning(CartItem.quantity)
+        new_quantity = db.session.execute(stmt).scalar()
+        db.session.commit()
+        return new_quantity
+
+    def add_many(self, user_id, quantities):
+        # Satu upsert executemany dan satu commit untuk seluruh item
+        now = datetime.utcnow()
+        stmt = upsert(CartItem)
+        stmt = stmt.on_conflict_do_update(index_elements=['user_id', 'menu_id'], set_=self._accumulate(stmt))
+        db.session.execute(stmt, [
+            {'user_id': user_id, 'menu_id': menu_id, 'quantity': quantity, 'updated_at': now}
+            for menu_id, quantity in quantities.items()
+        ])
+        rows = db.session.query(CartItem.menu_id, CartItem.quantity).filter(
+            CartItem.user_id == user_id, CartItem.menu_id.in_(list(quantities))
+        ).all()
+        db.session.commit()
+        return dict(rows)
+
+    def set(self, user_id, menu_id, quantity):
+        if quantity > 0:
+            stmt = upsert(CartItem).values(
+                user_id=user_id, menu_id=menu_id, quantity=quantity, updated_at=datetime.utcnow()
+            )
+            db.session.execute(stmt.on_conflict_do_update(
+                index_elements=['user_id', 'menu_id'],
+                set_={'quantity': stmt.excluded.quantity, 'updated_at': stmt.excluded.updated_at}
+            ))
+        else:
+            db.session.execute(delete(CartItem).where(CartItem.user_id == user_id, CartItem.menu_id == menu_id))
+        db.session.commit()
+
+    def clear(self, user_id):
+        db.session.execute(delete(CartItem).where(CartItem.user_id == user_id))
+        db.session.commit()
+
+    def purge_expired(self):
+        # Tanpa commit: dijalankan job purge_carts dan di-commit bersama penghapusan job
+        result = db.session.execute(delete(CartItem).where(CartItem.updated_at <= self._cutoff()))
+        return result.rowcount
+
+
+class CartStore:
+    """Pintu masuk keranjang server-side; backend dipilih lewat config CART_STORE."""
+
+    backends = {'memory': MemoryCartStore, 'database': DatabaseCartStore}
+
+    def __init__(self, app=None):
+        self.backend = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = app.config.get('CART_STORE', 'memory')
+        self.backend = self.backends[backend](app.config.get('CART_TTL', 3 * 60 * 60))
+        app.extensions['cart_store'] = self
+
+    def get(self, user_id):
+        return self.backend.get(user_id)
+
+    def add(self, user_id, menu_id, quantity):
+        return self.backend.add(user_id, menu_id, quantity)
+
+    def add_many(self, user_id, quantities):
+        # quantities: {menu_id: jumlah}; return {menu_id: jumlah_baru_di_keranjang}
+        return self.backend.add_many(user_id, quantities)
+
+    def set(self, user_id, menu_id, quantity):
+        self.backend.set(user_id, menu_id, quantity)
+
+    def clear(self, user_id):
+        self.backend.clear(user_id)
+
+    def purge_expired(self):
+        # Return jumlah keranjang/baris yang dibuang
+        return self.backend.purge_expired()
+
+
+cart_store = CartStore()
+
+
+@jobs.periodic('purge_carts', 'CART_PURGE_INTERVAL')
+def purge_expired_carts(payload):
+    # Backend 'database' dibersihkan untuk semua worker sekaligus. Backend 'memory' hanya
+    # dibersihkan di worker yang menjalankan job ini; worker lain menyapu sendiri saat diakses
+    cart_store.purge_expired()
@@ -0,0 +1,186 @@
+# catalog.py
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import select
+from models import db, Kantin, Menu
+
+
+def _load_entries(menu_ids=None):
+    # Satu query untuk menu + nama kantin + agregat rating, tanpa lazy load per kartu
+    stmt = select(
+        Menu.id, Menu.name, Menu.description, Menu.price, Menu.stock, Menu.image_url,
+        Menu.kantin_id, Menu.rating_count, Menu.rating_sum, Menu.reserved, Kantin.name.label('kantin_name')
+    ).outerjoin(Kantin, Kantin.id == Menu.kantin_id).order_by(Menu.id)
+    if menu_ids is not None:
+        stmt = stmt.where(Menu.id.in_(list(menu_ids)))
+
+    entries = []
+    for row in db.session.execute(stmt):
+        entry = dict(row._mapping)
+        entry['stock'] = entry['stock'] or 0
+        entry['rating_avg'] = entry['rating_sum'] / entry['rating_count'] if entry['rating_count'] else None
+        _set_available(entry)
+        entries.append(entry)
+    return entries
+
+
+# Field yang tampil di kartu menu; versi entri hanya berubah jika salah satunya berubah
+VERSIONED_FIELDS = ('id', 'name', 'description', 'price', 'available', 'image_url',
+                    'kantin_name', 'rating_count', 'rating_avg')
+
+
+def _set_available(entry):
+    # Stok yang bisa dipesan: stok dikurangi yang sedang ditahan keranjang lain
+    entry['available'] = max(entry['stock'] - entry['reserved'], 0)
+    # Versi dihitung dari isi, jadi sama di semua worker untuk isi yang sama (kunci
+    # cache fragmen kartu menu dan ETag halaman menu)
+    entry['version'] = hashlib.blake2b(repr(tuple(entry[field] for field in VERSIONED_FIELDS)).encode(),
+                                       digest_size=8).hexdigest()
+
+
+class CatalogCache:
+    """Cache katalog menu di memori proses (read-through).
+
+    Entri berupa dict dengan field yang dipakai menu.html. Penulisan menu
+    memanggil invalidate(menu_id) sehingga hanya menu itu yang dimuat ulang
+    pada pembacaan berikutnya; checkout dan kelola stok cukup menambal stok
+    di tempat. Setiap worker punya cache sendiri, TTL membatasi seberapa lama
+    perubahan dari worker lain bisa terlambat terlihat.
+    """
+
+    def __init__(self, app=None):
+        self.ttl = 60
+        self.max_entries = 50000
+        self._lock = threading.RLock()
+        self._entries = OrderedDict()   # menu_id -> (entry, loaded_at), urutan LRU
+        self._pending = set()           # menu_id yang harus dimuat ulang
+        self._complete = False          # True jika _entries berisi seluruh katalog
+        self._complete_at = 0.0
+        self._listing = None            # daftar entri terurut id, dibangun ulang saat keanggotaan berubah
+        self.revision = 0               # naik setiap isi cache berubah
+        self.changed_at = time.time()   # waktu (epoch) perubahan terakhir, untuk Last-Modified
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config.get('CATALOG_CACHE_TTL', self.ttl)
+        self.max_entries = app.config.get('CATALOG_CACHE_MAX_ENTRIES', self.max_entries)
+        app.extensions['catalog_cache'] = self
+
+    def _store(self, entries, now):
+        for entry in entries:
+            self._entries[entry['id']] = (entry, now)
+            self._entries.move_to_end(entry['id'])
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+            self._complete = False
+        self._listing = None
+        self._bump()
+
+    def _bump(self):
+        self.revision += 1
+        self.changed_at = time.time()
+
+    def all_menus(self):
+        """Seluruh katalog terurut berdasarkan Menu.id."""
+        now = time.monotonic()
+        with self._lock:
+            if self._complete and now - self._complete_at < self.ttl:
+                if self._pending:
+                    pending = self._pending
+                    self._pending = set()
+                    for menu_id in pending:
+                        self._entries.pop(menu_id, None)
+                    self._store(_load_entries(pending), now)
+                    self.misses += 1
+                else:
+                    self.hits += 1
+                if self._listing is None:
+                    self._listing = sorted((entry for entry, _ in self._entries.values()), key=lambda e: e['id'])
+                return self._listing
+
+            self.misses += 1
+            entries = _load_entries()
+            self._entries.clear()
+            self._pending.clear()
+            self._store(entries, now)
+            if len(entries) <= self.max_entries:
+                self._complete = True
+                self._complete_at = now
+                self._listing = entries
+            return entries
+
+    def get_many(self, menu_ids):
+        """Entri untuk menu_ids dengan urutan yang sama; id yang tidak ada dilewati."""
+        now = time.monotonic()
+        with self._lock:
+            found = {}
+            missing = []
+            for menu_id in menu_ids:
+                cached = self._entries.get(menu_id)
+                if cached is not None and menu_id not in self._pending and now - cached[1] < self.ttl:
+                    self._entries.move_to_end(menu_id)
+                    found[menu_id] = cached[0]
+                    self.hits += 1
+                else:
+                    missing.append(menu_id)
+            if missing:
+                self.misses += len(missing)
+                self._pending.difference_update(missing)
+                loaded = _load_entries(missing)
+                self._store(loaded, now)
+                found.update((entry['id'], entry) for entry in loaded)
+            return [found[menu_id] for menu_id in menu_ids if menu_id in found]
+
+    def invalidate(self, menu_id):
+        # Menu ditambah, diedit, dihapus, atau ratingnya berubah
+        with self._lock:
+            if self._entries.pop(menu_id, None) is not None:
+                self._listing = None
+            self._pending.add(menu_id)
+            self._bump()
+
+    def patch_stock(self, changes, absolute=False):
+        # changes: {menu_id: delta} atau {menu_id: stok_baru} jika absolute=True
+        with self._lock:
+            for menu_id, value in changes.items():
+                cached = self._entries.get(menu_id)
+                if cached is not None:
+                    entry = cached[0]
+                    entry['stock'] = value if absolute else entry['stock'] + value
+                    _set_available(entry)
+            self._bump()
+
+    def patch_reserved(self, changes, absolute=False):
+        # changes: {menu_id: delta reservasi} atau {menu_id: reservasi_baru} jika absolute=True
+        with self._lock:
+            for menu_id, value in changes.items():
+                cached = self._entries.get(menu_id)
+                if cached is not None and (value or absolute):
+                    entry = cached[0]
+                    entry['reserved'] = value if absolute else max(entry['reserved'] + value, 0)
+                    _set_available(entry)
+            self._bump()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._pending.clear()
+            self._complete = False
+            self._listing = None
+            self._bump()
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits,
+                    'misses': self.misses, 'evictions': self.evictions}
+
+
+catalog_cache = CatalogCache()
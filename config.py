@@ -2,7 +2,141 @@
 
 import os
 
+
+def _engine_options(database_uri):
+    # SQLite in-memory memakai satu koneksi statis, opsi pool tidak berlaku
+    if database_uri in ('sqlite://', 'sqlite:///:memory:'):
+        return {}
+    return {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 20)),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': True,
+    }
+
+
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'kunci-rahasia-super-sulit-ditebak-jangan-pakai-ini-di-produksi-asli-sialan'
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///foodcourt.db'
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///foodcourt.db'
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Pool koneksi per worker
+    SQLALCHEMY_ENGINE_OPTIONS = _engine_options(SQLALCHEMY_DATABASE_URI)
+
+    # Pragma SQLite yang dipasang di setiap koneksi baru
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+    SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB', 64 * 1024))
+
+    # Percobaan ulang transaksi tulis saat database terkunci, dan batas
+    # waktu (ms) penulisan yang dicatat di log sebagai tunggu kunci
+    DB_LOCK_RETRIES = int(os.environ.get('DB_LOCK_RETRIES', 3))
+    DB_LOCK_WAIT_LOG_MS = int(os.environ.get('DB_LOCK_WAIT_LOG_MS', 200))
+
+    # Cache katalog menu di memori (detik / jumlah entri maksimum)
+    CATALOG_CACHE_TTL = int(os.environ.get('CATALOG_CACHE_TTL', 60))
+    CATALOG_CACHE_MAX_ENTRIES = int(os.environ.get('CATALOG_CACHE_MAX_ENTRIES', 50000))
+
+    # Jumlah baris per halaman pada daftar pesanan dashboard
+    ORDERS_PER_PAGE = int(os.environ.get('ORDERS_PER_PAGE', 50))
+
+    # Notifikasi pesanan baru (SSE). 'memory' untuk satu proses,
+    # 'database' agar event tersampaikan antar beberapa worker.
+    ORDER_EVENTS_BACKEND = os.environ.get('ORDER_EVENTS_BACKEND', 'memory')
+    ORDER_EVENTS_QUEUE_SIZE = 100
+    ORDER_EVENTS_HEARTBEAT = 15
+    ORDER_EVENTS_POLL_INTERVAL = 1.0
+
+    # Keranjang server-side: 'memory' (per proses) atau 'database' (tabel cart_item,
+    # bertahan saat restart dan dibagi antar worker). Kedaluwarsa dalam detik.
+    CART_STORE = os.environ.get('CART_STORE', 'memory')
+    CART_TTL = int(os.environ.get('CART_TTL', 3 * 60 * 60))
+    # Interval job berkala purge_carts yang membuang keranjang kedaluwarsa (detik)
+    CART_PURGE_INTERVAL = int(os.environ.get('CART_PURGE_INTERVAL', 5 * 60))
+
+    # Reservasi stok: item di keranjang menahan stok selama RESERVATION_TTL detik
+    # sejak terakhir diubah; reservasi kedaluwarsa dilepas oleh thread penyapu.
+    RESERVATION_TTL = int(os.environ.get('RESERVATION_TTL', 10 * 60))
+    RESERVATION_SWEEP_INTERVAL = int(os.environ.get('RESERVATION_SWEEP_INTERVAL', 30))
+
+    # Antrian job latar belakang untuk efek samping checkout (rollup, last_order_at,
+    # notifikasi). 'thread' = worker pool per proses, 'sync' = dijalankan langsung
+    # setelah commit di thread request (untuk pengujian dan debug).
+    JOBS_MODE = os.environ.get('JOBS_MODE', 'thread')
+    JOBS_WORKERS = int(os.environ.get('JOBS_WORKERS', 2))
+    JOBS_MAX_ATTEMPTS = int(os.environ.get('JOBS_MAX_ATTEMPTS', 5))
+    JOBS_RETRY_DELAY = 2.0
+    JOBS_POLL_INTERVAL = 1.0
+    JOBS_STALE_AFTER = 300
+    # Jumlah job per status untuk /metrics dibaca ulang paling sering tiap sekian detik
+    JOBS_STATS_TTL = 5.0
+
+    # Arsip pesanan: pesanan lebih tua dari ARCHIVE_AFTER_DAYS dipindah ke tabel arsip
+    # per batch, dengan jeda (detik) antar batch agar checkout tidak tertahan
+    ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', 90))
+    ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', 500))
+    ARCHIVE_BATCH_PAUSE = float(os.environ.get('ARCHIVE_BATCH_PAUSE', 0.5))
+
+    # Analitik penjualan (NumPy): pesanan baru dimuat paling sering tiap
+    # ANALYTICS_REFRESH_INTERVAL detik; heatmap memakai zona waktu lokal (WIB = UTC+7)
+    ANALYTICS_REFRESH_INTERVAL = int(os.environ.get('ANALYTICS_REFRESH_INTERVAL', 30))
+    ANALYTICS_UTC_OFFSET_HOURS = int(os.environ.get('ANALYTICS_UTC_OFFSET_HOURS', 7))
+
+    # Varian gambar (thumbnail + WebP) dengan URL ber-hash isi, dilayani dari /img
+    IMAGE_VARIANTS_FOLDER = os.environ.get('IMAGE_VARIANTS_FOLDER')   # default: static/variants
+    IMAGE_VARIANT_WIDTHS = (128, 256, 384, 768, 1280)
+    IMAGE_QUALITY = 80
+    IMAGE_MANIFEST_TTL = 60
+
+    # Antrian dapur: default waktu siap per porsi untuk menu tanpa riwayat, jumlah
+    # tiket yang bisa dikerjakan bersamaan per kantin, dan bobot pembelajaran (EWMA)
+    KITCHEN_DEFAULT_PREP_SECONDS = int(os.environ.get('KITCHEN_DEFAULT_PREP_SECONDS', 180))
+    KITCHEN_STATIONS = int(os.environ.get('KITCHEN_STATIONS', 2))
+    KITCHEN_PREP_ALPHA = 0.2
+    KITCHEN_MIN_PREP_SECONDS = 10
+    KITCHEN_MAX_PREP_SECONDS = 3600
+    # Tiket yang tidak pernah dimajukan staf dibatalkan otomatis setelah sekian jam
+    KITCHEN_TICKET_EXPIRY_HOURS = float(os.environ.get('KITCHEN_TICKET_EXPIRY_HOURS', 12))
+    # Interval job berkala expire_kitchen_tickets (detik)
+    KITCHEN_EXPIRY_INTERVAL = int(os.environ.get('KITCHEN_EXPIRY_INTERVAL', 10 * 60))
+
+    # Hashing password di thread pool terpisah: metode Werkzeug (hash lama di-upgrade saat
+    # login berhasil), jumlah hash bersamaan per proses, antrian maksimum dan batas tunggu (detik)
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_MAX_QUEUE = int(os.environ.get('PASSWORD_HASH_MAX_QUEUE', 64))
+    PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 10))
+
+    # Batas percobaan login/registrasi per jendela waktu (detik), per username dan per IP
+    LOGIN_THROTTLE_WINDOW = int(os.environ.get('LOGIN_THROTTLE_WINDOW', 60))
+    LOGIN_MAX_ATTEMPTS_PER_USERNAME = int(os.environ.get('LOGIN_MAX_ATTEMPTS_PER_USERNAME', 10))
+    LOGIN_MAX_ATTEMPTS_PER_IP = int(os.environ.get('LOGIN_MAX_ATTEMPTS_PER_IP', 300))
+
+    # Cache identitas (role + kantin yang dikelola) per user untuk pemeriksaan akses route
+    ACCESS_CACHE_TTL = int(os.environ.get('ACCESS_CACHE_TTL', 60))
+    ACCESS_CACHE_MAX_ENTRIES = 10000
+
+    # Cache HTML kartu menu per menu dan versi isi, dan folder cache bytecode template
+    # Jinja (default: instance/jinja_cache) agar worker baru tidak mengompilasi ulang template
+    FRAGMENT_CACHE_MAX_ENTRIES = int(os.environ.get('FRAGMENT_CACHE_MAX_ENTRIES', 20000))
+    JINJA_BYTECODE_CACHE_DIR = os.environ.get('JINJA_BYTECODE_CACHE_DIR')
+
+    # Peringkat "populer sekarang" (/menu?sort=popular): paruh waktu peluruhan penjualan,
+    # bobot rating (porsi per bintang di atas rata-rata), riwayat yang dibaca tanpa snapshot,
+    # dan snapshot akumulator di disk (default: instance/popularity.json)
+    POPULARITY_HALF_LIFE_HOURS = float(os.environ.get('POPULARITY_HALF_LIFE_HOURS', 6))
+    POPULARITY_RATING_WEIGHT = float(os.environ.get('POPULARITY_RATING_WEIGHT', 2))
+    POPULARITY_WINDOW_DAYS = int(os.environ.get('POPULARITY_WINDOW_DAYS', 14))
+    POPULARITY_REFRESH_INTERVAL = int(os.environ.get('POPULARITY_REFRESH_INTERVAL', 30))
+    POPULARITY_SNAPSHOT_PATH = os.environ.get('POPULARITY_SNAPSHOT_PATH')
+    POPULARITY_SNAPSHOT_INTERVAL = int(os.environ.get('POPULARITY_SNAPSHOT_INTERVAL', 300))
+
+    # Instrumentasi request dan endpoint /metrics (format teks Prometheus).
+    # Request dengan query SQL melebihi anggaran dicatat sebagai peringatan.
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+    METRICS_QUERY_BUDGET = int(os.environ.get('METRICS_QUERY_BUDGET', 20))
+    # /metrics hanya untuk admin yang login, atau scraper dengan header "Authorization: Bearer <token>"
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
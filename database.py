@@ -0,0 +1,140 @@
+# database.py
+
+import logging
+import random
+import threading
+import time
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import OperationalError
+from models import db
+
+logger = logging.getLogger(__name__)
+
+_WRITE_PREFIXES = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+def is_lock_error(error):
+    return isinstance(error, OperationalError) and 'database is locked' in str(error.orig or error)
+
+
+class LockStats:
+    """Statistik tunggu kunci dan percobaan ulang penulisan database."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.slow_writes = 0          # penulisan yang lebih lama dari ambang log
+        self.slow_write_time = 0.0
+        self.lock_errors = 0          # 'database is locked' setelah busy_timeout habis
+        self.retries = 0
+        self.retry_successes = 0
+        self.retry_failures = 0
+
+    def add(self, **counters):
+        with self._lock:
+            for name, value in counters.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def snapshot(self):
+        with self._lock:
+            return {name: value for name, value in vars(self).items() if not name.startswith('_')}
+
+
+lock_stats = LockStats()
+
+
+def _sqlite_pragmas(config):
+    return [
+        f"PRAGMA journal_mode = {config['SQLITE_JOURNAL_MODE']}",
+        f"PRAGMA synchronous = {config['SQLITE_SYNCHRONOUS']}",
+        f"PRAGMA busy_timeout = {int(config['SQLITE_BUSY_TIMEOUT_MS'])}",
+        f"PRAGMA mmap_size = {int(config['SQLITE_MMAP_SIZE'])}",
+        # Nilai negatif = ukuran dalam KiB, bukan jumlah halaman
+        f"PRAGMA cache_size = -{int(config['SQLITE_CACHE_SIZE_KB'])}",
+        'PRAGMA temp_store = MEMORY',
+    ]
+
+
+def init_engine(app):
+    """Pasang hook koneksi dan statistik kunci pada engine aplikasi."""
+    with app.app_context():
+        engine = db.engine
+    threshold = app.config.get('DB_LOCK_WAIT_LOG_MS', 200) / 1000.0
+
+    if engine.dialect.name == 'sqlite':
+        pragmas = _sqlite_pragmas(app.config)
+
+        @event.listens_for(engine, 'connect')
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for pragma in pragmas:
+                cursor.execute(pragma)
+            cursor.close()
+
+    # Di SQLite penulisan pertama dalam transaksi yang menunggu kunci tulis;
+    # penulisan yang lambat dicatat sebagai tunggu kunci.
+    @event.listens_for(engine, 'before_cursor_execute')
+    def start_write_timer(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip()[:7].upper().startswith(_WRITE_PREFIXES):
+            conn.info['write_started'] = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def stop_write_timer(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop('write_started', None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        if elapsed >= threshold:
+            lock_stats.add(slow_writes=1, slow_write_time=elapsed)
+            logger.warning('Penulisan lambat %.0f ms (kemungkinan menunggu kunci): %s',
+                           elapsed * 1000, statement.split('\n', 1)[0][:120])
+
+    @event.listens_for(engine, 'handle_error')
+    def count_lock_errors(context):
+        if context.connection is not None:
+            context.connection.info.pop('write_started', None)
+        if 'database is locked' in str(context.original_exception):
+            lock_stats.add(lock_errors=1)
+
+    app.extensions['lock_stats'] = lock_stats
+
+
+def upsert(model):
+    """INSERT ... ON CONFLICT sesuai dialek database aktif (SQLite atau PostgreSQL)."""
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        return sqlite.insert(model)
+    if dialect == 'postgresql':
+        return postgresql.insert(model)
+    raise NotImplementedError(f'Upsert belum didukung untuk database {dialect}.')
+
+
+def run_with_retry(fn, attempts=3, base_delay=0.05):
+    """Jalankan transaksi tulis fn(), ulangi dengan backoff jika database terkunci.
+
+    Kontrak: fn() harus berakhir tepat di commit-nya dan tidak melakukan I/O database
+    lain sesudahnya. Kesalahan kunci setelah commit akan membuat fn() diulang dan
+    transaksi yang sudah di-commit ikut terulang (mis. pesanan ganda). Efek samping
+    setelah commit (tambal cache, kick job, publish event) dijalankan pemanggil
+    sekali, di luar run_with_retry.
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            result = fn()
+        except OperationalError as error:
+            db.session.rollback()
+            if not is_lock_error(error) or attempt == attempts:
+                if attempt > 1:
+                    lock_stats.add(retry_failures=1)
+                    logger.error('Transaksi gagal setelah %d percobaan karena database terkunci. Statistik: %s',
+                                 attempt, lock_stats.snapshot())
+                raise
+            delay = base_delay * (2 ** (attempt - 1)) * (1 + random.random())
+            lock_stats.add(retries=1)
+            logger.warning('Database terkunci, percobaan ulang %d/%d dalam %.0f ms',
+                           attempt, attempts - 1, delay * 1000)
+            time.sleep(delay)
+            continue
+        if attempt > 1:
+            lock_stats.add(retry_successes=1)
+        return result
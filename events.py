@@ -0,0 +1,179 @@
+# events.py
+
+import json
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import delete, event as sa_event, insert, select
+from sqlalchemy.orm import Session
+from models import db, OrderEvent
+
+
+class Subscription:
+    def __init__(self, kantin_id, maxsize):
+        self.kantin_id = kantin_id
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def put(self, event):
+        # Antrian dibatasi: jika pelanggan lambat, event paling lama dibuang
+        while True:
+            try:
+                self.queue.put_nowait(event)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+
+class OrderEventBroker:
+    """Broker publish/subscribe notifikasi pesanan baru per kantin.
+
+    Backend 'memory' hanya mengirim ke pelanggan di proses yang sama.
+    Backend 'database' menulis event ke tabel order_event; satu thread poller
+    per worker membaca event baru dan meneruskannya ke pelanggan lokal, jadi
+    notifikasi tetap sampai walaupun checkout dilayani worker lain.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.backend = 'memory'
+        self.queue_size = 100
+        self.heartbeat = 15
+        self.poll_interval = 1.0
+        self.retention = timedelta(hours=1)
+        self._lock = threading.Lock()
+        self._subscribers = {}      # kantin_id -> set(Subscription)
+        self._poller = None
+        self._last_event_id = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.backend = app.config.get('ORDER_EVENTS_BACKEND', self.backend)
+        self.queue_size = app.config.get('ORDER_EVENTS_QUEUE_SIZE', self.queue_size)
+        self.heartbeat = app.config.get('ORDER_EVENTS_HEARTBEAT', self.heartbeat)
+        self.poll_interval = app.config.get('ORDER_EVENTS_POLL_INTERVAL', self.poll_interval)
+        app.extensions['order_events'] = self
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subs) for subs in self._subscribers.values())
+
+    def subscribe(self, kantin_id):
+        subscription = Subscription(kantin_id, self.queue_size)
+        with self._lock:
+            if self.backend == 'database' and not self._subscribers:
+                # Tanpa pelanggan poller tidak membaca event. Kursor dimajukan sebelum pelanggan
+                # pertama ditambahkan agar tumpukan event lama tidak dikirim sebagai notifikasi baru
+                self._last_event_id = self._max_event_id()
+            self._subscribers.setdefault(kantin_id, set()).add(subscription)
+        if self.backend == 'database':
+            self._ensure_poller()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subs = self._subscribers.get(subscription.kantin_id)
+            if subs is not None:
+                subs.discard(subscription)
+                if not subs:
+                    del self._subscribers[subscription.kantin_id]
+
+    def publish(self, kantin_id, event):
+        # Tanpa commit: event ikut transaksi pemanggil (job notify_kantins), jadi di-commit
+        # bersama penghapusan job dan job yang diulang tidak mengirim event ganda. Backend
+        # 'memory' menunda pengiriman ke pelanggan sampai transaksi itu di-commit.
+        if self.backend == 'database':
+            db.session.execute(insert(OrderEvent).values(
+                kantin_id=kantin_id, payload=json.dumps(event), created_at=datetime.utcnow()
+            ))
+            # Worker yang menulis event juga menjalankan poller, yang membersihkan event lama
+            self._ensure_poller()
+        else:
+            # Transaksi dimulai walau tanpa query agar rollback pemanggil ikut membuang event ini
+            db.session.connection()
+            db.session.info.setdefault('order_events', []).append((kantin_id, event))
+
+    def _dispatch(self, kantin_id, event):
+        with self._lock:
+            subs = list(self._subscribers.get(kantin_id, ()))
+        for subscription in subs:
+            subscription.put(event)
+
+    def _ensure_poller(self):
+        with self._lock:
+            if self._poller is not None and self._poller.is_alive():
+                return
+            self._last_event_id = self._max_event_id()
+            self._poller = threading.Thread(target=self._poll_loop, name='order-event-poller', daemon=True)
+            self._poller.start()
+
+    def _max_event_id(self):
+        with self.app.app_context():
+            return db.session.execute(select(db.func.coalesce(db.func.max(OrderEvent.id), 0))).scalar()
+
+    def _poll_loop(self):
+        polls = 0
+        while True:
+            time.sleep(self.poll_interval)
+            polls += 1
+            try:
+                with self.app.app_context():
+                    if self.subscriber_count():
+                        rows = db.session.execute(
+                            select(OrderEvent.id, OrderEvent.kantin_id, OrderEvent.payload)
+                            .where(OrderEvent.id > self._last_event_id)
+                            .order_by(OrderEvent.id)
+                        ).all()
+                        for event_id, kantin_id, payload in rows:
+                            self._last_event_id = event_id
+                            self._dispatch(kantin_id, json.loads(payload))
+
+                    # Retensi berjalan walau tidak ada pelanggan agar tabel order_event tidak terus tumbuh
+                    if polls % 600 == 0:
+                        db.session.execute(delete(OrderEvent).where(
+                            OrderEvent.created_at < datetime.utcnow() - self.retention
+                        ))
+                        db.session.commit()
+            except Exception:
+                self.app.logger.exception('Gagal membaca event pesanan')
+
+    def stream(self, kantin_id):
+        """Generator Server-Sent Events untuk satu pelanggan kantin.
+
+        Mengirim heartbeat saat tidak ada event agar koneksi mati cepat terdeteksi;
+        pelanggan dilepas saat klien memutus koneksi (generator ditutup server).
+        """
+        # Berlangganan di dalam generator agar selalu dilepas oleh blok finally
+        subscription = self.subscribe(kantin_id)
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    event = subscription.queue.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    yield ': heartbeat\n\n'
+                    continue
+                yield f"event: order\nid: {event['order_id']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            self.unsubscribe(subscription)
+
+
+order_events = OrderEventBroker()
+
+
+@sa_event.listens_for(Session, 'after_commit')
+def _dispatch_committed_events(session):
+    for kantin_id, event in session.info.pop('order_events', ()):
+        order_events._dispatch(kantin_id, event)
+
+
+@sa_event.listens_for(Session, 'after_rollback')
+def _forget_uncommitted_events(session):
+    session.info.pop('order_events', None)
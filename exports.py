@@ -0,0 +1,156 @@
+# exports.py
+
+import csv
+import io
+from datetime import datetime
+from flask import Blueprint, Response, flash, redirect, request, stream_with_context, url_for
+from sqlalchemy import select
+from models import db, User, Kantin, Menu, Order, OrderItem, OrderArchive, OrderItemArchive, Rating
+from pagination import parse_date_range
+from access import current_identity
+import archive
+
+# Ekspor CSV untuk pembukuan. Baris dibaca dengan yield_per (cursor server-side)
+# dan dikirim per potongan lewat generator, jadi memori tetap konstan berapa pun
+# jumlah barisnya. Pesanan yang sudah diarsipkan ikut diekspor bila rentang
+# tanggalnya menjangkau arsip (arsip lebih dulu karena isinya lebih tua).
+bp = Blueprint('exports', __name__, url_prefix='/export')
+
+YIELD_PER = 1000
+CHUNK_ROWS = 500
+
+
+def _format(value):
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ', timespec='seconds')
+    return value
+
+
+def _csv_response(filename, header, *stmts):
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(header)
+        for stmt in stmts:
+            result = db.session.execute(stmt, execution_options={'yield_per': YIELD_PER})
+            for partition in result.partitions(CHUNK_ROWS):
+                writer.writerows([_format(value) for value in row] for row in partition)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    return Response(stream_with_context(generate()), mimetype='text/csv', headers={
+        'Content-Disposition': f'attachment; filename={filename}',
+        'X-Accel-Buffering': 'no',
+    })
+
+
+def _access():
+    """Return (role, kantin_id); kantin_id None untuk admin. (None, None) jika tidak berhak."""
+    identity = current_identity()
+    if identity is None or identity.role not in ('admin', 'kantin'):
+        return None, None
+    if identity.role == 'admin':
+        return 'admin', None
+    return ('kantin', identity.kantin.id) if identity.kantin is not None else (None, None)
+
+
+def _denied():
+    flash('Anda tidak memiliki akses ke halaman ini.', 'danger')
+    return redirect(url_for('main.login'))
+
+
+def _date_filters(column, date_from, date_to):
+    filters = []
+    if date_from is not None:
+        filters.append(column >= date_from)
+    if date_to is not None:
+        filters.append(column < date_to)
+    return filters
+
+
+def _suffix():
+    return '_'.join(value for value in (request.args.get('date_from'), request.args.get('date_to')) if value) or 'semua'
+
+
+def _orders_stmt(order_model, date_from, date_to):
+    filters = _date_filters(order_model.order_date, date_from, date_to)
+    if request.args.get('status'):
+        filters.append(order_model.status == request.args['status'])
+    return (
+        select(order_model.id, order_model.order_date, User.username, order_model.status, order_model.total_price)
+        .join(User, User.id == order_model.user_id)
+        .where(*filters)
+        .order_by(order_model.order_date, order_model.id)
+    )
+
+
+@bp.route('/orders.csv')
+def orders_csv():
+    role, _ = _access()
+    if role != 'admin':
+        return _denied()
+
+    date_from, date_to = parse_date_range(request.args)
+    stmts = [_orders_stmt(Order, date_from, date_to)]
+    if archive.reaches_archive(date_from):
+        stmts.insert(0, _orders_stmt(OrderArchive, date_from, date_to))
+    return _csv_response(f'pesanan_{_suffix()}.csv',
+                         ['order_id', 'order_date', 'username', 'status', 'total_price'], *stmts)
+
+
+def _order_items_stmt(order_model, item_model, kantin_id, date_from, date_to):
+    filters = _date_filters(order_model.order_date, date_from, date_to)
+    if kantin_id is not None:
+        filters.append(Menu.kantin_id == kantin_id)
+    return (
+        select(order_model.id, order_model.order_date, order_model.status, Kantin.name, item_model.menu_id, Menu.name,
+               item_model.quantity, item_model.price, item_model.quantity * item_model.price)
+        .join(order_model, order_model.id == item_model.order_id)
+        .join(Menu, Menu.id == item_model.menu_id)
+        .join(Kantin, Kantin.id == Menu.kantin_id)
+        .where(*filters)
+        .order_by(order_model.order_date, item_model.id)
+    )
+
+
+@bp.route('/order-items.csv')
+def order_items_csv():
+    role, kantin_id = _access()
+    if role is None:
+        return _denied()
+    # Admin bisa memilih satu kantin lewat ?kantin_id=, kantin selalu hanya miliknya sendiri
+    if role == 'admin':
+        kantin_id = request.args.get('kantin_id', type=int)
+
+    date_from, date_to = parse_date_range(request.args)
+    stmts = [_order_items_stmt(Order, OrderItem, kantin_id, date_from, date_to)]
+    if archive.reaches_archive(date_from):
+        stmts.insert(0, _order_items_stmt(OrderArchive, OrderItemArchive, kantin_id, date_from, date_to))
+    return _csv_response(f'item_pesanan_{_suffix()}.csv',
+                         ['order_id', 'order_date', 'status', 'kantin', 'menu_id', 'menu',
+                          'quantity', 'price', 'subtotal'], *stmts)
+
+
+@bp.route('/ratings.csv')
+def ratings_csv():
+    role, kantin_id = _access()
+    if role is None:
+        return _denied()
+
+    filters = _date_filters(Rating.rating_date, *parse_date_range(request.args))
+    if kantin_id is not None:
+        filters.append(Menu.kantin_id == kantin_id)
+    stmt = (
+        select(Rating.id, Rating.rating_date, Kantin.name, Rating.menu_id, Menu.name,
+               User.username, Rating.score, Rating.comment)
+        .join(Menu, Menu.id == Rating.menu_id)
+        .join(Kantin, Kantin.id == Menu.kantin_id)
+        .join(User, User.id == Rating.user_id)
+        .where(*filters)
+        .order_by(Rating.id)
+    )
+    return _csv_response(f'rating_{_suffix()}.csv',
+                         ['rating_id', 'rating_date', 'kantin', 'menu_id', 'menu', 'username', 'score', 'comment'],
+                         stmt)
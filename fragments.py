@@ -0,0 +1,82 @@
+# fragments.py
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from flask import current_app
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup
+
+
+class FragmentCache:
+    """Cache HTML hasil render potongan template (mis. satu kartu menu) di memori proses.
+
+    Satu entri per (template, id fragmen) beserta versinya; render() hanya merender
+    ulang jika versi dari pemanggil berbeda dengan versi yang tersimpan. Versi harus
+    mencakup semua data yang tampil di fragmen, jadi tidak perlu invalidasi eksplisit.
+    Fragmen tidak boleh bergantung pada user atau request.
+    """
+
+    def __init__(self, app=None):
+        self.max_entries = 20000
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # (template, id) -> (versi, html), urutan LRU
+        self._template_digests = {}
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_entries = app.config.get('FRAGMENT_CACHE_MAX_ENTRIES', self.max_entries)
+        app.extensions['fragment_cache'] = self
+
+    def render(self, template_name, fragment_id, version, **context):
+        key = (template_name, fragment_id)
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None and cached[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+        # Tanpa render_template: sinyal dan context processor per kartu terlalu mahal untuk ribuan kartu
+        html = Markup(current_app.jinja_env.get_template(template_name).render(**context))
+        with self._lock:
+            self._entries[key] = (version, html)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return html
+
+    def template_digest(self, template_names):
+        """Hash sumber template; ETag berubah saat template diubah walaupun datanya sama."""
+        template_names = tuple(template_names)
+        digest = self._template_digests.get(template_names)
+        if digest is None:
+            env = current_app.jinja_env
+            sha = hashlib.sha1()
+            for name in template_names:
+                sha.update(env.loader.get_source(env, name)[0].encode())
+            digest = self._template_digests[template_names] = sha.hexdigest()
+        return digest
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._template_digests.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+fragment_cache = FragmentCache()
+
+
+def init_bytecode_cache(app):
+    """Simpan template Jinja yang sudah dikompilasi di disk agar worker baru tidak mengompilasi ulang."""
+    directory = app.config.get('JINJA_BYTECODE_CACHE_DIR') or os.path.join(app.instance_path, 'jinja_cache')
+    os.makedirs(directory, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
@@ -0,0 +1,36 @@
+# gunicorn.conf.py
+# Konfigurasi server produksi: beberapa worker pre-fork, masing-masing dengan thread pool.
+
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+
+# Jumlah worker mengikuti jumlah core; thread per worker menangani request yang
+# menunggu I/O (database, koneksi SSE dashboard kantin yang terbuka lama)
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS', 8))
+
+# Aplikasi dimuat (dan create_tables dijalankan) sekali di master sebelum fork
+preload_app = True
+
+# Request yang sedang berjalan diberi waktu selesai saat SIGTERM sebelum worker dihentikan.
+# Koneksi SSE yang terputus akan tersambung ulang sendiri oleh browser.
+graceful_timeout = int(os.environ.get('GRACEFUL_TIMEOUT', 30))
+timeout = int(os.environ.get('WORKER_TIMEOUT', 60))
+keepalive = 5
+
+# Worker didaur ulang berkala agar kebocoran memori tidak menumpuk
+max_requests = int(os.environ.get('MAX_REQUESTS', 10000))
+max_requests_jitter = 1000
+
+accesslog = '-'
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    from app import warm_up
+    from wsgi import app
+    warm_up(app)
+    server.log.info('Worker %s siap', worker.pid)
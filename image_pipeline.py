@@ -0,0 +1,225 @@
+# image_pipeline.py
+
+import hashlib
+import json
+import os
+import threading
+import time
+from flask import Blueprint, abort, send_from_directory, url_for
+from PIL import Image, ImageOps, ImageSequence
+from werkzeug.security import safe_join
+from jobs import jobs
+
+# Varian gambar statis. Untuk setiap gambar di folder static (mis. images/nasi_goreng.jpg)
+# dibuat salinan ber-hash isi, versi kecil per lebar di IMAGE_VARIANT_WIDTHS dalam format
+# aslinya dan WebP, lalu daftar varian disimpan di <folder varian>/<path gambar>.json.
+# Nama file varian memuat hash isi, jadi URL-nya tidak pernah berubah isi dan bisa
+# di-cache browser selamanya (Cache-Control: immutable). Gambar yang belum diproses
+# tetap dilayani dari /static seperti sebelumnya.
+bp = Blueprint('images', __name__, url_prefix='/img')
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp')
+_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+
+
+class ImagePipeline:
+    """Pembuat dan pencari varian gambar (thumbnail + WebP) dengan URL ber-hash isi."""
+
+    def __init__(self, app=None):
+        self.static_folder = None
+        self.variants_folder = None
+        self.widths = (128, 256, 384, 768, 1280)
+        self.quality = 80
+        self.manifest_ttl = 60
+        self._lock = threading.Lock()
+        self._manifests = {}    # path gambar -> (entri manifest atau None, waktu dibaca)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.static_folder = app.static_folder
+        self.variants_folder = app.config.get('IMAGE_VARIANTS_FOLDER') or os.path.join(app.static_folder, 'variants')
+        self.widths = tuple(sorted(app.config.get('IMAGE_VARIANT_WIDTHS', self.widths)))
+        self.quality = app.config.get('IMAGE_QUALITY', self.quality)
+        self.manifest_ttl = app.config.get('IMAGE_MANIFEST_TTL', self.manifest_ttl)
+        app.extensions['image_pipeline'] = self
+        app.jinja_env.globals['image_variants'] = self.variants
+
+    def _manifest_path(self, image_url):
+        return safe_join(self.variants_folder, image_url + '.json')
+
+    def manifest(self, image_url):
+        """Entri manifest gambar, atau None jika belum diproses. Dibaca ulang dari disk paling
+        cepat tiap IMAGE_MANIFEST_TTL detik agar hasil proses di worker lain ikut terlihat."""
+        now = time.monotonic()
+        cached = self._manifests.get(image_url)
+        if cached is not None and now - cached[1] < self.manifest_ttl:
+            return cached[0]
+        entry = None
+        path = self._manifest_path(image_url) if image_url else None
+        if path and os.path.exists(path):
+            with open(path) as f:
+                entry = json.load(f)
+        with self._lock:
+            self._manifests[image_url] = (entry, now)
+        return entry
+
+    def variants(self, image_url):
+        """Data untuk <img>/<picture>: src, srcset, webp_srcset, ukuran asli dan WebP terbesar."""
+        entry = self.manifest(image_url) if image_url else None
+        if entry is None:
+            src = url_for('static', filename=image_url) if image_url else ''
+            return {'src': src, 'srcset': '', 'webp_srcset': '', 'width': None, 'height': None,
+                    'largest_webp': None}
+
+        def link(variant):
+            return url_for('images.variant', filename=variant['path'])
+
+        fallback = [variant for variant in entry['variants'] if variant['format'] != 'webp']
+        webp = [variant for variant in entry['variants'] if variant['format'] == 'webp']
+        original = entry['original']
+        srcset = [f"{link(variant)} {variant['width']}w" for variant in fallback]
+        if not fallback or fallback[-1]['width'] < entry['width']:
+            srcset.append(f"{link(original)} {entry['width']}w")
+        return {
+            'src': link(fallback[-1]) if fallback else link(original),
+            'srcset': ', '.join(srcset),
+            'webp_srcset': ', '.join(f"{link(variant)} {variant['width']}w" for variant in webp),
+            'width': entry['width'],
+            'height': entry['height'],
+            'largest_webp': link(webp[-1]) if webp else None,
+        }
+
+    def process(self, image_url, force=False):
+        """Buat varian untuk satu gambar di folder static.
+
+        Return (entri manifest, dibuat_ulang). Entri None jika file tidak ada atau bukan gambar.
+        Gambar yang isinya tidak berubah sejak diproses dilewati kecuali force.
+        """
+        source = safe_join(self.static_folder, image_url) if image_url else None
+        if not source or not os.path.isfile(source) or not source.lower().endswith(IMAGE_EXTENSIONS):
+            return None, False
+        with open(source, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()[:12]
+
+        previous = self._read_manifest(image_url)
+        if previous and previous['hash'] == digest and not force and all(
+                os.path.exists(os.path.join(self.variants_folder, item['path']))
+                for item in previous['variants'] + [previous['original']]):
+            return previous, False
+
+        stem, extension = os.path.splitext(image_url)
+        os.makedirs(os.path.dirname(os.path.join(self.variants_folder, image_url)), exist_ok=True)
+        original = {'path': f'{stem}.{digest}{extension.lower()}', 'bytes': len(data)}
+        self._write(original['path'], data)
+
+        with Image.open(source) as image:
+            fmt = _FORMATS.get(image.format, 'jpg')
+            animated = getattr(image, 'is_animated', False)
+            width, height = image.size
+            # Tidak pernah memperbesar; lebar asli (dibatasi lebar terbesar) selalu ikut sebagai varian
+            widths = [w for w in self.widths if w < width] + [min(width, self.widths[-1])]
+            variants = []
+            for target in sorted(set(widths)):
+                size = (target, max(1, round(height * target / width)))
+                if animated:
+                    variants.append(self._save_animated(image, stem, digest, size))
+                    continue
+                frame = ImageOps.exif_transpose(image)
+                frame = frame.resize(size, Image.LANCZOS) if size != frame.size else frame
+                if fmt != 'webp':
+                    variants.append(self._save_still(frame, stem, digest, fmt, size))
+                variants.append(self._save_still(frame, stem, digest, 'webp', size))
+
+        # Varian yang tidak lebih kecil dari aslinya tidak ada gunanya dikirim
+        for variant in variants:
+            if variant['bytes'] >= len(data):
+                os.remove(os.path.join(self.variants_folder, variant['path']))
+        variants = [variant for variant in variants if variant['bytes'] < len(data)]
+        entry = {'source': image_url, 'hash': digest, 'width': width, 'height': height,
+                 'bytes': len(data), 'original': original, 'variants': variants}
+        if previous and previous['hash'] != digest:
+            self._remove(previous)
+        self._write(image_url + '.json', json.dumps(entry, indent=1).encode())
+        with self._lock:
+            self._manifests[image_url] = (entry, time.monotonic())
+        return entry, True
+
+    def process_all(self, folder='images', force=False):
+        """Proses semua gambar di static/<folder>. Return daftar (path, entri, dibuat_ulang)."""
+        results = []
+        root = os.path.join(self.static_folder, folder)
+        for directory, _, files in os.walk(root):
+            for name in sorted(files):
+                if not name.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                image_url = os.path.relpath(os.path.join(directory, name), self.static_folder).replace(os.sep, '/')
+                entry, created = self.process(image_url, force=force)
+                if entry is not None:
+                    results.append((image_url, entry, created))
+        return results
+
+    def _read_manifest(self, image_url):
+        path = self._manifest_path(image_url)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def _save_still(self, frame, stem, digest, fmt, size):
+        path = f'{stem}.{digest}.{size[0]}w.{fmt}'
+        output = os.path.join(self.variants_folder, path)
+        if fmt == 'jpg':
+            frame.convert('RGB').save(output + '.tmp', 'JPEG', quality=self.quality, optimize=True, progressive=True)
+        elif fmt == 'webp':
+            frame.save(output + '.tmp', 'WEBP', quality=self.quality, method=4)
+        else:
+            frame.save(output + '.tmp', frame.format or fmt.upper(), optimize=True)
+        os.replace(output + '.tmp', output)
+        return {'width': size[0], 'format': fmt, 'path': path, 'bytes': os.path.getsize(output)}
+
+    def _save_animated(self, image, stem, digest, size):
+        # GIF animasi hanya dibuat versi WebP animasi; GIF asli tetap jadi fallback
+        frames, durations = [], []
+        for frame in ImageSequence.Iterator(image):
+            frames.append(frame.convert('RGBA').resize(size, Image.LANCZOS))
+            durations.append(frame.info.get('duration', 100))
+        path = f'{stem}.{digest}.{size[0]}w.webp'
+        output = os.path.join(self.variants_folder, path)
+        frames[0].save(output + '.tmp', 'WEBP', save_all=True, append_images=frames[1:], duration=durations,
+                       loop=image.info.get('loop', 0), quality=self.quality, method=4)
+        os.replace(output + '.tmp', output)
+        return {'width': size[0], 'format': 'webp', 'path': path, 'bytes': os.path.getsize(output)}
+
+    def _write(self, path, data):
+        output = os.path.join(self.variants_folder, path)
+        with open(output + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(output + '.tmp', output)
+
+    def _remove(self, entry):
+        for item in entry['variants'] + [entry['original']]:
+            try:
+                os.remove(os.path.join(self.variants_folder, item['path']))
+            except FileNotFoundError:
+                pass
+
+
+image_pipeline = ImagePipeline()
+
+
+@bp.route('/<path:filename>')
+def variant(filename):
+    if filename.endswith('.json'):
+        abort(404)
+    response = send_from_directory(image_pipeline.variants_folder, filename, max_age=IMMUTABLE_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+@jobs.task('process_image')
+def process_image(payload):
+    image_pipeline.process(payload['image_url'])
@@ -0,0 +1,247 @@
+# jobs.py
+
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import delete, insert, literal, select, update
+from models import db, Job
+
+
+class JobQueue:
+    """Antrian job latar belakang dengan penyimpanan di tabel job.
+
+    enqueue() menulis job di sesi database yang sedang berjalan, jadi job ikut
+    di-commit (atau di-rollback) bersama transaksi pemanggilnya dan tidak hilang
+    saat aplikasi restart. Setelah commit, pemanggil memanggil kick(): pada mode
+    'thread' worker pool dibangunkan, pada mode 'sync' job langsung dijalankan.
+
+    Handler menulis ke db.session; penghapusan job di-commit dalam transaksi yang
+    sama dengan perubahan handler. Handler yang gagal diulang dengan backoff
+    eksponensial sampai JOBS_MAX_ATTEMPTS, lalu ditandai 'failed'.
+
+    Job berkala (@jobs.periodic) dijadwalkan ulang dalam transaksi yang sama dengan
+    penghapusan job-nya, jadi di semua worker hanya ada satu job antre per nama.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.mode = 'thread'
+        self.workers = 2
+        self.max_attempts = 5
+        self.retry_delay = 2.0
+        self.poll_interval = 1.0
+        self.stale_after = 300
+        self.stats_ttl = 5.0
+        self.handlers = {}
+        self.schedules = {}         # nama job berkala -> kunci config interval (detik)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._threads = []
+        self._depth = None          # (waktu baca, {status: jumlah})
+        self.processed = 0
+        self.retried = 0
+        self.failed = 0
+        self._wait_time = 0.0
+        self._run_time = 0.0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.mode = app.config.get('JOBS_MODE', self.mode)
+        self.workers = app.config.get('JOBS_WORKERS', self.workers)
+        self.max_attempts = app.config.get('JOBS_MAX_ATTEMPTS', self.max_attempts)
+        self.retry_delay = app.config.get('JOBS_RETRY_DELAY', self.retry_delay)
+        self.poll_interval = app.config.get('JOBS_POLL_INTERVAL', self.poll_interval)
+        self.stale_after = app.config.get('JOBS_STALE_AFTER', self.stale_after)
+        self.stats_ttl = app.config.get('JOBS_STATS_TTL', self.stats_ttl)
+        app.extensions['jobs'] = self
+
+    def task(self, name):
+        """Dekorator pendaftaran handler: @jobs.task('nama') def handler(payload)."""
+        def register(fn):
+            self.handlers[name] = fn
+            return fn
+        return register
+
+    def periodic(self, name, interval_key):
+        """Dekorator job berkala: handler(payload) dijalankan kira-kira tiap app.config[interval_key] detik."""
+        def register(fn):
+            self.handlers[name] = fn
+            self.schedules[name] = interval_key
+            return fn
+        return register
+
+    def schedule_periodic(self):
+        """Antrekan job berkala yang belum punya job 'queued'/'running' (saat start, atau setelah gagal permanen).
+
+        INSERT ... SELECT ... WHERE NOT EXISTS adalah satu statement, jadi worker yang
+        menjalankannya bersamaan tidak membuat job ganda.
+        """
+        now = datetime.utcnow()
+        for name in sorted(self.schedules):
+            pending = select(Job.id).where(Job.name == name, Job.status.in_(('queued', 'running'))).exists()
+            db.session.execute(insert(Job).from_select(
+                ['name', 'payload', 'status', 'attempts', 'run_at', 'created_at'],
+                select(literal(name), literal('{}'), literal('queued'), literal(0), literal(now), literal(now))
+                .where(~pending)
+            ))
+        db.session.commit()
+
+    def enqueue(self, name, payload, delay=0):
+        # Tanpa commit: job ikut transaksi pemanggil
+        if name not in self.handlers:
+            raise KeyError(f'Job tidak dikenal: {name}')
+        now = datetime.utcnow()
+        db.session.execute(insert(Job).values(
+            name=name, payload=json.dumps(payload), status='queued', attempts=0,
+            run_at=now + timedelta(seconds=delay), created_at=now
+        ))
+
+    def kick(self):
+        """Dipanggil setelah commit transaksi yang meng-enqueue job.
+
+        Tidak pernah melempar ke pemanggil: transaksinya sudah di-commit, dan job yang
+        gagal diklaim di sini tetap di antrian untuk kick atau worker berikutnya.
+        """
+        try:
+            if self.mode == 'sync':
+                self.run_pending()
+            else:
+                self.ensure_workers()
+                self._wakeup.set()
+        except Exception:
+            db.session.rollback()
+            self.app.logger.exception('Gagal menjalankan job setelah commit, job tetap di antrian')
+
+    def run_pending(self):
+        """Jalankan semua job yang sudah jatuh tempo di thread ini. Return jumlah job yang dijalankan."""
+        count = 0
+        while self._run_one():
+            count += 1
+        return count
+
+    def _claim(self):
+        now = datetime.utcnow()
+        next_id = (
+            select(Job.id).where(Job.status == 'queued', Job.run_at <= now)
+            .order_by(Job.run_at, Job.id).limit(1).scalar_subquery()
+        )
+        # Klaim atomik: hanya satu worker (di proses mana pun) yang mendapat job ini
+        job = db.session.execute(
+            update(Job).where(Job.id == next_id, Job.status == 'queued')
+            .values(status='running', attempts=Job.attempts + 1, started_at=now)
+            .returning(Job.id, Job.name, Job.payload, Job.attempts, Job.run_at)
+            .execution_options(synchronize_session=False)
+        ).first()
+        db.session.commit()
+        return job, now
+
+    def _run_one(self):
+        job, started = self._claim()
+        if job is None:
+            return False
+
+        run_started = time.perf_counter()
+        try:
+            payload = json.loads(job.payload)
+            self.handlers[job.name](payload)
+            db.session.execute(delete(Job).where(Job.id == job.id))
+            if job.name in self.schedules:
+                self.enqueue(job.name, payload, delay=self.app.config[self.schedules[job.name]])
+            db.session.commit()
+        except Exception as error:
+            db.session.rollback()
+            self._record_failure(job, error)
+            return True
+
+        with self._lock:
+            self.processed += 1
+            self._wait_time += (started - job.run_at).total_seconds()
+            self._run_time += time.perf_counter() - run_started
+        return True
+
+    def _record_failure(self, job, error):
+        values = {'last_error': f'{type(error).__name__}: {error}'[:2000]}
+        if job.attempts >= self.max_attempts:
+            values['status'] = 'failed'
+            self.app.logger.error('Job %s #%d gagal permanen setelah %d percobaan: %s',
+                                  job.name, job.id, job.attempts, error)
+            with self._lock:
+                self.failed += 1
+        else:
+            delay = self.retry_delay * (2 ** (job.attempts - 1)) * (1 + random.random())
+            values.update(status='queued', run_at=datetime.utcnow() + timedelta(seconds=delay))
+            self.app.logger.warning('Job %s #%d gagal (percobaan %d/%d), diulang dalam %.1f detik: %s',
+                                    job.name, job.id, job.attempts, self.max_attempts, delay, error)
+            with self._lock:
+                self.retried += 1
+        db.session.execute(update(Job).where(Job.id == job.id).values(**values))
+        db.session.commit()
+
+    def _requeue_stale(self):
+        # Job 'running' dari proses yang mati di tengah jalan dikembalikan ke antrian
+        cutoff = datetime.utcnow() - timedelta(seconds=self.stale_after)
+        result = db.session.execute(
+            update(Job).where(Job.status == 'running', Job.started_at < cutoff).values(status='queued')
+        )
+        db.session.commit()
+        return result.rowcount
+
+    def ensure_workers(self):
+        if self.mode == 'sync':
+            return
+        with self._lock:
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            for index in range(len(self._threads), self.workers):
+                thread = threading.Thread(target=self._worker_loop, args=(index,), name=f'job-worker-{index}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _worker_loop(self, index):
+        polls = 0
+        while True:
+            try:
+                with self.app.app_context():
+                    # Hanya worker pertama yang memeriksa job macet dan job berkala yang
+                    # hilang, sekitar sekali per menit
+                    if index == 0 and polls % 60 == 0:
+                        self._requeue_stale()
+                        self.schedule_periodic()
+                    while self._run_one():
+                        pass
+            except Exception:
+                self.app.logger.exception('Worker job berhenti karena kesalahan, dilanjutkan')
+            polls += 1
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def _queue_depth(self):
+        # GROUP BY atas tabel job di-cache sebentar agar setiap scrape /metrics tidak memindai antrian
+        now = time.monotonic()
+        with self._lock:
+            if self._depth is not None and now - self._depth[0] < self.stats_ttl:
+                return self._depth[1]
+        depth = dict(db.session.execute(select(Job.status, db.func.count()).group_by(Job.status)).all())
+        with self._lock:
+            self._depth = (now, depth)
+        return depth
+
+    def stats(self):
+        depth = self._queue_depth()
+        with self._lock:
+            return {
+                'queued': depth.get('queued', 0),
+                'running': depth.get('running', 0),
+                'failed': depth.get('failed', 0),
+                'processed_total': self.processed,
+                'retries_total': self.retried,
+                'failures_total': self.failed,
+                'wait_seconds_avg': self._wait_time / self.processed if self.processed else 0.0,
+                'run_seconds_avg': self._run_time / self.processed if self.processed else 0.0,
+            }
+
+
+jobs = JobQueue()
@@ -0,0 +1,291 @@
+# kitchen.py
+
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import bindparam, case, delete, insert, select, update
+from sqlalchemy.orm import joinedload
+from jobs import jobs
+from models import db, Kantin, Menu, Order, KitchenTicket
+
+# Antrian dapur per kantin. Setiap item pesanan menjadi satu tiket:
+# queued -> preparing -> ready -> picked_up, atau cancelled jika dibatalkan staf atau
+# kedaluwarsa setelah KITCHEN_TICKET_EXPIRY_HOURS. Urutan antrian: priority tertinggi
+# dulu, lalu FIFO (id). Kantin.queue_seconds menyimpan total perkiraan kerja
+# tiket yang belum siap sehingga perkiraan waktu tunggu cukup membaca satu baris
+# per kantin. Waktu siap per porsi setiap menu (Menu.prep_seconds) dipelajari dari
+# durasi preparing -> ready dengan rata-rata bergerak eksponensial.
+
+ACTIVE_STATUSES = ('queued', 'preparing', 'ready')
+# Tiket yang perkiraan kerjanya masih dihitung di Kantin.queue_seconds
+PENDING_STATUSES = ('queued', 'preparing')
+
+# aksi -> (status asal yang diizinkan, status tujuan, kolom waktu yang diisi)
+ACTIONS = {
+    'start': (('queued',), 'preparing', 'started_at'),
+    'ready': (('queued', 'preparing'), 'ready', 'ready_at'),
+    'pickup': (('ready',), 'picked_up', 'picked_up_at'),
+}
+
+_kantin = Kantin.__table__
+_menu = Menu.__table__
+
+
+class KitchenError(Exception):
+    pass
+
+
+def prep_seconds(menu):
+    """Perkiraan detik per porsi untuk satu menu."""
+    return menu.prep_seconds if menu.prep_seconds is not None else current_app.config['KITCHEN_DEFAULT_PREP_SECONDS']
+
+
+def _work(menus, quantities):
+    work = {}
+    for menu_id, quantity in quantities.items():
+        menu = menus[menu_id]
+        work[menu.kantin_id] = work.get(menu.kantin_id, 0) + prep_seconds(menu) * quantity
+    return work
+
+
+def minutes_until(moment, now=None):
+    return max(1, -(-int((moment - (now or datetime.utcnow())).total_seconds()) // 60))
+
+
+def _ready_at(now, backlog_seconds):
+    return now + timedelta(seconds=backlog_seconds / current_app.config['KITCHEN_STATIONS'])
+
+
+def estimate_ready_at(quantities, now=None):
+    """Perkiraan siap untuk isi keranjang tanpa mengubah antrian (halaman checkout).
+
+    Hanya membaca baris menu di keranjang dan beban antrian kantinnya, tidak ada tiket yang dipindai.
+    """
+    now = now or datetime.utcnow()
+    menus = {row.id: row for row in db.session.execute(
+        select(Menu.id, Menu.kantin_id, Menu.prep_seconds).where(Menu.id.in_(list(quantities)))
+    )}
+    quantities = {menu_id: quantity for menu_id, quantity in quantities.items() if menu_id in menus}
+    if not quantities:
+        return now
+    work = _work(menus, quantities)
+    backlog = dict(db.session.execute(
+        select(Kantin.id, Kantin.queue_seconds).where(Kantin.id.in_(list(work)))
+    ).all())
+    return max(_ready_at(now, backlog.get(kantin_id, 0) + seconds) for kantin_id, seconds in work.items())
+
+
+def enqueue_order(order, menus, quantities, now):
+    """Masukkan pesanan (sudah di-add ke sesi) ke antrian dapur di dalam transaksi checkout, tanpa commit.
+
+    Beban antrian setiap kantin dinaikkan dengan UPDATE ... RETURNING, jadi perkiraan
+    siap dihitung dari nilai terbaru tanpa membaca tiket lain. Return perkiraan siap
+    pesanan (kantin yang paling lama).
+    """
+    work = _work(menus, quantities)
+    ready_at = now
+    # Satu UPDATE untuk semua kantin di pesanan; tanpa autoflush agar pesanan di-insert
+    # sekali, sudah lengkap dengan perkiraan siap
+    with db.session.no_autoflush:
+        backlogs = db.session.execute(
+            update(_kantin).where(_kantin.c.id.in_(sorted(work)))
+            .values(queue_seconds=_kantin.c.queue_seconds + case(work, value=_kantin.c.id, else_=0))
+            .returning(_kantin.c.queue_seconds)
+        ).scalars().all()
+    for backlog in backlogs:
+        ready_at = max(ready_at, _ready_at(now, backlog))
+
+    order.estimated_ready_at = ready_at
+    db.session.flush()  # id pesanan dibutuhkan tiket
+    db.session.execute(insert(KitchenTicket), [
+        {'order_id': order.id, 'kantin_id': menus[menu_id].kantin_id, 'menu_id': menu_id, 'quantity': quantity,
+         'status': 'queued', 'priority': 0, 'estimated_seconds': prep_seconds(menus[menu_id]) * quantity,
+         'queued_at': now}
+        for menu_id, quantity in quantities.items()
+    ])
+    return ready_at
+
+
+def queue(kantin_id, limit=200):
+    """Tiket aktif satu kantin dalam urutan pengerjaan."""
+    return (KitchenTicket.query.options(joinedload(KitchenTicket.menu))
+            .filter(KitchenTicket.kantin_id == kantin_id, KitchenTicket.status.in_(ACTIVE_STATUSES))
+            .order_by(KitchenTicket.priority.desc(), KitchenTicket.id)
+            .limit(limit).all())
+
+
+def wait_seconds(kantin_id):
+    """Perkiraan detik sampai pesanan baru di kantin ini mulai bisa siap (satu lookup)."""
+    backlog = db.session.execute(select(Kantin.queue_seconds).where(Kantin.id == kantin_id)).scalar() or 0
+    return backlog / current_app.config['KITCHEN_STATIONS']
+
+
+def advance(kantin_id, action, ticket_ids=None, count=None):
+    """Majukan banyak tiket sekaligus dalam satu transaksi.
+
+    Tiket dipilih lewat ticket_ids, atau `count` tiket berikutnya di antrian yang
+    statusnya cocok untuk aksi itu. Tiket milik kantin lain atau dengan status yang
+    tidak cocok dilewati. Aksi 'prioritize' menaikkan tiket yang masih antre ke depan,
+    aksi 'cancel' membatalkan tiket yang dipilih. Return daftar id tiket yang berubah.
+    """
+    if action == 'prioritize':
+        if not ticket_ids:
+            raise KitchenError('Pilih tiket yang akan didahulukan.')
+        rows = db.session.execute(
+            update(KitchenTicket)
+            .where(KitchenTicket.id.in_(ticket_ids), KitchenTicket.kantin_id == kantin_id,
+                   KitchenTicket.status == 'queued')
+            .values(priority=KitchenTicket.priority + 1)
+            .returning(KitchenTicket.id)
+            .execution_options(synchronize_session=False)
+        ).scalars().all()
+        db.session.commit()
+        return sorted(rows)
+    if action == 'cancel':
+        if not ticket_ids:
+            raise KitchenError('Pilih tiket yang akan dibatalkan.')
+        try:
+            rows = cancel_tickets(KitchenTicket.id.in_(ticket_ids), KitchenTicket.kantin_id == kantin_id)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return rows
+    if action not in ACTIONS:
+        raise KitchenError(f'Aksi tidak dikenal: {action}')
+
+    from_statuses, to_status, timestamp = ACTIONS[action]
+    criteria = [KitchenTicket.kantin_id == kantin_id, KitchenTicket.status.in_(from_statuses)]
+    if ticket_ids:
+        criteria.append(KitchenTicket.id.in_(ticket_ids))
+    elif count:
+        criteria.append(KitchenTicket.id.in_(
+            select(KitchenTicket.id).where(*criteria)
+            .order_by(KitchenTicket.priority.desc(), KitchenTicket.id).limit(count).scalar_subquery()
+        ))
+    else:
+        raise KitchenError('Pilih tiket atau jumlah tiket yang akan dimajukan.')
+
+    now = datetime.utcnow()
+    try:
+        # UPDATE bersyarat + RETURNING: staf yang menekan tombol bersamaan tidak memproses tiket dua kali
+        rows = db.session.execute(
+            update(KitchenTicket).where(*criteria)
+            .values(status=to_status, **{timestamp: now})
+            .returning(KitchenTicket.id, KitchenTicket.order_id, KitchenTicket.menu_id, KitchenTicket.quantity,
+                       KitchenTicket.estimated_seconds, KitchenTicket.started_at)
+            .execution_options(synchronize_session=False)
+        ).all()
+        if action == 'ready' and rows:
+            _release_work(kantin_id, sum(row.estimated_seconds for row in rows))
+            _learn_prep_times(now, rows)
+        elif action == 'pickup' and rows:
+            _complete_orders({row.order_id for row in rows})
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return sorted(row.id for row in rows)
+
+
+def cancel_tickets(*criteria):
+    """Batalkan tiket aktif yang cocok dengan criteria, tanpa commit. Return daftar id tiket.
+
+    Tiket yang belum siap melepas perkiraan kerjanya dari beban antrian kantin.
+    Pesanan yang tidak lagi punya tiket aktif ditutup (lihat _complete_orders).
+    """
+    released = {}
+    changed = []
+    # Dua UPDATE karena RETURNING hanya memberi status baru, bukan status asal
+    for statuses in (PENDING_STATUSES, ('ready',)):
+        rows = db.session.execute(
+            update(KitchenTicket).where(*criteria, KitchenTicket.status.in_(statuses))
+            .values(status='cancelled')
+            .returning(KitchenTicket.id, KitchenTicket.order_id, KitchenTicket.kantin_id, KitchenTicket.estimated_seconds)
+            .execution_options(synchronize_session=False)
+        ).all()
+        if statuses == PENDING_STATUSES:
+            for row in rows:
+                released[row.kantin_id] = released.get(row.kantin_id, 0) + row.estimated_seconds
+        changed.extend(rows)
+    for kantin_id, seconds in sorted(released.items()):
+        _release_work(kantin_id, seconds)
+    if changed:
+        _complete_orders({row.order_id for row in changed})
+    return sorted(row.id for row in changed)
+
+
+@jobs.periodic('expire_kitchen_tickets', 'KITCHEN_EXPIRY_INTERVAL')
+def expire_stale_tickets(payload=None):
+    """Batalkan tiket yang masih aktif lebih dari KITCHEN_TICKET_EXPIRY_HOURS (mis. kantin tutup
+    sebelum antrian habis) agar tidak menaikkan perkiraan waktu tunggu selamanya.
+
+    Job berkala; pembatalan di-commit bersama penghapusan job. Return jumlah tiket.
+    """
+    cutoff = datetime.utcnow() - timedelta(hours=current_app.config['KITCHEN_TICKET_EXPIRY_HOURS'])
+    expired = cancel_tickets(KitchenTicket.status.in_(ACTIVE_STATUSES), KitchenTicket.queued_at < cutoff)
+    return len(expired)
+
+
+def delete_tickets(*criteria):
+    """Hapus tiket yang cocok dengan criteria tanpa commit (dipakai arsip pesanan).
+
+    Tiket yang belum siap melepas perkiraan kerjanya lebih dulu, jadi Kantin.queue_seconds
+    tetap sama dengan total kerja tiket yang tersisa. Return jumlah tiket yang dihapus.
+    """
+    rows = db.session.execute(
+        delete(KitchenTicket).where(*criteria)
+        .returning(KitchenTicket.kantin_id, KitchenTicket.status, KitchenTicket.estimated_seconds)
+        .execution_options(synchronize_session=False)
+    ).all()
+    released = {}
+    for row in rows:
+        if row.status in PENDING_STATUSES:
+            released[row.kantin_id] = released.get(row.kantin_id, 0) + row.estimated_seconds
+    for kantin_id, seconds in sorted(released.items()):
+        _release_work(kantin_id, seconds)
+    return len(rows)
+
+
+def _release_work(kantin_id, seconds):
+    db.session.execute(
+        update(_kantin).where(_kantin.c.id == kantin_id)
+        .values(queue_seconds=case((_kantin.c.queue_seconds > seconds, _kantin.c.queue_seconds - seconds), else_=0))
+    )
+
+
+def _learn_prep_times(now, rows):
+    # Hanya tiket yang benar-benar melewati 'preparing' punya durasi yang bisa dipelajari
+    config = current_app.config
+    samples = {}
+    for row in rows:
+        if row.started_at is None:
+            continue
+        per_portion = (now - row.started_at).total_seconds() / row.quantity
+        per_portion = min(max(per_portion, config['KITCHEN_MIN_PREP_SECONDS']), config['KITCHEN_MAX_PREP_SECONDS'])
+        samples.setdefault(row.menu_id, []).append(per_portion)
+    if not samples:
+        return
+    alpha = config['KITCHEN_PREP_ALPHA']
+    db.session.execute(
+        update(_menu).where(_menu.c.id == bindparam('b_id'))
+        .values(prep_seconds=case((_menu.c.prep_seconds.is_(None), bindparam('b_seconds')),
+                                  else_=_menu.c.prep_seconds + alpha * (bindparam('b_seconds') - _menu.c.prep_seconds)),
+                prep_samples=_menu.c.prep_samples + bindparam('b_count')),
+        [{'b_id': menu_id, 'b_seconds': sum(values) / len(values), 'b_count': len(values)}
+         for menu_id, values in sorted(samples.items())]
+    )
+
+
+def _complete_orders(order_ids):
+    # Pesanan ditutup setelah semua tiketnya (di semua kantin) diambil atau dibatalkan:
+    # 'completed' jika minimal satu tiket diambil, 'cancelled' jika semuanya dibatalkan
+    def has_tickets(*statuses):
+        return select(KitchenTicket.id).where(
+            KitchenTicket.order_id == Order.id, KitchenTicket.status.in_(statuses)
+        ).exists()
+
+    db.session.execute(
+        update(Order).where(Order.id.in_(order_ids), Order.status == 'pending', ~has_tickets(*ACTIVE_STATUSES))
+        .values(status=case((has_tickets('picked_up'), 'completed'), else_='cancelled'))
+        .execution_options(synchronize_session=False)
+    )
@@ -0,0 +1,99 @@
+# menu_import.py
+
+import csv
+import io
+from sqlalchemy import insert
+from models import db, Menu
+import search
+from jobs import jobs
+
+# Impor menu massal dari CSV. Header wajib: name, price; opsional: description,
+# stock, image_url. Aturan validasi sama dengan form add_menu.
+
+BATCH_SIZE = 500
+MAX_ERRORS = 20
+DEFAULT_IMAGE = 'images/placeholder.jpg'
+
+
+class MenuImportError(Exception):
+    # `errors` berisi (nomor_baris, pesan)
+    def __init__(self, errors):
+        super().__init__('%d baris CSV tidak valid.' % len(errors))
+        self.errors = errors
+
+
+def _parse_row(row):
+    name = (row.get('name') or '').strip()
+    if not name or len(name) > 100:
+        raise ValueError('nama wajib diisi (maksimal 100 karakter)')
+    try:
+        price = float(row.get('price') or '')
+    except ValueError:
+        raise ValueError('harga harus berupa angka')
+    try:
+        stock = int(row.get('stock') or 0)
+    except ValueError:
+        raise ValueError('stok harus berupa bilangan bulat')
+    if price <= 0 or stock < 0:
+        raise ValueError('harga harus > 0 dan stok harus >= 0')
+    return {
+        'name': name,
+        'description': (row.get('description') or '').strip(),
+        'price': price,
+        'stock': stock,
+        'image_url': (row.get('image_url') or '').strip() or DEFAULT_IMAGE,
+    }
+
+
+def _insert_batch(batch, kantin):
+    rows = db.session.execute(
+        insert(Menu).returning(Menu.id, sort_by_parameter_order=True),
+        [dict(values, kantin_id=kantin.id) for values in batch]
+    ).all()
+    search.index_new_menus([dict(values, id=row.id) for values, row in zip(batch, rows)], kantin.name)
+    return [row.id for row in rows]
+
+
+def import_menus(kantin, stream, batch_size=BATCH_SIZE):
+    """Validasi dan insert menu dari file CSV per batch dalam satu transaksi.
+
+    CSV dibaca baris demi baris, jadi file besar tidak dimuat utuh ke memori.
+    Jika ada baris tidak valid, seluruh impor di-rollback dan MenuImportError
+    dilempar. Return daftar id menu baru; pemanggil yang melakukan commit lalu jobs.kick().
+    """
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    missing = {'name', 'price'} - set(reader.fieldnames or ())
+    if missing:
+        raise MenuImportError([(1, f"kolom wajib tidak ada: {', '.join(sorted(missing))}")])
+
+    errors = []
+    batch = []
+    menu_ids = []
+    image_urls = set()
+    for row in reader:
+        try:
+            values = _parse_row(row)
+        except ValueError as e:
+            errors.append((reader.line_num, str(e)))
+            if len(errors) >= MAX_ERRORS:
+                break
+            continue
+        if errors:
+            continue    # tetap memvalidasi sisa file, tapi tidak perlu insert lagi
+        batch.append(values)
+        image_urls.add(values['image_url'])
+        if len(batch) >= batch_size:
+            menu_ids.extend(_insert_batch(batch, kantin))
+            batch = []
+
+    if not errors and not menu_ids and not batch:
+        errors.append((1, 'file tidak berisi baris menu'))
+    if errors:
+        db.session.rollback()
+        raise MenuImportError(errors)
+    if batch:
+        menu_ids.extend(_insert_batch(batch, kantin))
+    # Satu job varian gambar per file berbeda, ikut transaksi impor
+    for image_url in sorted(image_urls):
+        jobs.enqueue('process_image', {'image_url': image_url})
+    return menu_ids
@@ -0,0 +1,187 @@
+# metrics.py
+
+import bisect
+import hmac
+import threading
+import time
+from flask import (Response, abort, current_app, g, has_request_context, request, template_rendered,
+                   before_render_template)
+from sqlalchemy import event
+from access import current_identity
+from models import db
+
+PREFIX = 'foodcourt'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    def __init__(self, name, documentation, label_names, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series = {}   # label values -> [jumlah per bucket..., sum, count]
+
+    def observe(self, label_values, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series_items = sorted((labels, list(values)) for labels, values in self._series.items())
+        for label_values, values in series_items:
+            labels = ','.join(f'{name}="{value}"' for name, value in zip(self.label_names, label_values))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), values):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{self.name}_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{labels}}} {values[-2]}')
+            lines.append(f'{self.name}_count{{{labels}}} {values[-1]}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, documentation, label_names):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            labels = ','.join(f'{name}="{value}"' for name, value in zip(self.label_names, label_values))
+            lines.append(f'{self.name}{{{labels}}} {value}')
+        return lines
+
+
+class Metrics:
+    """Instrumentasi per request: durasi per endpoint, jumlah dan waktu query SQL,
+    dan waktu render template, diekspos sebagai teks Prometheus di /metrics.
+
+    Metrik disimpan per proses; dengan beberapa worker, setiap worker melaporkan angkanya sendiri.
+    /metrics hanya bisa dibaca admin atau scraper yang mengirim METRICS_TOKEN.
+    """
+
+    def __init__(self, app=None):
+        self.request_duration = Histogram(
+            f'{PREFIX}_request_duration_seconds', 'Durasi request per endpoint.', ('endpoint',), LATENCY_BUCKETS)
+        self.request_queries = Histogram(
+            f'{PREFIX}_request_sql_queries', 'Jumlah statement SQL per request.', ('endpoint',), QUERY_COUNT_BUCKETS)
+        self.request_sql_time = Histogram(
+            f'{PREFIX}_request_sql_seconds', 'Total waktu SQL per request.', ('endpoint',), LATENCY_BUCKETS)
+        self.template_render = Histogram(
+            f'{PREFIX}_template_render_seconds', 'Waktu render template.', ('template',), LATENCY_BUCKETS)
+        self.requests_total = Counter(
+            f'{PREFIX}_requests_total', 'Jumlah request per endpoint dan status.', ('endpoint', 'status'))
+        self.budget_exceeded = Counter(
+            f'{PREFIX}_query_budget_exceeded_total', 'Request yang melebihi anggaran query SQL.', ('endpoint',))
+        self.query_budget = 20
+        self._gauge_sources = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not app.config.get('METRICS_ENABLED', True):
+            return
+        self.query_budget = app.config.get('METRICS_QUERY_BUDGET', self.query_budget)
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        before_render_template.connect(self._start_render, app)
+        template_rendered.connect(self._finish_render, app)
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', self._start_query)
+            event.listen(db.engine, 'after_cursor_execute', self._finish_query)
+        app.add_url_rule('/metrics', 'metrics', self.render)
+        app.extensions['metrics'] = self
+
+    def add_gauges(self, name, source):
+        # source() -> {kunci: nilai}; diekspos sebagai foodcourt_<name>_<kunci>, bertipe counter
+        # jika kunci berakhiran _total dan gauge selain itu. Disimpan per nama agar
+        # create_app() yang dipanggil ulang tidak menggandakan gauge.
+        self._gauge_sources[name] = source
+
+    def _start_request(self):
+        g._metrics_started = time.perf_counter()
+        g._metrics_queries = 0
+        g._metrics_sql_time = 0.0
+
+    def _finish_request(self, response):
+        started = g.pop('_metrics_started', None)
+        if started is None:
+            return response
+        endpoint = request.endpoint or 'unknown'
+        elapsed = time.perf_counter() - started
+        queries = g.pop('_metrics_queries', 0)
+        self.request_duration.observe((endpoint,), elapsed)
+        self.request_queries.observe((endpoint,), queries)
+        self.request_sql_time.observe((endpoint,), g.pop('_metrics_sql_time', 0.0))
+        self.requests_total.inc((endpoint, str(response.status_code)))
+        if queries > self.query_budget:
+            self.budget_exceeded.inc((endpoint,))
+            current_app.logger.warning('%s %s menjalankan %d query SQL (anggaran %d), kemungkinan N+1',
+                                       request.method, request.path, queries, self.query_budget)
+        return response
+
+    def _start_query(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context():
+            conn.info['metrics_query_started'] = time.perf_counter()
+
+    def _finish_query(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop('metrics_query_started', None)
+        if started is not None and has_request_context() and '_metrics_started' in g:
+            g._metrics_queries += 1
+            g._metrics_sql_time += time.perf_counter() - started
+
+    def _start_render(self, sender, template, context, **extra):
+        if has_request_context():
+            g.setdefault('_metrics_render_started', []).append(time.perf_counter())
+
+    def _finish_render(self, sender, template, context, **extra):
+        if has_request_context():
+            stack = g.get('_metrics_render_started')
+            if stack:
+                self.template_render.observe((template.name,), time.perf_counter() - stack.pop())
+
+    def _authorized(self):
+        token = current_app.config.get('METRICS_TOKEN')
+        if token and hmac.compare_digest(request.headers.get('Authorization', '').encode(),
+                                         f'Bearer {token}'.encode()):
+            return True
+        identity = current_identity()
+        return identity is not None and identity.role == 'admin'
+
+    def render(self):
+        if not self._authorized():
+            abort(403)
+        lines = []
+        for metric in (self.request_duration, self.request_queries, self.request_sql_time,
+                       self.template_render, self.requests_total, self.budget_exceeded):
+            lines.extend(metric.render())
+        for name, source in self._gauge_sources.items():
+            for key, value in sorted(source().items()):
+                metric_name = f'{PREFIX}_{name}_{key}'
+                lines.append(f"# TYPE {metric_name} {'counter' if key.endswith('_total') else 'gauge'}")
+                lines.append(f'{metric_name} {value}')
+        return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+
+metrics = Metrics()
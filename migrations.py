@@ -0,0 +1,231 @@
+# migrations.py
+
+from datetime import datetime
+from sqlalchemy import MetaData, inspect as sa_inspect, select, text
+from sqlalchemy.schema import CreateTable
+from models import (db, Kantin, KantinDailySales, KitchenTicket, Menu, Order, OrderArchive, OrderItem,
+                    OrderItemArchive, Rating)
+
+# Migrasi skema berversi untuk database yang sudah berjalan. db.create_all() hanya
+# membuat tabel yang belum ada, jadi kolom dan indeks baru pada tabel lama
+# ditambahkan lewat migrasi di sini. Setiap migrasi harus idempoten karena
+# database baru (dibuat oleh create_all) juga melewati semua migrasi.
+
+VERSION_TABLE = 'schema_version'
+
+
+def _create_index(conn, name, table, columns, unique=False):
+    conn.execute(text(
+        f'CREATE {"UNIQUE " if unique else ""}INDEX IF NOT EXISTS {name} ON "{table}" ({", ".join(columns)})'
+    ))
+
+
+def _add_column(conn, table, column, ddl):
+    existing = {c['name'] for c in sa_inspect(conn).get_columns(table)}
+    if column not in existing:
+        conn.execute(text(f'ALTER TABLE "{table}" ADD COLUMN {column} {ddl}'))
+        return True
+    return False
+
+
+def _0001_hot_path_indexes(conn):
+    _create_index(conn, 'ix_menu_kantin_id', 'menu', ['kantin_id'])
+    _create_index(conn, 'ix_order_item_order_id', 'order_item', ['order_id'])
+    _create_index(conn, 'ix_order_item_menu_id', 'order_item', ['menu_id'])
+    _create_index(conn, 'ix_order_order_date', 'order', ['order_date'])
+    _create_index(conn, 'ix_order_user_id', 'order', ['user_id'])
+    _create_index(conn, 'ix_kantin_user_id', 'kantin', ['user_id'])
+
+    # Hapus rating ganda (user, menu) sebelum memasang unique index, simpan yang terbaru
+    conn.execute(text(
+        'DELETE FROM rating WHERE id NOT IN '
+        '(SELECT max(id) FROM rating GROUP BY user_id, menu_id)'
+    ))
+    _create_index(conn, 'uq_rating_user_menu', 'rating', ['user_id', 'menu_id'], unique=True)
+
+
+def _0002_menu_rating_aggregates(conn):
+    added = _add_column(conn, 'menu', 'rating_count', 'INTEGER NOT NULL DEFAULT 0')
+    added = _add_column(conn, 'menu', 'rating_sum', 'INTEGER NOT NULL DEFAULT 0') or added
+    if added:
+        recompute_rating_aggregates(conn)
+
+
+def _0003_stock_reservations(conn):
+    # Tabel stock_reservation dibuat oleh create_all; di sini hanya kolom penghitungnya
+    _add_column(conn, 'menu', 'reserved', 'INTEGER NOT NULL DEFAULT 0')
+
+
+def _0004_kitchen_queue(conn):
+    # Tabel kitchen_ticket dibuat oleh create_all; di sini kolom baru pada tabel lama
+    _add_column(conn, 'kantin', 'queue_seconds', 'FLOAT NOT NULL DEFAULT 0')
+    _add_column(conn, 'menu', 'prep_seconds', 'FLOAT')
+    _add_column(conn, 'menu', 'prep_samples', 'INTEGER NOT NULL DEFAULT 0')
+    _add_column(conn, 'order', 'estimated_ready_at', 'DATETIME')
+
+
+def _rebuild_with_autoincrement(conn, model):
+    # SQLite tidak bisa menambah AUTOINCREMENT lewat ALTER TABLE: buat tabel baru,
+    # salin isinya, ganti tabel lama, lalu pasang ulang indeksnya
+    table = model.__table__
+    sql = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :n"),
+                       {'n': table.name}).scalar()
+    if sql is None or 'AUTOINCREMENT' in sql.upper():
+        return False
+    indexes = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = :n "
+                                "AND sql IS NOT NULL"), {'n': table.name}).scalars().all()
+    columns = ', '.join(f'"{c["name"]}"' for c in sa_inspect(conn).get_columns(table.name) if c['name'] in table.c)
+
+    # Tabel yang dirujuk ikut disalin agar foreign key tabel baru bisa dikompilasi
+    metadata = MetaData()
+    for fk in table.foreign_keys:
+        if fk.column.table.name not in metadata.tables:
+            fk.column.table.to_metadata(metadata)
+    rebuilt = table.to_metadata(metadata, name=f'{table.name}_rebuild')
+    conn.execute(CreateTable(rebuilt))
+    conn.execute(text(f'INSERT INTO "{rebuilt.name}" ({columns}) SELECT {columns} FROM "{table.name}"'))
+    conn.execute(text(f'DROP TABLE "{table.name}"'))
+    conn.execute(text(f'ALTER TABLE "{rebuilt.name}" RENAME TO "{table.name}"'))
+    for index_sql in indexes:
+        conn.execute(text(index_sql))
+    return True
+
+
+def _seed_sequence(conn, table, floor):
+    # id baru harus melewati id yang sudah ada di tabel arsip
+    seq = conn.execute(text('SELECT seq FROM sqlite_sequence WHERE name = :n'), {'n': table}).scalar()
+    if seq is None:
+        if floor:
+            conn.execute(text('INSERT INTO sqlite_sequence (name, seq) VALUES (:n, :s)'), {'n': table, 's': floor})
+    elif seq < floor:
+        conn.execute(text('UPDATE sqlite_sequence SET seq = :s WHERE name = :n'), {'n': table, 's': floor})
+
+
+def _0005_order_autoincrement(conn):
+    # Tanpa AUTOINCREMENT SQLite memakai ulang id setelah tabel pesanan kosong karena
+    # diarsipkan, lalu batch arsip berikutnya gagal dengan UNIQUE constraint
+    if conn.dialect.name != 'sqlite':
+        return
+    for model, archive_model in ((Order, OrderArchive), (OrderItem, OrderItemArchive)):
+        _rebuild_with_autoincrement(conn, model)
+        floor = conn.execute(select(db.func.max(archive_model.id))).scalar() or 0
+        _seed_sequence(conn, model.__tablename__, floor)
+
+
+def _0006_order_item_kantin_recent(conn):
+    # Kolom bisa sudah ada jika order_item dibangun ulang oleh migrasi 5 dari model terbaru,
+    # jadi pengisian selalu dijalankan untuk baris yang belum terisi
+    _add_column(conn, 'order_item', 'kantin_id', 'INTEGER')
+    _add_column(conn, 'order_item', 'order_date', 'DATETIME')
+    conn.execute(text(
+        'UPDATE order_item SET '
+        'kantin_id = (SELECT menu.kantin_id FROM menu WHERE menu.id = order_item.menu_id), '
+        'order_date = (SELECT "order".order_date FROM "order" WHERE "order".id = order_item.order_id) '
+        'WHERE kantin_id IS NULL OR order_date IS NULL'
+    ))
+    _create_index(conn, 'ix_order_item_kantin_recent', 'order_item', ['kantin_id', 'order_date', 'id'])
+
+
+def _0007_kitchen_ticket_priority_desc(conn):
+    # Indeks lama (priority naik) memaksa SQLite mengurutkan ulang id untuk ORDER BY priority DESC, id
+    conn.execute(text('DROP INDEX IF EXISTS ix_kitchen_ticket_queue'))
+    _create_index(conn, 'ix_kitchen_ticket_next', 'kitchen_ticket', ['kantin_id', 'status', 'priority DESC', 'id'])
+
+
+# (versi, deskripsi, fungsi). Tambahkan migrasi baru di akhir, jangan ubah urutan.
+MIGRATIONS = [
+    (1, 'Indeks hot path dan unique rating (user_id, menu_id)', _0001_hot_path_indexes),
+    (2, 'Kolom agregat rating pada menu', _0002_menu_rating_aggregates),
+    (3, 'Kolom stok tertahan (reservasi keranjang) pada menu', _0003_stock_reservations),
+    (4, 'Antrian dapur: beban antrian kantin, waktu siap menu, perkiraan siap pesanan', _0004_kitchen_queue),
+    (5, 'AUTOINCREMENT pada order/order_item agar id tidak dipakai ulang setelah pengarsipan', _0005_order_autoincrement),
+    (6, 'Kolom kantin_id/order_date dan indeks item pesanan terbaru per kantin', _0006_order_item_kantin_recent),
+    (7, 'Indeks antrian dapur dengan priority menurun', _0007_kitchen_ticket_priority_desc),
+]
+
+
+def recompute_rating_aggregates(conn):
+    """Hitung ulang rating_count/rating_sum semua menu dari tabel rating. Return jumlah menu."""
+    result = conn.execute(text(
+        'UPDATE menu SET '
+        'rating_count = (SELECT count(*) FROM rating WHERE rating.menu_id = menu.id), '
+        'rating_sum = (SELECT coalesce(sum(score), 0) FROM rating WHERE rating.menu_id = menu.id)'
+    ))
+    return result.rowcount
+
+
+def current_version(conn):
+    conn.execute(text(
+        f'CREATE TABLE IF NOT EXISTS {VERSION_TABLE} '
+        '(version INTEGER PRIMARY KEY, description VARCHAR(200), applied_at DATETIME)'
+    ))
+    return conn.execute(text(f'SELECT coalesce(max(version), 0) FROM {VERSION_TABLE}')).scalar()
+
+
+def upgrade():
+    """Jalankan semua migrasi yang belum diterapkan. Return daftar versi yang diterapkan."""
+    applied = []
+    with db.engine.begin() as conn:
+        version = current_version(conn)
+    for migration_version, description, migrate in MIGRATIONS:
+        if migration_version <= version:
+            continue
+        # Satu transaksi per migrasi agar kegagalan tidak meninggalkan skema setengah jadi
+        with db.engine.begin() as conn:
+            migrate(conn)
+            conn.execute(
+                text(f'INSERT INTO {VERSION_TABLE} (version, description, applied_at) VALUES (:v, :d, :t)'),
+                {'v': migration_version, 'd': description, 't': datetime.utcnow()}
+            )
+        applied.append(migration_version)
+    return applied
+
+
+def _hot_queries():
+    # Query yang dijalankan di setiap request dashboard, kelola stok, rating dan checkout.
+    # Nilai parameter tidak penting, hanya bentuk query yang menentukan rencana eksekusi.
+    some_date = datetime(2000, 1, 1)
+    return {
+        'menu per kantin': select(Menu).where(Menu.kantin_id == 1),
+        'kantin milik user': select(Kantin).where(Kantin.user_id == 1),
+        'rating user untuk menu': select(Rating).where(Rating.user_id == 1, Rating.menu_id == 1),
+        'pesanan per user': select(Order).where(Order.user_id == 1),
+        'item per pesanan': select(OrderItem).where(OrderItem.order_id == 1),
+        'item per menu': select(OrderItem).where(OrderItem.menu_id == 1),
+        'pesanan terbaru (admin)': select(Order).where(Order.order_date < some_date)
+            .order_by(Order.order_date.desc(), Order.id.desc()).limit(50),
+        'item pesanan kantin': select(OrderItem, Order).join(Order, Order.id == OrderItem.order_id)
+            .join(Menu, Menu.id == OrderItem.menu_id).where(OrderItem.kantin_id == 1)
+            .order_by(OrderItem.order_date.desc(), OrderItem.id.desc()).limit(50),
+        'pesanan baru kantin': select(Order.id).join(OrderItem, OrderItem.order_id == Order.id)
+            .where(OrderItem.kantin_id == 1, OrderItem.order_date > some_date).distinct(),
+        'rollup penjualan kantin': select(db.func.sum(KantinDailySales.revenue))
+            .where(KantinDailySales.kantin_id == 1),
+        'antrian dapur kantin': select(KitchenTicket.id).where(KitchenTicket.kantin_id == 1,
+                                                              KitchenTicket.status == 'queued')
+            .order_by(KitchenTicket.priority.desc(), KitchenTicket.id).limit(5),
+    }
+
+
+def explain_hot_queries():
+    """EXPLAIN QUERY PLAN untuk setiap hot query.
+
+    Return {nama: (baris_rencana, masalah)}; masalah 'SCAN' jika ada tabel yang dibaca
+    dengan SCAN tanpa memakai indeks, 'SORT' jika query ber-LIMIT diurutkan lewat
+    B-tree sementara (semua baris yang cocok dibaca dulu sebelum dipotong), atau None.
+    """
+    results = {}
+    dialect = db.engine.dialect
+    with db.engine.connect() as conn:
+        for name, stmt in _hot_queries().items():
+            compiled = stmt.compile(dialect=dialect)
+            params = tuple(compiled.params[key] for key in compiled.positiontup)
+            rows = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + compiled.string, params).all()
+            plan = [row[-1] for row in rows]
+            problem = None
+            if any(line.startswith('SCAN ') and ' USING ' not in line for line in plan):
+                problem = 'SCAN'
+            elif ' LIMIT ' in compiled.string and any(line.startswith('USE TEMP B-TREE') for line in plan):
+                problem = 'SORT'
+            results[name] = (plan, problem)
+    return results
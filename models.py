@@ -2,7 +2,7 @@
 
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
+from passwords import passwords
 
 db = SQLAlchemy()
 
@@ -16,11 +16,12 @@ class User(db.Model):
     ratings = db.relationship('Rating', backref='customer', lazy=True)
     # managed_kantin = db.relationship('Kantin', backref='manager', uselist=False, lazy=True) # Ini opsional, bisa juga dihapus jika tidak digunakan eksplisit dari User
 
+    # Hashing dijalankan di thread pool terbatas (passwords.py); keduanya bisa melempar HashingBusy
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = passwords.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return passwords.verify(self.password_hash, password)
 
     def __repr__(self):
         return f'<User {self.username}>'
@@ -33,8 +34,10 @@ class Kantin(db.Model):
     last_order_at = db.Column(db.DateTime, default=datetime.utcnow) 
     
     # PASTIKAN DUA BARIS INI ADA DI models.py milikmu!
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True) # FOREIGN KEY BARU
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True, index=True) # FOREIGN KEY BARU
     manager = db.relationship('User', backref=db.backref('managed_kantin', uselist=False)) # RELASI BARU
+    # Total perkiraan detik kerja tiket dapur yang belum siap, dijaga oleh kitchen.py
+    queue_seconds = db.Column(db.Float, nullable=False, default=0, server_default='0')
 
     def __repr__(self):
         return f'<Kantin {self.name}>'
@@ -45,29 +48,56 @@ class Menu(db.Model):
     description = db.Column(db.Text)
     price = db.Column(db.Float, nullable=False)
     stock = db.Column(db.Integer, default=0)
-    kantin_id = db.Column(db.Integer, db.ForeignKey('kantin.id'), nullable=False)
+    kantin_id = db.Column(db.Integer, db.ForeignKey('kantin.id'), nullable=False, index=True)
     image_url = db.Column(db.String(255), default='https://via.placeholder.com/150')
+    # Agregat rating yang didenormalisasi, dijaga oleh rate_menu()
+    rating_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_sum = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Jumlah stok yang sedang ditahan keranjang (total StockReservation.quantity), dijaga oleh reservations.py
+    reserved = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Waktu siap per porsi (detik) yang dipelajari dari riwayat dapur; None = pakai default
+    prep_seconds = db.Column(db.Float)
+    prep_samples = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    @property
+    def rating_avg(self):
+        if not self.rating_count:
+            return None
+        return self.rating_sum / self.rating_count
 
     def __repr__(self):
         return f'<Menu {self.name}>'
 
 class Order(db.Model):
+    # AUTOINCREMENT: id tidak dipakai ulang walau tabel dikosongkan oleh arsip (archive.py);
+    # analitik dan popularitas membaca pesanan baru berdasarkan id terakhir
+    __table_args__ = {'sqlite_autoincrement': True}
+
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    order_date = db.Column(db.DateTime, default=datetime.utcnow)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    order_date = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     total_price = db.Column(db.Float, nullable=False)
     status = db.Column(db.String(50), default='pending') # 'pending', 'completed', 'cancelled'
+    estimated_ready_at = db.Column(db.DateTime)
     items = db.relationship('OrderItem', backref='order', lazy=True)
 
     def __repr__(self):
         return f'<Order {self.id}>'
 
 class OrderItem(db.Model):
+    # Indeks (kantin_id, order_date, id) melayani halaman item pesanan terbaru kantin
+    # langsung dalam urutan keyset, tanpa join ke menu dan tanpa sort
+    __table_args__ = (db.Index('ix_order_item_kantin_recent', 'kantin_id', 'order_date', 'id'),
+                      {'sqlite_autoincrement': True})
+
     id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
-    menu_id = db.Column(db.Integer, db.ForeignKey('menu.id'), nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False, index=True)
+    menu_id = db.Column(db.Integer, db.ForeignKey('menu.id'), nullable=False, index=True)
     quantity = db.Column(db.Integer, nullable=False)
     price = db.Column(db.Float, nullable=False) # Harga saat item dipesan
+    # Salinan Menu.kantin_id dan Order.order_date saat checkout (denormalisasi untuk indeks di atas)
+    kantin_id = db.Column(db.Integer)
+    order_date = db.Column(db.DateTime)
 
     menu = db.relationship('Menu', backref=db.backref('order_items', lazy=True))
 
@@ -75,6 +105,9 @@ class OrderItem(db.Model):
         return f'<OrderItem {self.id} (Menu: {self.menu_id})>'
 
 class Rating(db.Model):
+    # Satu rating per user per menu; indeks ini juga dipakai upsert di rate_menu()
+    __table_args__ = (db.Index('uq_rating_user_menu', 'user_id', 'menu_id', unique=True),)
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     menu_id = db.Column(db.Integer, db.ForeignKey('menu.id'), nullable=False)
@@ -86,3 +119,144 @@ class Rating(db.Model):
 
     def __repr__(self):
         return f'<Rating {self.id} (Menu: {self.menu_id}, Score: {self.score})>'
+
+class KantinDailySales(db.Model):
+    # Rollup penjualan per kantin per hari per menu, diperbarui saat checkout
+    __tablename__ = 'kantin_daily_sales'
+    __table_args__ = (db.UniqueConstraint('kantin_id', 'day', 'menu_id', name='uq_kantin_daily_sales'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    kantin_id = db.Column(db.Integer, db.ForeignKey('kantin.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    menu_id = db.Column(db.Integer, db.ForeignKey('menu.id'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<KantinDailySales {self.kantin_id} {self.day} (Menu: {self.menu_id})>'
+
+class OrderEvent(db.Model):
+    # Kotak keluar notifikasi pesanan, dibaca oleh broker di setiap worker
+    __tablename__ = 'order_event'
+
+    id = db.Column(db.Integer, primary_key=True)
+    kantin_id = db.Column(db.Integer, nullable=False, index=True)
+    payload = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f'<OrderEvent {self.id} (Kantin: {self.kantin_id})>'
+
+class CartItem(db.Model):
+    # Keranjang server-side (backend 'database'), hanya menyimpan menu_id -> quantity
+    __tablename__ = 'cart_item'
+    __table_args__ = (db.UniqueConstraint('user_id', 'menu_id', name='uq_cart_item_user_menu'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    menu_id = db.Column(db.Integer, nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<CartItem {self.user_id} (Menu: {self.menu_id}, Qty: {self.quantity})>'
+
+class StockReservation(db.Model):
+    # Stok yang ditahan untuk satu item keranjang sampai expires_at
+    __tablename__ = 'stock_reservation'
+    __table_args__ = (db.UniqueConstraint('user_id', 'menu_id', name='uq_stock_reservation_user_menu'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    menu_id = db.Column(db.Integer, db.ForeignKey('menu.id'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<StockReservation {self.user_id} (Menu: {self.menu_id}, Qty: {self.quantity})>'
+
+class KitchenTicket(db.Model):
+    # Satu baris item pesanan di antrian dapur kantin (lihat kitchen.py)
+    __tablename__ = 'kitchen_ticket'
+    # Urutan indeks sama dengan urutan antrian (priority DESC, id) agar tidak perlu sort sementara
+    __table_args__ = (db.Index('ix_kitchen_ticket_next', 'kantin_id', 'status', db.desc('priority'), 'id'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, nullable=False, index=True)
+    kantin_id = db.Column(db.Integer, db.ForeignKey('kantin.id'), nullable=False)
+    menu_id = db.Column(db.Integer, db.ForeignKey('menu.id'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued') # 'queued', 'preparing', 'ready', 'picked_up', 'cancelled'
+    priority = db.Column(db.Integer, nullable=False, default=0)
+    estimated_seconds = db.Column(db.Float, nullable=False)
+    queued_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    ready_at = db.Column(db.DateTime)
+    picked_up_at = db.Column(db.DateTime)
+
+    menu = db.relationship('Menu')
+
+    def __repr__(self):
+        return f'<KitchenTicket {self.id} (Order: {self.order_id}, {self.status})>'
+
+class Job(db.Model):
+    # Antrian job latar belakang yang tahan restart (lihat jobs.py). Job yang
+    # selesai dihapus; yang gagal permanen tetap ada dengan status 'failed'.
+    __table_args__ = (db.Index('ix_job_status_run_at', 'status', 'run_at'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued') # 'queued', 'running', 'failed'
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.name} ({self.status})>'
+
+class OrderArchive(db.Model):
+    # Pesanan lama yang dipindahkan dari tabel order oleh archive.py; id tetap sama
+    __tablename__ = 'order_archive'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    order_date = db.Column(db.DateTime, index=True)
+    total_price = db.Column(db.Float, nullable=False)
+    status = db.Column(db.String(50))
+    items = db.relationship('OrderItemArchive', backref='order', lazy=True)
+    customer = db.relationship('User')
+
+    def __repr__(self):
+        return f'<OrderArchive {self.id}>'
+
+class OrderItemArchive(db.Model):
+    __tablename__ = 'order_item_archive'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('order_archive.id'), nullable=False, index=True)
+    menu_id = db.Column(db.Integer, db.ForeignKey('menu.id'), nullable=False, index=True)
+    quantity = db.Column(db.Integer, nullable=False)
+    price = db.Column(db.Float, nullable=False)
+
+    menu = db.relationship('Menu')
+
+    def __repr__(self):
+        return f'<OrderItemArchive {self.id} (Menu: {self.menu_id})>'
+
+class OrderArchiveSummary(db.Model):
+    # Jumlah dan nilai pesanan yang sudah diarsipkan per hari dan status,
+    # agar total sepanjang masa tidak perlu membaca tabel arsip
+    __tablename__ = 'order_archive_summary'
+    __table_args__ = (db.UniqueConstraint('day', 'status', name='uq_order_archive_summary'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    status = db.Column(db.String(50), nullable=False)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<OrderArchiveSummary {self.day} {self.status}>'
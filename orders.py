@@ -0,0 +1,150 @@
+# orders.py
+
+from datetime import datetime
+from sqlalchemy import case, insert, or_, update
+from models import db, Kantin, Menu, Order, OrderItem, StockReservation
+from catalog import catalog_cache
+from rollup import record_sales
+from events import order_events
+from reservations import reservations
+from jobs import jobs
+from popularity import popularity
+import kitchen
+
+
+class InsufficientStockError(Exception):
+    # Dilempar saat satu atau lebih baris keranjang tidak bisa dipenuhi.
+    # `lines` berisi dict: menu_id, name, requested, available
+    def __init__(self, lines):
+        super().__init__('Stok tidak mencukupi untuk %d item.' % len(lines))
+        self.lines = lines
+
+
+def place_order(user_id, quantities):
+    """Buat Order + OrderItem dan kurangi stok dalam SATU transaksi.
+
+    quantities: {menu_id: quantity}. Semua menu dimuat dengan satu query. Reservasi
+    stok milik user dilepas lebih dulu (dikonversi menjadi pesanan), lalu stok
+    dikurangi lewat UPDATE bersyarat (`stock - reserved >= qty`) sehingga checkout
+    yang berjalan bersamaan tidak pernah membuat stok negatif atau memakai stok
+    yang ditahan keranjang orang lain. Jika ada baris yang gagal, seluruh
+    transaksi di-rollback dan InsufficientStockError dilempar.
+
+    Fungsi ini berakhir di commit sehingga aman diulang oleh run_with_retry.
+    Return (order, after_commit): pemanggil memanggil after_commit() sekali setelah
+    run_with_retry selesai untuk menambal cache dan membangunkan job latar belakang.
+    """
+    quantities = {int(menu_id): int(quantity) for menu_id, quantity in quantities.items() if int(quantity) > 0}
+    if not quantities:
+        raise ValueError('Keranjang kosong.')
+
+    menus = {m.id: m for m in Menu.query.filter(Menu.id.in_(list(quantities))).all()}
+
+    failed = []
+    for menu_id, quantity in quantities.items():
+        if menu_id not in menus:
+            failed.append({'menu_id': menu_id, 'name': f'Menu #{menu_id}', 'requested': quantity, 'available': 0})
+    if failed:
+        raise InsufficientStockError(failed)
+
+    now = datetime.utcnow()
+    try:
+        reservations.convert(user_id, quantities)
+
+        # Satu UPDATE bersyarat untuk semua baris keranjang. RETURNING memberi baris yang
+        # berhasil beserta stok dan tahanan sesudah perubahan, jadi cache ditambal dengan
+        # nilai mutlak dan tidak menghitung dua kali jika entri dimuat ulang sebelum ditambal
+        requested = case(quantities, value=Menu.id)
+        levels = {row.id: row for row in db.session.execute(
+            update(Menu)
+            .where(Menu.id.in_(sorted(quantities)), Menu.stock - Menu.reserved >= requested)
+            .values(stock=Menu.stock - requested)
+            .returning(Menu.id, Menu.stock, Menu.reserved)
+            .execution_options(synchronize_session=False)
+        )}
+        failed = [{'menu_id': menu_id, 'name': menus[menu_id].name, 'requested': quantity}
+                  for menu_id, quantity in quantities.items() if menu_id not in levels]
+
+        if failed:
+            db.session.rollback()
+            failed_ids = [line['menu_id'] for line in failed]
+            rows = {row.id: row for row in db.session.query(Menu.id, Menu.stock, Menu.reserved).filter(Menu.id.in_(failed_ids))}
+            # Setelah rollback reservasi user ini kembali ditahan, jadi tersedia baginya = stok - tahanan orang lain
+            own = dict(db.session.query(StockReservation.menu_id, StockReservation.quantity).filter(
+                StockReservation.user_id == user_id, StockReservation.menu_id.in_(failed_ids)).all())
+            for line in failed:
+                row = rows.get(line['menu_id'])
+                line['available'] = max((row.stock or 0) - row.reserved + own.get(row.id, 0), 0) if row else 0
+            catalog_cache.patch_stock({row.id: row.stock or 0 for row in rows.values()}, absolute=True)
+            raise InsufficientStockError(failed)
+
+        total_price = sum(menus[menu_id].price * quantity for menu_id, quantity in quantities.items())
+        # Pesanan selesai ('completed') setelah semua itemnya diambil dari dapur
+        new_order = Order(user_id=user_id, total_price=total_price, status='pending', order_date=now)
+        db.session.add(new_order)
+        kitchen.enqueue_order(new_order, menus, quantities, now)
+        # Item pesanan dalam satu INSERT executemany, jumlah query tidak tumbuh dengan isi keranjang
+        db.session.execute(insert(OrderItem), [
+            {'order_id': new_order.id, 'menu_id': menu_id, 'quantity': quantity, 'price': menus[menu_id].price,
+             'kantin_id': menus[menu_id].kantin_id, 'order_date': now}
+            for menu_id, quantity in quantities.items()
+        ])
+
+        # Siapkan notifikasi per kantin sebelum commit, selagi data menu masih termuat
+        notifications = {}
+        for menu_id, quantity in quantities.items():
+            menu = menus[menu_id]
+            event = notifications.setdefault(menu.kantin_id, {
+                'order_id': new_order.id, 'order_date': now.isoformat(),
+                'estimated_ready_at': new_order.estimated_ready_at.isoformat(), 'items': []
+            })
+            event['items'].append({'menu_id': menu_id, 'name': menu.name, 'quantity': quantity})
+
+        # Efek samping dijalankan di latar belakang; job di-enqueue dalam transaksi ini
+        # sehingga tidak pernah hilang walaupun pesanan sudah di-commit
+        jobs.enqueue('record_order', {
+            'order_date': now.isoformat(),
+            'lines': [[menus[menu_id].kantin_id, menu_id, quantity, menus[menu_id].price * quantity]
+                      for menu_id, quantity in quantities.items()],
+        })
+        jobs.enqueue('notify_kantins', {'events': list(notifications.items())})
+
+        db.session.commit()
+    except InsufficientStockError:
+        raise
+    except Exception:
+        db.session.rollback()
+        raise
+
+    order_id = new_order.id
+
+    def after_commit():
+        catalog_cache.patch_stock({menu_id: row.stock for menu_id, row in levels.items()}, absolute=True)
+        catalog_cache.patch_reserved({menu_id: row.reserved for menu_id, row in levels.items()}, absolute=True)
+        popularity.record_order(order_id, quantities, now)
+        jobs.kick()
+
+    return new_order, after_commit
+
+
+@jobs.task('record_order')
+def record_order(payload):
+    """Perbarui Kantin.last_order_at dan rollup penjualan harian untuk satu pesanan."""
+    order_date = datetime.fromisoformat(payload['order_date'])
+    kantin_ids = {line[0] for line in payload['lines']}
+    # Job bisa selesai tidak berurutan, last_order_at hanya boleh maju
+    db.session.execute(
+        update(Kantin)
+        .where(Kantin.id.in_(kantin_ids),
+               or_(Kantin.last_order_at.is_(None), Kantin.last_order_at < order_date))
+        .values(last_order_at=order_date)
+        .execution_options(synchronize_session=False)
+    )
+    record_sales(order_date.date(), [tuple(line) for line in payload['lines']])
+
+
+@jobs.task('notify_kantins')
+def notify_kantins(payload):
+    """Kirim notifikasi pesanan baru ke dashboard setiap kantin; event di-commit bersama job."""
+    for kantin_id, event in payload['events']:
+        order_events.publish(kantin_id, event)
@@ -0,0 +1,67 @@
+# pagination.py
+
+from datetime import datetime, timedelta
+from sqlalchemy import and_, or_
+
+
+def encode_cursor(timestamp, row_id):
+    return f'{timestamp.isoformat()}_{row_id}'
+
+
+def decode_cursor(cursor):
+    # Cursor tidak valid dianggap tidak ada (kembali ke halaman pertama)
+    if not cursor:
+        return None
+    try:
+        timestamp, row_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except ValueError:
+        return None
+
+
+def parse_date_range(args):
+    """Ambil filter tanggal ?date_from=YYYY-MM-DD&date_to=YYYY-MM-DD.
+
+    date_to inklusif, jadi dikembalikan sebagai batas atas eksklusif (hari berikutnya).
+    """
+    def _parse(value):
+        try:
+            return datetime.strptime(value, '%Y-%m-%d') if value else None
+        except ValueError:
+            return None
+
+    date_from = _parse(args.get('date_from'))
+    date_to = _parse(args.get('date_to'))
+    if date_to is not None:
+        date_to += timedelta(days=1)
+    return date_from, date_to
+
+
+def keyset_page(query, timestamp_column, id_column, cursor, per_page):
+    """Satu halaman hasil terurut (timestamp, id) menurun memakai keyset pagination.
+
+    Return (rows, has_more); pemanggil membuat cursor berikutnya dari baris terakhir.
+    """
+    position = decode_cursor(cursor)
+    if position is not None:
+        timestamp, row_id = position
+        query = query.filter(or_(
+            timestamp_column < timestamp,
+            and_(timestamp_column == timestamp, id_column < row_id)
+        ))
+    rows = query.order_by(timestamp_column.desc(), id_column.desc()).limit(per_page + 1).all()
+    return rows[:per_page], len(rows) > per_page
+
+
+def keyset_page_across(sources, cursor, per_page):
+    """Seperti keyset_page, tetapi melintasi beberapa sumber berurutan (misalnya tabel
+    aktif lalu tabel arsip). sources: [(query, timestamp_column, id_column), ...],
+    dengan semua baris sumber berikutnya lebih lama dari baris sumber sebelumnya.
+    """
+    rows = []
+    for query, timestamp_column, id_column in sources:
+        page, has_more = keyset_page(query, timestamp_column, id_column, cursor, per_page - len(rows))
+        rows.extend(page)
+        if has_more:
+            return rows, True
+    return rows, False
@@ -0,0 +1,202 @@
+# passwords.py
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+
+class HashingBusy(Exception):
+    # Antrian hashing penuh atau giliran tidak didapat sebelum batas waktu
+    pass
+
+
+def _normalize_method(method):
+    # Werkzeug menulis parameter lengkap di awal hash ("pbkdf2:sha256:600000$..."),
+    # jadi metode dari konfigurasi dilengkapi dulu agar bisa dibandingkan dengan hash tersimpan
+    if method.startswith('pbkdf2'):
+        parts = method.split(':')
+        hash_name = parts[1] if len(parts) > 1 else 'sha256'
+        iterations = parts[2] if len(parts) > 2 else DEFAULT_PBKDF2_ITERATIONS
+        return f'pbkdf2:{hash_name}:{iterations}'
+    if method == 'scrypt':
+        return 'scrypt:32768:8:1'
+    return method
+
+
+class PasswordHasher:
+    """Hashing dan verifikasi password di thread pool terpisah dengan konkurensi terbatas.
+
+    PBKDF2 sengaja mahal; saat ratusan mahasiswa login bersamaan, hashing di thread
+    request menghabiskan semua CPU worker dan /menu serta /checkout ikut tertahan.
+    Di sini paling banyak PASSWORD_HASH_WORKERS hash dihitung bersamaan per proses.
+    Permintaan berikutnya menunggu giliran paling lama PASSWORD_HASH_TIMEOUT detik,
+    dan jika sudah ada PASSWORD_HASH_MAX_QUEUE permintaan yang menunggu, langsung
+    ditolak dengan HashingBusy tanpa menghitung apa pun.
+    """
+
+    def __init__(self, app=None):
+        self.method = _normalize_method('pbkdf2:sha256')
+        self.workers = 2
+        self.max_queue = 64
+        self.timeout = 10.0
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.rehashed = 0
+        self._queue_time = 0.0
+        self._max_queue_time = 0.0
+        self._hash_time = 0.0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.method = _normalize_method(app.config.get('PASSWORD_HASH_METHOD', self.method))
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS', self.workers)
+        self.max_queue = app.config.get('PASSWORD_HASH_MAX_QUEUE', self.max_queue)
+        self.timeout = app.config.get('PASSWORD_HASH_TIMEOUT', self.timeout)
+        app.extensions['passwords'] = self
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """True jika hash tersimpan dibuat dengan parameter selain PASSWORD_HASH_METHOD."""
+        return not pwhash or pwhash.split('$', 1)[0] != self.method
+
+    def upgrade(self, pwhash, password):
+        """Hash baru dengan parameter terkini jika hash tersimpan sudah usang, selain itu None.
+        Hanya dipanggil setelah password terbukti benar."""
+        if not self.needs_rehash(pwhash):
+            return None
+        new_hash = self.hash(password)
+        with self._lock:
+            self.rehashed += 1
+        return new_hash
+
+    def _ensure_executor(self):
+        # Thread pool tidak ikut ke proses anak hasil fork (preload_app gunicorn), jadi dibuat per proses
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hash')
+            self._pid = os.getpid()
+            self._pending = 0
+        return self._executor
+
+    def _run(self, fn, *args):
+        with self._lock:
+            executor = self._ensure_executor()
+            if self._pending >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise HashingBusy('Antrian hashing password penuh.')
+            self._pending += 1
+        submitted = time.perf_counter()
+
+        def task():
+            started = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                finished = time.perf_counter()
+                with self._lock:
+                    self._pending -= 1
+                    self.completed += 1
+                    self._queue_time += started - submitted
+                    self._max_queue_time = max(self._max_queue_time, started - submitted)
+                    self._hash_time += finished - started
+
+        future = executor.submit(task)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            # Task yang belum sempat jalan dibatalkan; yang sudah jalan dibiarkan selesai sendiri
+            with self._lock:
+                if future.cancel():
+                    self._pending -= 1
+                self.rejected += 1
+            raise HashingBusy('Hashing password melewati batas waktu.')
+
+    def stats(self):
+        with self._lock:
+            return {
+                'in_flight': self._pending,
+                'completed_total': self.completed,
+                'rejected_total': self.rejected,
+                'rehashed_total': self.rehashed,
+                'queue_seconds_avg': self._queue_time / self.completed if self.completed else 0.0,
+                'queue_seconds_max': self._max_queue_time,
+                'hash_seconds_avg': self._hash_time / self.completed if self.completed else 0.0,
+            }
+
+
+class LoginThrottle:
+    """Pembatas percobaan login/registrasi per username dan per IP, sebelum hash dihitung.
+
+    Jendela waktu tetap: setiap kunci boleh mencoba paling banyak N kali per
+    LOGIN_THROTTLE_WINDOW detik. Login yang berhasil mengosongkan hitungan
+    username-nya. Hitungan disimpan per proses, jadi dengan beberapa worker batas
+    efektifnya berlipat sebanyak jumlah worker. Batas per IP dibuat longgar karena
+    satu kampus bisa keluar lewat satu alamat NAT.
+    """
+
+    def __init__(self, app=None):
+        self.window = 60
+        self.max_per_username = 10
+        self.max_per_ip = 300
+        self.max_keys = 50000
+        self._lock = threading.Lock()
+        self._windows = {}   # kunci -> [awal jendela, jumlah percobaan]
+        self.throttled = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.window = app.config.get('LOGIN_THROTTLE_WINDOW', self.window)
+        self.max_per_username = app.config.get('LOGIN_MAX_ATTEMPTS_PER_USERNAME', self.max_per_username)
+        self.max_per_ip = app.config.get('LOGIN_MAX_ATTEMPTS_PER_IP', self.max_per_ip)
+        app.extensions['login_throttle'] = self
+
+    def hit(self, username=None, ip=None):
+        """Catat satu percobaan. Return 0 jika boleh lanjut, atau detik sampai boleh mencoba lagi."""
+        now = time.monotonic()
+        keys = []
+        if username:
+            keys.append(('user:' + username.strip().lower(), self.max_per_username))
+        if ip:
+            keys.append(('ip:' + ip, self.max_per_ip))
+        with self._lock:
+            if len(self._windows) > self.max_keys:
+                self._prune(now)
+            retry_after = 0
+            for key, limit in keys:
+                entry = self._windows.get(key)
+                if entry is None or now - entry[0] >= self.window:
+                    entry = self._windows[key] = [now, 0]
+                entry[1] += 1
+                if entry[1] > limit:
+                    retry_after = max(retry_after, int(entry[0] + self.window - now) + 1)
+            if retry_after:
+                self.throttled += 1
+            return retry_after
+
+    def reset(self, username):
+        with self._lock:
+            self._windows.pop('user:' + username.strip().lower(), None)
+
+    def _prune(self, now):
+        for key in [key for key, entry in self._windows.items() if now - entry[0] >= self.window]:
+            del self._windows[key]
+
+    def stats(self):
+        with self._lock:
+            return {'tracked_keys': len(self._windows), 'throttled_total': self.throttled}
+
+
+passwords = PasswordHasher()
+login_throttle = LoginThrottle()
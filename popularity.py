@@ -0,0 +1,234 @@
+# popularity.py
+
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import select
+from models import db, Order, OrderItem
+from catalog import catalog_cache
+
+# Rating digabung sebagai rata-rata Bayes: menu dengan sedikit ulasan ditarik ke
+# RATING_PRIOR_MEAN, jadi satu ulasan bintang 5 tidak langsung melompat ke atas
+RATING_PRIOR_MEAN = 3.0
+RATING_PRIOR_COUNT = 5
+SNAPSHOT_FORMAT = 1
+
+
+def _epoch(moment):
+    # order_date disimpan sebagai UTC naif (datetime.utcnow)
+    return moment.replace(tzinfo=timezone.utc).timestamp()
+
+
+class _Ranking:
+    __slots__ = ('version', 'listing', 'ordered', 'position', 'sorted_at')
+
+    def __init__(self, version, listing, ordered, sorted_at):
+        self.version = version
+        self.listing = listing
+        self.ordered = ordered
+        self.position = {entry['id']: index for index, entry in enumerate(ordered)}
+        self.sorted_at = sorted_at
+
+
+class PopularityIndex:
+    """Peringkat "populer sekarang": penjualan dengan peluruhan eksponensial + rating.
+
+    Penjualan setiap menu disimpan sebagai satu akumulator qty * 2^((t - origin) / paruh_waktu),
+    jadi pesanan baru cukup ditambahkan tanpa menyentuh menu lain dan nilai terkini
+    didapat dengan satu perkalian faktor peluruhan. Pesanan di worker ini dicatat
+    langsung saat checkout; pesanan dari worker lain ditarik secara inkremental dari
+    id pesanan terakhir setiap POPULARITY_REFRESH_INTERVAL detik. Rating diambil dari
+    agregat rating entri katalog. Daftar terurut disimpan dan dipakai ulang sampai
+    penjualan atau katalog berubah. Akumulator disimpan berkala ke disk agar worker
+    baru tidak perlu membaca ulang riwayat pesanan.
+    """
+
+    def __init__(self, app=None):
+        self.half_life_hours = 6.0
+        self.rating_weight = 2.0
+        self.window_days = 14
+        self.refresh_interval = 30
+        self.resort_interval = 1.0
+        self.snapshot_path = None
+        self.snapshot_interval = 300
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._origin = 0.0          # epoch acuan akumulator
+        self._sales = {}            # menu_id -> akumulator penjualan
+        self._last_order_id = 0
+        self._applied = set()       # id pesanan > _last_order_id yang sudah dicatat saat checkout
+        self._version = 0
+        self._ranking = None
+        self._refreshed_at = 0.0
+        self._snapshot_at = 0.0
+        self.last_refresh_seconds = 0.0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.half_life_hours = app.config.get('POPULARITY_HALF_LIFE_HOURS', self.half_life_hours)
+        self.rating_weight = app.config.get('POPULARITY_RATING_WEIGHT', self.rating_weight)
+        self.window_days = app.config.get('POPULARITY_WINDOW_DAYS', self.window_days)
+        self.refresh_interval = app.config.get('POPULARITY_REFRESH_INTERVAL', self.refresh_interval)
+        self.snapshot_interval = app.config.get('POPULARITY_SNAPSHOT_INTERVAL', self.snapshot_interval)
+        self.snapshot_path = (app.config.get('POPULARITY_SNAPSHOT_PATH')
+                              or os.path.join(app.instance_path, 'popularity.json'))
+        app.extensions['popularity'] = self
+
+    @property
+    def _half_life_seconds(self):
+        return self.half_life_hours * 3600
+
+    def _add(self, menu_id, quantity, ts):
+        self._sales[menu_id] = self._sales.get(menu_id, 0.0) + quantity * 2 ** ((ts - self._origin) / self._half_life_seconds)
+
+    def _rebase(self, now):
+        # Eksponen dijaga kecil agar akumulator tidak meluap
+        if (now - self._origin) / self._half_life_seconds > 64:
+            factor = 2 ** ((self._origin - now) / self._half_life_seconds)
+            self._sales = {menu_id: value * factor for menu_id, value in self._sales.items() if value * factor > 1e-9}
+            self._origin = now
+
+    def record_order(self, order_id, quantities, order_date):
+        """Catat pesanan yang baru di-commit di worker ini (dipanggil dari place_order)."""
+        with self._lock:
+            if not self._loaded or order_id <= self._last_order_id or order_id in self._applied:
+                return
+            ts = _epoch(order_date)
+            self._rebase(ts)
+            for menu_id, quantity in quantities.items():
+                self._add(menu_id, quantity, ts)
+            self._applied.add(order_id)
+            self._version += 1
+
+    def refresh(self, force=False):
+        """Tarik pesanan baru sejak refresh terakhir. Return jumlah item pesanan yang ditambahkan."""
+        with self._lock:
+            if self._loaded and not force and time.monotonic() - self._refreshed_at < self.refresh_interval:
+                return 0
+            started = time.perf_counter()
+            if not self._loaded:
+                self._origin = time.time()
+                self._load_snapshot()
+                if not self._last_order_id:
+                    # Tanpa snapshot: cukup pesanan beberapa hari terakhir, sisanya sudah meluruh habis
+                    since = datetime.utcnow() - timedelta(days=self.window_days)
+                    self._last_order_id = (db.session.execute(
+                        select(db.func.max(Order.id)).where(Order.order_date < since)).scalar() or 0)
+                self._loaded = True
+            added = self._pull()
+            self._rebase(time.time())
+            # Peluruhan mengubah urutan relatif terhadap rating walaupun tidak ada penjualan baru
+            self._version += 1
+            self._refreshed_at = time.monotonic()
+            self.last_refresh_seconds = time.perf_counter() - started
+            if time.monotonic() - self._snapshot_at >= self.snapshot_interval:
+                self.save_snapshot()
+            return added
+
+    def _pull(self):
+        rows = db.session.execute(
+            select(OrderItem.order_id, OrderItem.menu_id, OrderItem.quantity, Order.order_date)
+            .join(Order, Order.id == OrderItem.order_id)
+            .where(OrderItem.order_id > self._last_order_id)
+        ).all()
+        added = 0
+        for order_id, menu_id, quantity, order_date in rows:
+            if order_id in self._applied:
+                continue
+            self._add(menu_id, quantity, _epoch(order_date))
+            added += 1
+        if rows:
+            self._last_order_id = max(row.order_id for row in rows)
+        self._applied = {order_id for order_id in self._applied if order_id > self._last_order_id}
+        return added
+
+    def _scores(self, listing):
+        decay = 2 ** ((self._origin - time.time()) / self._half_life_seconds)
+        scores = {}
+        for entry in listing:
+            rating = ((entry['rating_sum'] + RATING_PRIOR_COUNT * RATING_PRIOR_MEAN)
+                      / (entry['rating_count'] + RATING_PRIOR_COUNT))
+            scores[entry['id']] = (self._sales.get(entry['id'], 0.0) * decay
+                                   + self.rating_weight * (rating - RATING_PRIOR_MEAN))
+        return scores
+
+    def _current_ranking(self):
+        listing = catalog_cache.all_menus()
+        self.refresh()
+        with self._lock:
+            ranking = self._ranking
+            # Urut ulang jika isi katalog berubah (menu baru, rating) atau penjualan berubah,
+            # yang terakhir paling sering sekali per resort_interval
+            if ranking is not None and ranking.listing is listing and (
+                    ranking.version == self._version or time.monotonic() - ranking.sorted_at < self.resort_interval):
+                return ranking
+            scores = self._scores(listing)
+            ordered = sorted(listing, key=lambda entry: (-scores[entry['id']], entry['id']))
+            self._ranking = _Ranking(self._version, listing, ordered, time.monotonic())
+            return self._ranking
+
+    def ranked(self, menus=None):
+        """Menu dari yang terpopuler. Tanpa argumen: seluruh katalog (daftar terurut yang di-cache);
+        dengan menus (mis. hasil pencarian): menus diurutkan ulang menurut peringkat yang sama."""
+        ranking = self._current_ranking()
+        if menus is None or menus is ranking.listing:
+            return ranking.ordered
+        last = len(ranking.position)
+        return sorted(menus, key=lambda entry: ranking.position.get(entry['id'], last))
+
+    def save_snapshot(self):
+        if not self.snapshot_path:
+            return False
+        with self._lock:
+            # Snapshot hanya konsisten jika semua pesanan yang tercatat ada di bawah _last_order_id
+            if not self._loaded or self._applied:
+                return False
+            data = {'format': SNAPSHOT_FORMAT, 'half_life_hours': self.half_life_hours, 'origin': self._origin,
+                    'last_order_id': self._last_order_id, 'saved_at': time.time(),
+                    'sales': {str(menu_id): value for menu_id, value in self._sales.items()}}
+            self._snapshot_at = time.monotonic()
+        os.makedirs(os.path.dirname(self.snapshot_path) or '.', exist_ok=True)
+        temporary = f'{self.snapshot_path}.{os.getpid()}.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(data, f)
+        os.replace(temporary, self.snapshot_path)
+        return True
+
+    def _load_snapshot(self):
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return False
+        try:
+            with open(self.snapshot_path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if data.get('format') != SNAPSHOT_FORMAT or data.get('half_life_hours') != self.half_life_hours:
+            return False
+        # Snapshot dari database lain (atau database yang dibuat ulang) diabaikan
+        max_order_id = db.session.execute(select(db.func.max(Order.id))).scalar() or 0
+        if data['last_order_id'] > max_order_id:
+            return False
+        self._origin = data['origin']
+        self._last_order_id = data['last_order_id']
+        self._sales = {int(menu_id): value for menu_id, value in data['sales'].items()}
+        self._snapshot_at = time.monotonic()
+        return True
+
+    def reset(self):
+        with self._lock:
+            self._loaded = False
+            self._sales = {}
+            self._last_order_id = 0
+            self._applied = set()
+            self._ranking = None
+
+    def stats(self):
+        with self._lock:
+            return {'menus': len(self._sales), 'last_order_id': self._last_order_id,
+                    'last_refresh_seconds': self.last_refresh_seconds}
+
+
+popularity = PopularityIndex()
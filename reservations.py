@@ -0,0 +1,171 @@
+# reservations.py
+
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import case, delete, select, update
+from database import upsert
+from models import db, Menu, StockReservation
+from catalog import catalog_cache
+
+
+class ReservationLedger:
+    """Buku reservasi stok antara tambah-ke-keranjang dan checkout.
+
+    Setiap baris StockReservation menahan sejumlah stok untuk satu user dan satu
+    menu sampai expires_at. Menu.reserved selalu sama dengan total quantity
+    reservasi menu itu karena keduanya diubah dalam transaksi yang sama, jadi stok
+    tersedia (stock - reserved) bisa dibaca tanpa query tambahan. Reservasi
+    kedaluwarsa dilepas oleh satu thread penyapu per worker.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.ttl = 600
+        self.sweep_interval = 30
+        self._lock = threading.Lock()
+        self._sweeper = None
+        self.released = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.ttl = app.config.get('RESERVATION_TTL', self.ttl)
+        self.sweep_interval = app.config.get('RESERVATION_SWEEP_INTERVAL', self.sweep_interval)
+        app.extensions['reservations'] = self
+
+    def reserve(self, user_id, quantities):
+        """Tambah reservasi user: quantities {menu_id: jumlah_tambahan}.
+
+        Return daftar baris gagal (menu_id, name, requested, available); kosong jika
+        berhasil. Jika ada yang gagal tidak ada reservasi yang berubah.
+        """
+        failed, levels = self._hold(user_id, quantities)
+        if failed:
+            return failed
+        db.session.commit()
+        catalog_cache.patch_reserved(levels, absolute=True)
+        return []
+
+    def set_quantity(self, user_id, menu_id, quantity):
+        """Ganti reservasi user untuk satu menu menjadi `quantity` (0 = lepas). Return seperti reserve()."""
+        _, levels = self._release(StockReservation.user_id == user_id, StockReservation.menu_id == menu_id)
+        if quantity > 0:
+            failed, held = self._hold(user_id, {menu_id: quantity})
+            if failed:
+                return failed
+            levels.update(held)
+        db.session.commit()
+        catalog_cache.patch_reserved(levels, absolute=True)
+        return []
+
+    def convert(self, user_id, menu_ids):
+        """Lepas reservasi user untuk menu yang di-checkout, di dalam transaksi checkout (tanpa commit).
+
+        Return {menu_id: jumlah_dilepas}; pemanggil menambal cache setelah commit.
+        """
+        released, _ = self._release(StockReservation.user_id == user_id, StockReservation.menu_id.in_(list(menu_ids)))
+
+    def remove_menu(self, menu_id):
+        # Menu dihapus: buang reservasinya dalam transaksi penghapusan
+        db.session.execute(delete(StockReservation).where(StockReservation.menu_id == menu_id))
+
+    def sweep(self):
+        """Lepas semua reservasi kedaluwarsa. Return jumlah porsi yang dikembalikan."""
+        released, levels = self._release(StockReservation.expires_at <= datetime.utcnow())
+        db.session.commit()
+        if levels:
+            catalog_cache.patch_reserved(levels, absolute=True)
+        total = sum(released.values())
+        self.released += total
+        return total
+
+    def _hold(self, user_id, quantities):
+        quantities = {menu_id: quantity for menu_id, quantity in quantities.items() if quantity > 0}
+        if not quantities:
+            return [], {}
+        self.ensure_sweeper()
+
+        # UPDATE bersyarat: hanya menahan jika stok yang belum ditahan pihak lain mencukupi.
+        # RETURNING memberi tahanan sesudah perubahan agar cache ditambal dengan nilai mutlak
+        requested = case(quantities, value=Menu.id)
+        levels = dict(db.session.execute(
+            update(Menu)
+            .where(Menu.id.in_(sorted(quantities)), db.func.coalesce(Menu.stock, 0) - Menu.reserved >= requested)
+            .values(reserved=Menu.reserved + requested)
+            .returning(Menu.id, Menu.reserved)
+            .execution_options(synchronize_session=False)
+        ).all())
+        if len(levels) != len(quantities):
+            db.session.rollback()
+            rows = {row.id: row for row in db.session.execute(
+                select(Menu.id, Menu.name, Menu.stock, Menu.reserved).where(Menu.id.in_(list(quantities)))
+            )}
+            failed = []
+            for menu_id, quantity in quantities.items():
+                row = rows.get(menu_id)
+                available = max((row.stock or 0) - row.reserved, 0) if row else 0
+                if available < quantity:
+                    failed.append({'menu_id': menu_id, 'name': row.name if row else f'Menu #{menu_id}',
+                                   'requested': quantity, 'available': available})
+            return failed, {}
+
+        expires_at = datetime.utcnow() + timedelta(seconds=self.ttl)
+        stmt = upsert(StockReservation)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['user_id', 'menu_id'],
+            set_={'quantity': StockReservation.quantity + stmt.excluded.quantity,
+                  'expires_at': stmt.excluded.expires_at}
+        )
+        db.session.execute(stmt, [
+            {'user_id': user_id, 'menu_id': menu_id, 'quantity': quantity, 'expires_at': expires_at}
+            for menu_id, quantity in quantities.items()
+        ])
+        return [], levels
+
+    def _release(self, *criteria):
+        # DELETE ... RETURNING memberi jumlah yang benar-benar dihapus, jadi dua
+        # penyapu di worker berbeda tidak pernah mengurangi Menu.reserved dua kali.
+        # Return ({menu_id: jumlah_dilepas}, {menu_id: reserved_sesudahnya})
+        rows = db.session.execute(
+            delete(StockReservation).where(*criteria)
+            .returning(StockReservation.menu_id, StockReservation.quantity)
+            .execution_options(synchronize_session=False)
+        ).all()
+        released = {}
+        for menu_id, quantity in rows:
+            released[menu_id] = released.get(menu_id, 0) + quantity
+        levels = {}
+        if released:
+            quantity = case(released, value=Menu.id)
+            levels = dict(db.session.execute(
+                update(Menu)
+                .where(Menu.id.in_(sorted(released)))
+                .values(reserved=case((Menu.reserved > quantity, Menu.reserved - quantity), else_=0))
+                .returning(Menu.id, Menu.reserved)
+                .execution_options(synchronize_session=False)
+            ).all())
+        return released, levels
+
+    def ensure_sweeper(self):
+        with self._lock:
+            if self._sweeper is not None and self._sweeper.is_alive():
+                return
+            self._sweeper = threading.Thread(target=self._sweep_loop, name='reservation-sweeper', daemon=True)
+            self._sweeper.start()
+
+    def _sweep_loop(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                with self.app.app_context():
+                    self.sweep()
+            except Exception:
+                self.app.logger.exception('Gagal melepas reservasi stok kedaluwarsa')
+
+    def stats(self):
+        return {'released': self.released}
+
+
+reservations = ReservationLedger()
@@ -0,0 +1,58 @@
+# rollup.py
+
+from sqlalchemy import delete, insert, select, union_all
+from database import upsert
+from models import db, KantinDailySales, Menu, Order, OrderItem, OrderArchive, OrderItemArchive
+
+
+def record_sales(day, lines):
+    """Tambahkan penjualan ke rollup harian, dalam transaksi checkout yang sedang berjalan.
+
+    lines: iterable (kantin_id, menu_id, quantity, revenue).
+    """
+    rows = [{'kantin_id': kantin_id, 'day': day, 'menu_id': menu_id, 'quantity': quantity, 'revenue': revenue}
+            for kantin_id, menu_id, quantity, revenue in lines]
+    if not rows:
+        return
+    stmt = upsert(KantinDailySales)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['kantin_id', 'day', 'menu_id'],
+        set_={'quantity': KantinDailySales.quantity + stmt.excluded.quantity,
+              'revenue': KantinDailySales.revenue + stmt.excluded.revenue}
+    )
+    db.session.execute(stmt, rows)
+
+
+def rebuild_rollup():
+    """Hitung ulang seluruh rollup dari OrderItem dan arsipnya. Return jumlah baris rollup."""
+    items = union_all(
+        select(Order.order_date, OrderItem.menu_id, OrderItem.quantity, OrderItem.price)
+        .join(Order, Order.id == OrderItem.order_id),
+        select(OrderArchive.order_date, OrderItemArchive.menu_id, OrderItemArchive.quantity, OrderItemArchive.price)
+        .join(OrderArchive, OrderArchive.id == OrderItemArchive.order_id),
+    ).subquery()
+    day = db.func.date(items.c.order_date)
+    source = (
+        select(Menu.kantin_id, day, items.c.menu_id,
+               db.func.sum(items.c.quantity), db.func.sum(items.c.quantity * items.c.price))
+        .select_from(items)
+        .join(Menu, Menu.id == items.c.menu_id)
+        .group_by(Menu.kantin_id, day, items.c.menu_id)
+    )
+    db.session.execute(delete(KantinDailySales))
+    result = db.session.execute(
+        insert(KantinDailySales).from_select(
+            ['kantin_id', 'day', 'menu_id', 'quantity', 'revenue'], source
+        )
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def kantin_totals(kantin_id):
+    """(pendapatan, jumlah item terjual) sepanjang waktu untuk satu kantin."""
+    revenue, items_sold = db.session.query(
+        db.func.coalesce(db.func.sum(KantinDailySales.revenue), 0),
+        db.func.coalesce(db.func.sum(KantinDailySales.quantity), 0)
+    ).filter(KantinDailySales.kantin_id == kantin_id).one()
+    return revenue, items_sold
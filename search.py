@@ -0,0 +1,115 @@
+# search.py
+
+import re
+from sqlalchemy import text
+from models import db, Kantin, Menu
+
+# Indeks pencarian menu berbasis SQLite FTS5. rowid tabel virtual = Menu.id,
+# sehingga hasil pencarian bisa langsung dipetakan kembali ke tabel menu.
+INDEX_TABLE = 'menu_search'
+
+# Bobot bm25 per kolom (name, description, kantin_name): nama menu paling penting
+_RANK = f'bm25({INDEX_TABLE}, 10.0, 2.0, 4.0)'
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def is_supported():
+    return db.engine.dialect.name == 'sqlite'
+
+
+def create_index():
+    """Buat tabel FTS5 jika belum ada. Return True jika tabel baru dibuat."""
+    if not is_supported():
+        return False
+    with db.engine.begin() as conn:
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {'name': INDEX_TABLE}
+        ).first()
+        if exists:
+            return False
+        conn.execute(text(
+            f"CREATE VIRTUAL TABLE {INDEX_TABLE} USING fts5("
+            "name, description, kantin_name, "
+            "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        ))
+    return True
+
+
+def index_menu(menu, kantin_name=None):
+    # Dipanggil di dalam transaksi yang sama dengan penulisan Menu,
+    # jadi indeks ikut di-commit atau di-rollback bersama datanya.
+    if not is_supported():
+        return
+    if kantin_name is None:
+        kantin_name = db.session.query(Kantin.name).filter(Kantin.id == menu.kantin_id).scalar()
+    db.session.execute(text(f'DELETE FROM {INDEX_TABLE} WHERE rowid = :id'), {'id': menu.id})
+    db.session.execute(
+        text(f'INSERT INTO {INDEX_TABLE} (rowid, name, description, kantin_name) '
+             'VALUES (:id, :name, :description, :kantin_name)'),
+        {'id': menu.id, 'name': menu.name, 'description': menu.description or '', 'kantin_name': kantin_name or ''}
+    )
+
+
+def index_new_menus(menus, kantin_name):
+    # Versi massal index_menu untuk menu yang baru di-insert (belum ada di indeks).
+    # menus: dict dengan id, name, description.
+    if not is_supported() or not menus:
+        return
+    db.session.execute(
+        text(f'INSERT INTO {INDEX_TABLE} (rowid, name, description, kantin_name) '
+             'VALUES (:id, :name, :description, :kantin_name)'),
+        [{'id': menu['id'], 'name': menu['name'], 'description': menu['description'] or '',
+          'kantin_name': kantin_name or ''} for menu in menus]
+    )
+
+
+def remove_menu(menu_id):
+    if not is_supported():
+        return
+    db.session.execute(text(f'DELETE FROM {INDEX_TABLE} WHERE rowid = :id'), {'id': menu_id})
+
+
+def rebuild_index():
+    """Isi ulang seluruh indeks dari tabel menu dan kantin. Return jumlah menu terindeks."""
+    if not is_supported():
+        return 0
+    create_index()
+    db.session.execute(text(f'DELETE FROM {INDEX_TABLE}'))
+    result = db.session.execute(text(
+        f'INSERT INTO {INDEX_TABLE} (rowid, name, description, kantin_name) '
+        "SELECT menu.id, menu.name, coalesce(menu.description, ''), coalesce(kantin.name, '') "
+        'FROM menu LEFT JOIN kantin ON kantin.id = menu.kantin_id'
+    ))
+    db.session.execute(text(f"INSERT INTO {INDEX_TABLE} ({INDEX_TABLE}) VALUES ('optimize')"))
+    db.session.commit()
+    return result.rowcount
+
+
+def _match_expression(query):
+    # Setiap kata menjadi prefix query ("nas"* "gor"*), di-quote agar
+    # karakter khusus FTS5 dari input pengguna tidak ditafsirkan sebagai operator.
+    tokens = _TOKEN_RE.findall(query)
+    return ' '.join('"%s"*' % token.replace('"', '""') for token in tokens)
+
+
+def search_menu_ids(query, limit=200):
+    """Cari menu, return daftar Menu.id terurut berdasarkan relevansi."""
+    match = _match_expression(query or '')
+    if not match:
+        return []
+
+    if not is_supported():
+        pattern = f'%{query}%'
+        rows = db.session.query(Menu.id).filter(
+            Menu.name.ilike(pattern) | Menu.description.ilike(pattern)
+        ).limit(limit).all()
+        return [row[0] for row in rows]
+
+    rows = db.session.execute(
+        text(f'SELECT rowid FROM {INDEX_TABLE} WHERE {INDEX_TABLE} MATCH :match '
+             f'ORDER BY {_RANK} LIMIT :limit'),
+        {'match': match, 'limit': limit}
+    )
+    return [row[0] for row in rows]
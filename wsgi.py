@@ -0,0 +1,10 @@
+# wsgi.py
+# Entry point produksi: gunicorn -c gunicorn.conf.py wsgi:app
+
+from app import create_app, create_tables
+
+app = create_app()
+
+# Dengan preload_app (gunicorn.conf.py) modul ini diimpor sekali di proses master
+# sebelum fork, jadi pembuatan skema, migrasi dan data dummy tidak diulang per worker.
+create_tables(app)